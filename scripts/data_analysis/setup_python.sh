@@ -12,10 +12,13 @@ python3 -m venv .venv
 python3 -m pip install numpy
 python3 -m pip install pyyaml
 python3 -m pip install XlsxWriter
+python3 -m pip install openpyxl
 python3 -m pip install plotly
 python3 -m pip install kaleido
 python3 -m pip install pandas
+python3 -m pip install scipy
 python3 -m pip install matplotlib
+python3 -m pip install pytest
 
 # Update the PYTHONPATH to use the latest bar_chart_race repo
 export PYTHONPATH="$BAR_CHART_RACE:$PYTHONPATH"
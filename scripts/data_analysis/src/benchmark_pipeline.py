@@ -0,0 +1,240 @@
+import os
+import sys
+import time
+import json
+import shutil
+import platform
+import argparse
+import tempfile
+import importlib.util
+
+import race_model
+import race_analysis
+import synthetic_race
+
+DEFAULT_BASELINE = os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                                "..", "benchmarks", "baseline.json")
+
+##########
+# Stages #
+##########
+def stage_parse(context):
+  context["race"] = race_model.load_race(context["yaml_file"])
+
+def stage_timeline(context):
+  context["analysis"] = race_analysis.create_analysis(context["race"])
+  race_analysis.analyse_timeline(context["race"], context["analysis"])
+
+def stage_driver_stats(context):
+  race_analysis.analyse_drivers(context["race"], context["analysis"])
+
+def stage_figures(context):
+  import generate_plots
+
+  context["figures"] = generate_plots.create_total_figures(context["analysis"]) + \
+                       generate_plots.create_driver_figures(context["analysis"])
+
+def stage_html(context):
+  import generate_plots
+
+  generate_plots.generate_html_reports(analysis      = context["analysis"],
+                                       output_folder = context["output_folder"])
+
+def stage_excel(context):
+  import generate_excel
+
+  generate_excel.generate_excel(analysis = context["analysis"],
+                                filename = os.path.join(context["output_folder"],
+                                                        "karting_results.xlsx"))
+
+def stage_video(context):
+  import generate_plots
+
+  generate_plots.generate_bar_chart_race(analysis      = context["analysis"],
+                                         output_folder = context["output_folder"])
+
+def html_available():
+  return shutil.which("asciidoctor") is not None
+
+def video_available():
+  return shutil.which("ffmpeg") is not None and \
+         importlib.util.find_spec("bar_chart_race") is not None
+
+# The stages in pipeline order with the check if the external tools they need
+# are installed
+STAGES = {"parse"        : (stage_parse,        None),
+          "timeline"     : (stage_timeline,     None),
+          "driver stats" : (stage_driver_stats, None),
+          "figures"      : (stage_figures,      None),
+          "HTML"         : (stage_html,         html_available),
+          "Excel"        : (stage_excel,        None),
+          "video"        : (stage_video,        video_available)}
+
+# The stages that have to run before a stage can run
+STAGE_DEPENDENCIES = {"parse"        : [],
+                      "timeline"     : ["parse"],
+                      "driver stats" : ["parse", "timeline"],
+                      "figures"      : ["parse", "timeline", "driver stats"],
+                      "HTML"         : ["parse", "timeline", "driver stats"],
+                      "Excel"        : ["parse", "timeline", "driver stats"],
+                      "video"        : ["parse", "timeline"]}
+
+##############
+# Benchmarks #
+##############
+def benchmark_name(number_of_teams, duration):
+  return f"{number_of_teams}_teams_{duration:g}h"
+
+def run_benchmark(number_of_teams,
+                  duration,
+                  stages,
+                  work_folder,
+                  seed = 0):
+  race = synthetic_race.generate_race(number_of_teams = number_of_teams,
+                                      race_duration   = duration * 3600,
+                                      pit_stops       = max(1, int(duration * 2)),
+                                      stopped_teams   = number_of_teams // 10,
+                                      seed            = seed)
+
+  context = {"yaml_file"     : os.path.join(work_folder, "karting_results.yaml"),
+             "output_folder" : os.path.join(work_folder, "output")}
+
+  synthetic_race.write_race(race     = race,
+                            filename = context["yaml_file"])
+  os.makedirs(context["output_folder"], exist_ok = True)
+
+  # Run the stages in pipeline order and only time the requested ones
+  stages_to_run = set(stages)
+  for stage in stages:
+    stages_to_run.update(STAGE_DEPENDENCIES[stage])
+
+  timings = {}
+  for stage, (stage_function, is_available) in STAGES.items():
+    if stage not in stages_to_run:
+      continue
+
+    if is_available is not None and not is_available():
+      print(f"  {stage:<12} : skipped because the needed tools are not installed")
+      continue
+
+    start_time = time.perf_counter()
+    stage_function(context)
+    wall_time = time.perf_counter() - start_time
+
+    if stage in stages:
+      timings[stage] = wall_time
+      print(f"  {stage:<12} : {wall_time:9.3f} sec")
+
+  return {"laps"    : int(sum(len(team.lap_times) for team in race.teams)),
+          "timings" : timings}
+
+def compare_with_baseline(results, baseline, tolerance):
+  regressions = []
+  for name, result in results.items():
+    if name not in baseline["benchmarks"]:
+      continue
+
+    baseline_timings = baseline["benchmarks"][name]["timings"]
+    for stage, wall_time in result["timings"].items():
+      if stage not in baseline_timings:
+        continue
+
+      ratio = wall_time / max(baseline_timings[stage], 1e-9)
+      if ratio > tolerance:
+        regressions.append((name, stage, baseline_timings[stage], wall_time, ratio))
+
+  return regressions
+
+def load_baseline(filename):
+  if not os.path.exists(filename):
+    return {"benchmarks" : {}}
+
+  with open(filename, 'r') as baseline_file:
+    return json.load(baseline_file)
+
+def save_baseline(filename, baseline, results):
+  baseline["machine"] = {"python"    : platform.python_version(),
+                         "platform"  : platform.platform(),
+                         "processor" : platform.processor()}
+
+  for name, result in results.items():
+    baseline["benchmarks"].setdefault(name, {"laps" : result["laps"], "timings" : {}})
+    baseline["benchmarks"][name]["laps"] = result["laps"]
+    baseline["benchmarks"][name]["timings"].update(result["timings"])
+
+  os.makedirs(os.path.dirname(os.path.abspath(filename)), exist_ok = True)
+  with open(filename, 'w') as baseline_file:
+    json.dump(baseline, baseline_file, indent = 2, sort_keys = True)
+    baseline_file.write("\n")
+
+################
+# Main program #
+################
+if __name__ == "__main__":
+  parser = argparse.ArgumentParser(description = "Benchmark every stage of the karting " +
+                                                 "analysis on synthetic races.")
+
+  parser.add_argument("-t", "--teams",
+                      type    = int,
+                      nargs   = "+",
+                      default = [10, 40, 100],
+                      help    = "The numbers of teams to benchmark")
+  parser.add_argument("-d", "--durations",
+                      type    = float,
+                      nargs   = "+",
+                      default = [2, 12, 24],
+                      help    = "The race durations in hours to benchmark")
+  parser.add_argument("--stages",
+                      nargs   = "+",
+                      choices = list(STAGES.keys()),
+                      default = list(STAGES.keys()),
+                      help    = "The stages to time")
+  parser.add_argument("-b", "--baseline",
+                      default = DEFAULT_BASELINE,
+                      help    = "The JSON file with the stored baseline timings")
+  parser.add_argument("--update_baseline",
+                      action = "store_true",
+                      help   = "Store the measured timings as the new baseline")
+  parser.add_argument("--tolerance",
+                      type    = float,
+                      default = 1.5,
+                      help    = "A stage is a regression when it is this many times " +
+                                "slower than the baseline")
+  parser.add_argument("-s", "--seed",
+                      type    = int,
+                      default = 0,
+                      help    = "The seed of the synthetic races")
+
+  args = parser.parse_args()
+
+  # Keep the stages in pipeline order
+  stages = [stage for stage in STAGES if stage in args.stages]
+
+  results = {}
+  for number_of_teams in args.teams:
+    for duration in args.durations:
+      name = benchmark_name(number_of_teams, duration)
+      print(f"{name}:")
+
+      with tempfile.TemporaryDirectory() as work_folder:
+        results[name] = run_benchmark(number_of_teams = number_of_teams,
+                                      duration        = duration,
+                                      stages          = stages,
+                                      work_folder     = work_folder,
+                                      seed            = args.seed)
+
+  baseline = load_baseline(args.baseline)
+
+  regressions = compare_with_baseline(results   = results,
+                                      baseline  = baseline,
+                                      tolerance = args.tolerance)
+  for name, stage, baseline_time, wall_time, ratio in regressions:
+    print(f"REGRESSION {name} {stage}: {baseline_time:.3f} sec -> {wall_time:.3f} sec ({ratio:.2f}x)")
+
+  if args.update_baseline:
+    save_baseline(filename = args.baseline,
+                  baseline = baseline,
+                  results  = results)
+
+  if regressions and not args.update_baseline:
+    sys.exit(1)
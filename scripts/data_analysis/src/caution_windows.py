@@ -0,0 +1,120 @@
+import numpy as np
+
+import argparse
+
+import race_model
+import lap_flags
+
+# A lap is slowed down when it is this much slower than the rolling median of
+# its stint. The window is wide so the median doesn't follow the slow laps of
+# a long caution
+CAUTION_SLOWDOWN    = 0.1
+CAUTION_WINDOW_SIZE = 41
+
+# A caution window is a period where at least this share of the teams on track
+# is slowed down at the same time, with at least MIN_CAUTION_TEAMS teams
+CAUTION_SHARE     = 0.5
+MIN_CAUTION_TEAMS = 2
+
+# The time resolution of the sweep in seconds
+CAUTION_RESOLUTION = 1.0
+
+# The pit, in and out laps are slow for other reasons than a caution
+PIT_FLAGS = lap_flags.LAP_PIT | lap_flags.LAP_IN | lap_flags.LAP_OUT
+
+####################
+# Helper functions #
+####################
+def lap_intervals(race):
+  # The start and end time of every lap of all the teams in one array
+  lap_ends   = np.concatenate([race_model.cumulative_times(team) for team in race.teams])
+  lap_starts = lap_ends - np.concatenate([team.lap_times for team in race.teams])
+
+  return lap_starts, lap_ends
+
+def count_laps_in_progress(first_bins, end_bins, number_of_bins):
+  # The number of laps in progress in every time bin. Every lap adds one at its
+  # first bin and removes one at its end bin, so this is linear in the laps
+  changes = np.bincount(first_bins, minlength = number_of_bins + 1) - \
+            np.bincount(end_bins, minlength = number_of_bins + 1)
+
+  return np.cumsum(changes)[:number_of_bins]
+
+###################
+# Caution windows #
+###################
+def find_caution_windows(race, team_lap_flags):
+  # Sweep the merged timeline of all the teams and return the start and end
+  # time of every period where a large share of the field is slowed down
+  lap_times, _, _, _, medians, _ = lap_flags.rolling_lap_statistics(race, CAUTION_WINDOW_SIZE)
+  lap_starts, lap_ends           = lap_intervals(race)
+  flags                          = np.concatenate([team_lap_flags[team.name] for team in race.teams])
+
+  # Only the laps on track count, both for the slowed down laps and for the
+  # teams on track
+  is_on_track = ((flags & PIT_FLAGS) == 0) & ~np.isnan(medians)
+  is_slow     = is_on_track & (lap_times > medians * (1 + CAUTION_SLOWDOWN))
+
+  first_bins     = np.floor(lap_starts / CAUTION_RESOLUTION).astype(np.int64)
+  end_bins       = np.floor(lap_ends / CAUTION_RESOLUTION).astype(np.int64)
+  number_of_bins = int(end_bins.max()) + 1
+
+  teams_on_track = count_laps_in_progress(first_bins[is_on_track], end_bins[is_on_track], number_of_bins)
+  slow_teams     = count_laps_in_progress(first_bins[is_slow], end_bins[is_slow], number_of_bins)
+
+  is_caution = (slow_teams >= MIN_CAUTION_TEAMS) & (slow_teams >= CAUTION_SHARE * teams_on_track)
+
+  # The start and the end of every run of caution bins
+  changes = np.diff(np.concatenate([[0], is_caution.astype(np.int8), [0]]))
+  starts  = np.flatnonzero(changes == 1)
+  ends    = np.flatnonzero(changes == -1)
+
+  return np.stack([starts, ends], axis = -1) * CAUTION_RESOLUTION
+
+def flag_caution_laps(race, team_lap_flags, caution_windows):
+  # Flag every lap that overlaps with a caution window. The windows are sorted
+  # and don't overlap, so only the last window that starts before the end of
+  # the lap can overlap with it
+  if len(caution_windows) == 0:
+    return
+
+  for team in race.teams:
+    lap_ends   = race_model.cumulative_times(team)
+    lap_starts = lap_ends - team.lap_times
+
+    window_index = np.searchsorted(caution_windows[:, 0], lap_ends, side = "left") - 1
+    has_window   = window_index >= 0
+    is_caution   = has_window & (caution_windows[np.maximum(window_index, 0), 1] > lap_starts)
+
+    team_lap_flags[team.name][is_caution] |= lap_flags.LAP_CAUTION
+
+def classify_laps(race):
+  # The lap flags of every team including the caution flags, and the caution
+  # windows
+  team_lap_flags  = lap_flags.classify_laps(race)
+  caution_windows = find_caution_windows(race, team_lap_flags)
+  flag_caution_laps(race, team_lap_flags, caution_windows)
+
+  return team_lap_flags, caution_windows
+
+################
+# Main program #
+################
+if __name__ == "__main__":
+  parser = argparse.ArgumentParser(description = "List the periods where the whole " +
+                                                 "field slowed down.")
+
+  parser.add_argument("-i", "--input",
+                      required = True,
+                      help     = "The input YAML file containing all the karting data")
+
+  args = parser.parse_args()
+
+  race                            = race_model.load_race(args.input)
+  team_lap_flags, caution_windows = classify_laps(race)
+
+  for start, end in caution_windows:
+    print(f"Caution from {start:10.1f} sec to {end:10.1f} sec ({end - start:.0f} sec)")
+
+  for team in race.teams:
+    print(f"{team.name:<30} {int(np.count_nonzero(team_lap_flags[team.name] & lap_flags.LAP_CAUTION))} caution laps")
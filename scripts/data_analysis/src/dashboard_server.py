@@ -0,0 +1,401 @@
+import numpy as np
+
+import gzip
+import base64
+import html
+import json
+import math
+import asyncio
+import hashlib
+import argparse
+import collections
+import urllib.parse
+import plotly.io as plotly_io
+
+import race_model
+import race_analysis
+import generate_plots
+import stage_cache
+
+# The number of points per trace when the browser doesn't ask for a number
+DEFAULT_POINTS = 1000
+MAX_POINTS     = 20000
+
+INDEX_PAGE = """<!DOCTYPE html>
+<html>
+<head>
+<meta charset="utf-8">
+<title>{title}</title>
+<script src="https://cdn.plot.ly/plotly-3.3.0.min.js"></script>
+</head>
+<body>
+<h1>{title}</h1>
+<table id="standings"></table>
+<div id="figures"></div>
+<script>
+// Show the standings at the time of the clicked point
+async function loadStandings(time) {{
+  const standings = (await (await fetch("/standings?t=" + time)).json())[0].standings;
+
+  // The team and the driver names come from the karting data, so every cell
+  // is set as text instead of as HTML
+  const table = document.getElementById("standings");
+  table.replaceChildren();
+  table.createCaption().textContent = "Standings at " + Math.round(time) + " sec";
+
+  const header = table.insertRow();
+  for (const title of ["Position", "Team", "Laps", "Gap [laps]", "Gap [sec]", "Driver"]) {{
+    const cell = document.createElement("th");
+    cell.textContent = title;
+    header.appendChild(cell);
+  }}
+
+  for (const standing of standings) {{
+    const row = table.insertRow();
+    for (const value of [standing.position, standing.team, standing.laps.toFixed(3),
+                         standing.lap_gap.toFixed(3), standing.time_gap.toFixed(3), standing.driver]) {{
+      row.insertCell().textContent = value;
+    }}
+  }}
+}}
+
+// Only fetch the points that are visible at the current zoom level
+async function loadFigure(div, figureId, xRange) {{
+  let url = "/figures/" + figureId + "?points=" + Math.round(div.clientWidth || 1000);
+  if (xRange) {{
+    url += "&x0=" + xRange[0] + "&x1=" + xRange[1];
+  }}
+
+  const figure = await (await fetch(url)).json();
+  await Plotly.react(div, figure.data, figure.layout);
+}}
+
+async function main() {{
+  const figures = await (await fetch("/figures")).json();
+  for (const figure of figures) {{
+    const div = document.createElement("div");
+    document.getElementById("figures").appendChild(div);
+
+    await loadFigure(div, figure.id, null);
+
+    div.on("plotly_click", event => loadStandings(event.points[0].x));
+    div.on("plotly_relayout", event => {{
+      if ("xaxis.range[0]" in event) {{
+        loadFigure(div, figure.id, [event["xaxis.range[0]"], event["xaxis.range[1]"]]);
+      }} else if ("xaxis.autorange" in event) {{
+        loadFigure(div, figure.id, null);
+      }}
+    }});
+  }}
+}}
+
+main();
+</script>
+</body>
+</html>
+"""
+
+####################
+# Helper functions #
+####################
+def decode_array(values):
+  # Plotly stores the numeric arrays of a figure as base64 encoded typed arrays
+  if isinstance(values, dict) and "bdata" in values:
+    array = np.frombuffer(base64.b64decode(values["bdata"]), dtype = values["dtype"])
+    if "shape" in values:
+      array = array.reshape([int(size) for size in str(values["shape"]).split(",")])
+
+    return array
+
+  return np.asarray(values)
+
+def is_sliceable(arrays):
+  # Only a trace with a numeric, ascending x and a y of the same length can be
+  # sliced on the zoom range and downsampled. Traces like the heatmap with the
+  # driver names on its axes are sent as they are
+  x = arrays.get("x")
+  y = arrays.get("y")
+  if x is None or y is None or x.ndim != 1 or y.ndim != 1 or len(x) != len(y):
+    return False
+
+  if x.dtype.kind not in "iuf" or y.dtype.kind not in "iufb":
+    return False
+
+  return len(x) < 2 or bool(np.all(np.diff(x) >= 0))
+
+def visible_indices(x, x_range):
+  # The points inside the range plus one point on each side so the lines
+  # still reach the edges of the plot
+  if x_range is None:
+    return 0, len(x)
+
+  first_index = max(int(np.searchsorted(x, x_range[0], side = "left")) - 1, 0)
+  end_index   = min(int(np.searchsorted(x, x_range[1], side = "right")) + 1, len(x))
+
+  return first_index, end_index
+
+def downsample_indices(y, number_of_points):
+  # Keep the minimum and the maximum of every bucket so spikes like pit laps
+  # stay visible at every zoom level
+  number_of_buckets = max(number_of_points // 2, 1)
+  if len(y) <= 2 * number_of_buckets:
+    return np.arange(len(y))
+
+  bucket_size = math.ceil(len(y) / number_of_buckets)
+  padded      = np.full(number_of_buckets * bucket_size, np.nan)
+  padded[:len(y)] = y
+  buckets = padded.reshape(number_of_buckets, bucket_size)
+
+  # The last buckets can be padding only
+  valid   = ~np.all(np.isnan(buckets), axis = 1)
+  offsets = np.arange(number_of_buckets)[valid] * bucket_size
+  buckets = buckets[valid]
+
+  indices = np.concatenate([offsets + np.nanargmin(buckets, axis = 1),
+                            offsets + np.nanargmax(buckets, axis = 1),
+                            [0, len(y) - 1]])
+
+  return np.unique(indices)
+
+def quantize_range(x_range):
+  # Round the zoom range outwards so nearby zoom levels share the same cached
+  # response
+  if x_range is None:
+    return None
+
+  step = 10 ** math.floor(math.log10(max(x_range[1] - x_range[0], 1e-3))) / 10
+
+  return (math.floor(x_range[0] / step) * step,
+          math.ceil(x_range[1] / step) * step)
+
+###########
+# Figures #
+###########
+class DashboardFigure:
+  __slots__ = ("title", "layout", "traces")
+
+  def __init__(self, figure):
+    self.title  = figure.layout.title.text
+    self.layout = figure.layout.to_plotly_json()
+
+    # Keep the data of every trace as NumPy arrays for fast slicing
+    self.traces = []
+    for trace in figure.data:
+      trace_json = trace.to_plotly_json()
+      arrays     = {}
+      for name in ["x", "y", "customdata"]:
+        if trace_json.get(name) is not None:
+          arrays[name] = decode_array(trace_json.pop(name))
+
+      self.traces.append((trace_json, arrays, is_sliceable(arrays)))
+
+  def to_json(self, x_range, number_of_points):
+    data = []
+    for trace_json, arrays, sliceable in self.traces:
+      if not sliceable:
+        data.append(dict(trace_json, **arrays))
+        continue
+
+      first_index, end_index = visible_indices(arrays["x"], x_range)
+      indices = first_index + downsample_indices(arrays["y"][first_index:end_index].astype(np.float64),
+                                                 number_of_points)
+
+      trace = dict(trace_json)
+      for name, values in arrays.items():
+        trace[name] = values[indices]
+
+      data.append(trace)
+
+    layout = dict(self.layout)
+    if x_range is not None:
+      layout["xaxis"] = dict(layout.get("xaxis", {}), range = list(x_range), autorange = False)
+
+    return plotly_io.json.to_json_plotly({"data" : data, "layout" : layout})
+
+class Dashboard:
+  __slots__ = ("race_name", "time_index", "figures", "responses", "max_responses")
+
+  def __init__(self, analysis, cache = stage_cache.NO_CACHE, max_responses = 512):
+    self.race_name  = analysis["race_name"]
+    self.time_index = analysis["time_index"]
+
+    # The figures are only created once when the server starts
+    figures_json  = generate_plots.create_figures_json(analysis, generate_plots.TOTAL_FIGURES, cache)
+    figures_json += generate_plots.create_figures_json(analysis, generate_plots.DRIVER_FIGURES, cache)
+
+    self.figures = [DashboardFigure(plotly_io.from_json(figure_json)) for figure_json in figures_json]
+
+    # The compressed responses of the most recent requests
+    self.responses     = collections.OrderedDict()
+    self.max_responses = max_responses
+
+  def figure_list(self):
+    return json.dumps([{"id"    : figure_id,
+                        "title" : figure.title} for figure_id, figure in enumerate(self.figures)])
+
+  def standings(self, times):
+    return json.dumps([{"time"      : time,
+                        "standings" : standings}
+                       for time, standings in zip(times, self.time_index.standings_at(times))])
+
+  def index_page(self):
+    return INDEX_PAGE.format(title = html.escape(f"Karting results: {self.race_name}"))
+
+  def get_response(self, path, query):
+    # Returns the content type and the gzip compressed body, or None for an
+    # unknown path
+    key = (path,)
+    if path == "/":
+      content_type = "text/html; charset=utf-8"
+      create_body  = self.index_page
+    elif path == "/figures":
+      content_type = "application/json"
+      create_body  = self.figure_list
+    elif path.startswith("/figures/"):
+      try:
+        figure = self.figures[int(path[len("/figures/"):])]
+        number_of_points = min(int(query.get("points", [DEFAULT_POINTS])[0]), MAX_POINTS)
+
+        x_range = None
+        if "x0" in query and "x1" in query:
+          x_range = quantize_range((float(query["x0"][0]), float(query["x1"][0])))
+      except (ValueError, IndexError):
+        return None
+
+      key          = (path, x_range, number_of_points)
+      content_type = "application/json"
+      create_body  = lambda: figure.to_json(x_range, number_of_points)
+    elif path == "/standings":
+      # Every t in the query is a race time, all of them are looked up at once
+      try:
+        times = [round(float(time), 1) for value in query.get("t", []) for time in value.split(",")]
+      except ValueError:
+        return None
+
+      key          = (path, tuple(times))
+      content_type = "application/json"
+      create_body  = lambda: self.standings(times)
+    else:
+      return None
+
+    if key in self.responses:
+      self.responses.move_to_end(key)
+      return self.responses[key]
+
+    body     = gzip.compress(create_body().encode(), compresslevel = 6)
+    response = (content_type, body, hashlib.sha1(body).hexdigest())
+
+    self.responses[key] = response
+    if len(self.responses) > self.max_responses:
+      self.responses.popitem(last = False)
+
+    return response
+
+###############
+# HTTP server #
+###############
+async def write_response(writer, status, headers, body = b""):
+  lines = [f"HTTP/1.1 {status}"]
+  lines += [f"{name}: {value}" for name, value in headers.items()]
+  lines += [f"Content-Length: {len(body)}", "", ""]
+
+  writer.write("\r\n".join(lines).encode() + body)
+  await writer.drain()
+
+async def handle_connection(dashboard, reader, writer):
+  try:
+    while True:
+      request_line = await reader.readline()
+      if not request_line:
+        break
+
+      headers = {}
+      while True:
+        header_line = (await reader.readline()).decode("latin-1").strip()
+        if not header_line:
+          break
+
+        name, _, value = header_line.partition(":")
+        headers[name.strip().lower()] = value.strip()
+
+      method, target, _ = request_line.decode("latin-1").split(" ", 2)
+      url = urllib.parse.urlsplit(target)
+
+      # A request that fails is answered with an error instead of dropping the
+      # connection, so the other figures of the page still load
+      response = None
+      failed   = False
+      if method == "GET":
+        try:
+          response = dashboard.get_response(url.path, urllib.parse.parse_qs(url.query))
+        except Exception as error:
+          print(f"Failed to serve {target}: {error!r}")
+          failed = True
+
+      if failed:
+        await write_response(writer, "500 Internal Server Error", {"Content-Type" : "text/plain"}, b"Internal server error")
+      elif response is None:
+        await write_response(writer, "404 Not Found", {"Content-Type" : "text/plain"}, b"Not found")
+      else:
+        content_type, body, etag = response
+        response_headers = {"Content-Type"  : content_type,
+                            "Cache-Control" : "max-age=60",
+                            "ETag"          : f"\"{etag}\""}
+
+        if headers.get("if-none-match") == f"\"{etag}\"":
+          await write_response(writer, "304 Not Modified", response_headers)
+        elif "gzip" in headers.get("accept-encoding", ""):
+          response_headers["Content-Encoding"] = "gzip"
+          await write_response(writer, "200 OK", response_headers, body)
+        else:
+          await write_response(writer, "200 OK", response_headers, gzip.decompress(body))
+
+      if headers.get("connection", "").lower() == "close":
+        break
+  except (ConnectionError, ValueError):
+    pass
+  finally:
+    writer.close()
+
+async def serve_dashboard(dashboard, host, port):
+  server = await asyncio.start_server(lambda reader, writer: handle_connection(dashboard, reader, writer),
+                                      host,
+                                      port)
+  print(f"Serving the dashboard on http://{host}:{port}/")
+
+  async with server:
+    await server.serve_forever()
+
+################
+# Main program #
+################
+if __name__ == "__main__":
+  parser = argparse.ArgumentParser(description = "Serve the karting plots as a local " +
+                                                 "dashboard.")
+
+  parser.add_argument("-i", "--input",
+                      required = True,
+                      help     = "The input YAML file containing all the karting data")
+  parser.add_argument("--host",
+                      default = "127.0.0.1",
+                      help    = "The address the server listens on. Use 0.0.0.0 to " +
+                                "serve the other devices on the network")
+  parser.add_argument("--port",
+                      type    = int,
+                      default = 8000,
+                      help    = "The port the server listens on")
+  stage_cache.add_cache_arguments(parser)
+
+  args = parser.parse_args()
+
+  cache = stage_cache.create_cache(args)
+
+  # The race is only loaded and analysed once for all the requests
+  race      = race_model.load_race(args.input, cache)
+  analysis  = race_analysis.analyse_race(race, cache = cache)
+  dashboard = Dashboard(analysis, cache)
+
+  try:
+    asyncio.run(serve_dashboard(dashboard, args.host, args.port))
+  except KeyboardInterrupt:
+    pass
@@ -0,0 +1,212 @@
+import numpy as np
+
+import os
+import json
+import argparse
+import yaml
+
+import race_model
+import race_archive
+import lap_flags
+import caution_windows
+import stage_cache
+import stage_profiler
+
+####################
+# Helper functions #
+####################
+def session_code_version():
+  # The statistics of a session are calculated again when this code changes
+  return stage_cache.code_version(__file__,
+                                  race_model.__file__,
+                                  lap_flags.__file__,
+                                  caution_windows.__file__)
+
+######################
+# Session statistics #
+######################
+def calculate_session_statistics(race):
+  # The results of the teams and the laps and the pace of every driver in one
+  # session. The pace of a driver is the median of their clean laps and the
+  # reference of the session is the median pace like in the driver ratings
+  team_lap_flags = caution_windows.classify_laps(race)[0]
+
+  lap_end_times = np.concatenate([race_model.cumulative_times(team) for team in race.teams])
+  lap_times     = np.concatenate([team.lap_times for team in race.teams])
+  lap_drivers   = np.concatenate([team.lap_drivers for team in race.teams])
+  lap_teams     = np.repeat(np.arange(len(race.teams)), [len(team.lap_times) for team in race.teams])
+  flags         = np.concatenate([team_lap_flags[team.name] for team in race.teams])
+
+  is_driver = np.concatenate([race_model.named_driver_laps_mask(race, team) for team in race.teams])
+  is_clean  = lap_flags.is_clean(flags) & is_driver
+
+  drivers = {}
+  for code in np.unique(lap_drivers[is_driver]):
+    is_lap      = lap_drivers == code
+    clean_laps  = lap_times[is_lap & is_clean]
+    driver_laps = lap_times[is_lap]
+
+    drivers[race.drivers[code]] = {"team"          : race.teams[lap_teams[is_lap][0]].name,
+                                   "laps"          : int(len(driver_laps)),
+                                   "clean_laps"    : int(len(clean_laps)),
+                                   "best_lap"      : float(driver_laps.min()),
+                                   "pace"          : float(np.median(clean_laps)) if len(clean_laps) > 0 else None,
+                                   "drive_time"    : float(driver_laps.sum()),
+                                   "lap_end_times" : lap_end_times[is_lap],
+                                   "lap_times"     : driver_laps}
+
+  paces     = [driver["pace"] for driver in drivers.values()
+               if driver["clean_laps"] >= race_archive.MIN_CLEAN_LAPS]
+  reference = float(np.median(paces)) if paces else None
+
+  teams = []
+  for team in race.teams:
+    laps_behind, time_behind = race_model.parse_distance_to_winner(team.distance_to_winner)
+    teams.append({"team"            : team.name,
+                  "finish_position" : team.finish_position,
+                  "laps"            : len(team.lap_times),
+                  "laps_behind"     : laps_behind,
+                  "time_behind"     : time_behind})
+
+  return {"name"      : race.name,
+          "duration"  : race_model.total_race_time(race),
+          "reference" : reference,
+          "teams"     : teams,
+          "drivers"   : drivers}
+
+def session_statistics(race, cache = stage_cache.NO_CACHE):
+  # Every session has its own cache entry, so a new session of the event
+  # doesn't calculate the sessions before it again
+  key = [session_code_version(),
+         stage_cache.race_digest(race),
+         race.name,
+         [team.distance_to_winner for team in race.teams]]
+
+  return cache.cached(stage_name = "event session",
+                      key        = key,
+                      compute    = lambda: calculate_session_statistics(race))
+
+####################
+# Event statistics #
+####################
+def combine_sessions(sessions):
+  # The statistics of every driver over all the sessions of the event and
+  # their laps on one timeline. The sessions follow each other on the event
+  # timeline in the order they were driven
+  session_starts = np.concatenate([[0.0], np.cumsum([session["duration"] for session in sessions])[:-1]])
+
+  drivers = {}
+  for session_index, (session, session_start) in enumerate(zip(sessions, session_starts)):
+    for driver_name, driver in session["drivers"].items():
+      combined = drivers.setdefault(driver_name, {"sessions"   : [],
+                                                  "laps"       : 0,
+                                                  "clean_laps" : 0,
+                                                  "best_lap"   : np.inf,
+                                                  "drive_time" : 0.0,
+                                                  "paces"      : [],
+                                                  "timeline"   : []})
+
+      combined["sessions"].append(session_index)
+      combined["laps"]       += driver["laps"]
+      combined["clean_laps"] += driver["clean_laps"]
+      combined["best_lap"]    = min(combined["best_lap"], driver["best_lap"])
+      combined["drive_time"] += driver["drive_time"]
+      combined["timeline"].append((session_start + driver["lap_end_times"],
+                                   driver["lap_times"],
+                                   np.full(len(driver["lap_times"]), session_index)))
+
+      if driver["pace"] is not None and session["reference"] is not None and \
+         driver["clean_laps"] >= race_archive.MIN_CLEAN_LAPS:
+        combined["paces"].append((driver["pace"] / session["reference"], driver["clean_laps"]))
+
+  # The relative pace is the pace of the driver relative to the reference of
+  # every session, weighted with their clean laps, so a heat and a finale with
+  # a different grip compare
+  for driver in drivers.values():
+    paces = driver.pop("paces")
+    if paces:
+      relative_paces, weights = np.array(paces).T
+      driver["relative_pace"] = float(np.average(relative_paces, weights = weights))
+    else:
+      driver["relative_pace"] = None
+
+    event_times, lap_times, session_indices = (np.concatenate(values) for values in zip(*driver.pop("timeline")))
+    driver["timeline"] = {"event_times" : event_times,
+                          "lap_times"   : lap_times,
+                          "sessions"    : session_indices}
+
+  return {"session_starts" : session_starts,
+          "drivers"        : drivers}
+
+def analyse_event(event, profiler = stage_profiler.NO_PROFILER, cache = stage_cache.NO_CACHE):
+  sessions = []
+  for session_index, session in enumerate(event.sessions):
+    with profiler.stage(f"Session statistics of session {session_index + 1}"):
+      sessions.append(session_statistics(session, cache))
+
+  with profiler.stage("Combine the sessions"):
+    combined = combine_sessions(sessions)
+
+  return {"event_name"     : event.name,
+          "sessions"       : [{"name"      : session["name"],
+                               "duration"  : session["duration"],
+                               "reference" : session["reference"],
+                               "teams"     : session["teams"]} for session in sessions],
+          "session_starts" : combined["session_starts"].tolist(),
+          "drivers"        : {driver_name : {**driver,
+                                             "timeline" : {name : values.tolist()
+                                                           for name, values in driver["timeline"].items()}}
+                              for driver_name, driver in combined["drivers"].items()}}
+
+################
+# Main program #
+################
+if __name__ == "__main__":
+  parser = argparse.ArgumentParser(description = "Combine the sessions of an event, like the " +
+                                                 "heats and the finale, per driver.")
+
+  parser.add_argument("-i", "--input",
+                      required = True,
+                      action   = "append",
+                      help     = "The input YAML file of a session. Give one for every " +
+                                 "session in the order they were driven")
+  parser.add_argument("-n", "--name",
+                      help = "The name of the event. The default is the start of the " +
+                             "race name of the first session")
+  parser.add_argument("-o", "--output",
+                      help = "The output YAML or JSON file with the sessions, the " +
+                             "combined driver statistics and their timelines")
+  stage_profiler.add_profile_arguments(parser)
+  stage_cache.add_cache_arguments(parser)
+
+  args = parser.parse_args()
+
+  profiler = stage_profiler.create_profiler(args)
+  cache    = stage_cache.create_cache(args)
+
+  with profiler.stage("data parsing"):
+    event = race_model.load_event(args.input, args.name, cache)
+
+  analysis = analyse_event(event, profiler, cache)
+
+  print(f"Event {analysis['event_name']}")
+  for session in analysis["sessions"]:
+    print(f"  {session['name']} (winner {session['teams'][0]['team']})")
+
+  for driver_name, driver in sorted(analysis["drivers"].items(),
+                                    key = lambda item: (item[1]["relative_pace"] is None,
+                                                        item[1]["relative_pace"] or 0.0)):
+    relative_pace = "no pace" if driver["relative_pace"] is None else f"{driver['relative_pace']:.4f} of the field"
+    print(f"{driver_name:<30} {len(driver['sessions'])} sessions {driver['laps']:>5} laps "
+          f"best {driver['best_lap']:7.3f} sec {relative_pace}")
+
+  if args.output is not None:
+    # The timelines are only part of the output file
+    with open(args.output, 'w') as output_file:
+      if args.output.endswith(".json"):
+        json.dump(analysis, output_file, indent = 2, ensure_ascii = False)
+      else:
+        yaml.safe_dump(analysis, output_file, sort_keys = False, allow_unicode = True)
+
+  profiler.write_report(os.path.splitext(args.output)[0] + "_profile.json" if args.output is not None
+                        else "event_profile.json")
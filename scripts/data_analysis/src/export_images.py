@@ -0,0 +1,83 @@
+import os
+import argparse
+
+import race_model
+import race_analysis
+import race_archive
+import generate_plots
+import stage_cache
+import stage_profiler
+
+####################
+# Helper functions #
+####################
+def find_inputs(results_folder):
+  # The karting data of every race of the archive, like
+  # 2025/2025_12_20/karting_results.yaml
+  return [os.path.join(results_folder, race_file) for race_file in race_archive.find_race_files(results_folder)]
+
+def export_race_images(filename,
+                       output_folder,
+                       renderer,
+                       formats  = generate_plots.IMAGE_FORMATS,
+                       profiler = stage_profiler.NO_PROFILER,
+                       cache    = stage_cache.NO_CACHE):
+  with profiler.stage(f"data parsing ({filename})"):
+    race = race_model.load_race(filename, cache)
+
+  analysis = race_analysis.analyse_race(race, profiler, cache)
+
+  generate_plots.generate_static_images(analysis      = analysis,
+                                        output_folder = output_folder,
+                                        renderer      = renderer,
+                                        formats       = formats,
+                                        profiler      = profiler,
+                                        cache         = cache)
+
+################
+# Main program #
+################
+if __name__ == "__main__":
+  parser = argparse.ArgumentParser(description = "Export the figures of both reports as " +
+                                                 "static images for a batch of races.")
+
+  parser.add_argument("-i", "--input",
+                      action = "append",
+                      help   = "The input YAML file of a race. The default is every race " +
+                               "of the results folder")
+  parser.add_argument("-r", "--results_folder",
+                      default = race_archive.DEFAULT_RESULTS_FOLDER,
+                      help    = "The results folder with a folder for every race")
+  parser.add_argument("-f", "--formats",
+                      nargs   = "+",
+                      choices = generate_plots.IMAGE_FORMATS,
+                      default = generate_plots.IMAGE_FORMATS,
+                      help    = "The formats of the images")
+  parser.add_argument("-p", "--plots_folder",
+                      default = "plots",
+                      help    = "The folder next to every input where the images are " +
+                                "created")
+  stage_profiler.add_profile_arguments(parser)
+  stage_cache.add_cache_arguments(parser)
+
+  args = parser.parse_args()
+
+  profiler = stage_profiler.create_profiler(args)
+  cache    = stage_cache.create_cache(args)
+
+  inputs = args.input or find_inputs(args.results_folder)
+
+  # The renderer is started once for the images of all the races
+  with generate_plots.ImageRenderer() as renderer:
+    for filename in inputs:
+      output_folder = os.path.join(os.path.dirname(os.path.abspath(filename)), args.plots_folder)
+      export_race_images(filename      = filename,
+                         output_folder = output_folder,
+                         renderer      = renderer,
+                         formats       = args.formats,
+                         profiler      = profiler,
+                         cache         = cache)
+
+      print(f"Exported the images of {filename} to {output_folder}")
+
+  profiler.write_report("export_images_profile.json")
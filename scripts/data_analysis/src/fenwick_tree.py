@@ -0,0 +1,65 @@
+import numpy as np
+
+################
+# Fenwick tree #
+################
+class FenwickTree:
+  __slots__ = ("tree", "size", "highest_bit")
+
+  def __init__(self, values):
+    # Build the tree in linear time from the initial values
+    self.size = len(values)
+    tree      = [0] + list(values)
+    for index in range(1, self.size + 1):
+      parent = index + (index & -index)
+      if parent <= self.size:
+        tree[parent] += tree[index]
+
+    self.tree        = tree
+    self.highest_bit = 1 << (self.size.bit_length() - 1) if self.size > 0 else 0
+
+  @classmethod
+  def zeros(cls, size):
+    return cls([0] * size)
+
+  def add(self, index, delta):
+    # Add the delta to the value at the 0-based index
+    tree  = self.tree
+    index += 1
+    while index <= self.size:
+      tree[index] += delta
+      index += index & -index
+
+  def prefix_sum(self, end_index):
+    # The sum of the values at the indices [0, end_index[
+    tree   = self.tree
+    result = 0
+    while end_index > 0:
+      result    += tree[end_index]
+      end_index -= end_index & -end_index
+
+    return result
+
+  def range_sum(self, first_index, end_index):
+    return self.prefix_sum(end_index) - self.prefix_sum(first_index)
+
+  def value(self, index):
+    return self.range_sum(index, index + 1)
+
+  def find_prefix(self, target):
+    # The smallest 0-based index whose prefix sum including that index reaches
+    # the target. The values have to be non negative
+    tree     = self.tree
+    position = 0
+    bit      = self.highest_bit
+    while bit > 0:
+      next_position = position + bit
+      if next_position <= self.size and tree[next_position] < target:
+        position = next_position
+        target  -= tree[next_position]
+      bit >>= 1
+
+    return position
+
+  def values(self):
+    return np.array([self.value(index) for index in range(self.size)])
@@ -0,0 +1,337 @@
+import numpy as np
+
+import collections
+import argparse
+import yaml
+
+import race_model
+
+# The pace of a team and of its drivers comes from this many of their latest
+# driver laps. The bootstrap samples the future laps from them
+RECENT_LAPS = 30
+
+# The extra time of a pit lap when the team didn't make a pit stop yet but the
+# planned rotation needs one
+DEFAULT_PIT_EXTRA = 15.0
+
+DEFAULT_SAMPLES = 1000
+CONFIDENCE      = 0.9
+
+# The pool of the team laps, the drivers have their own pools
+TEAM_POOL = None
+
+###################
+# Team projection #
+###################
+class TeamProjection:
+  __slots__ = ("name", "laps", "total_time", "has_stopped", "driver_name", "recent_laps",
+               "driver_laps", "pit_laps", "recent_pit_laps", "stint_laps", "laps_before_last_pit")
+
+  def __init__(self, name):
+    self.name        = name
+    self.laps        = 0
+    self.total_time  = 0.0
+    self.has_stopped = False
+    self.driver_name = None
+
+    self.recent_laps = collections.deque(maxlen = RECENT_LAPS)
+    self.driver_laps = {}
+
+    # The pit pattern. The stints end at a pit lap, so the average stint is the
+    # driver laps before the last pit lap divided by the pit laps
+    self.pit_laps             = 0
+    self.recent_pit_laps      = collections.deque(maxlen = RECENT_LAPS)
+    self.stint_laps           = 0
+    self.laps_before_last_pit = 0
+
+  @classmethod
+  def from_laps(cls, name, lap_times, lap_driver_names, has_stopped = False):
+    # The same state as adding the laps one by one, from the lap arrays of a
+    # finished race
+    projection = cls(name)
+
+    lap_times = np.asarray(lap_times, dtype = np.float64)
+    is_pit    = np.asarray(lap_driver_names) == race_model.PIT_DRIVER
+    pit_index = np.flatnonzero(is_pit)
+
+    projection.laps        = len(lap_times)
+    projection.total_time  = float(np.sum(lap_times))
+    projection.has_stopped = has_stopped
+    projection.driver_name = lap_driver_names[-1] if len(lap_times) > 0 else None
+
+    driver_times = lap_times[~is_pit]
+    driver_names = np.asarray(lap_driver_names, dtype = object)[~is_pit]
+    projection.recent_laps.extend(driver_times[-RECENT_LAPS:].tolist())
+    for driver_name in dict.fromkeys(driver_names):
+      projection.driver_laps[driver_name] = collections.deque(driver_times[driver_names == driver_name][-RECENT_LAPS:].tolist(),
+                                                              maxlen = RECENT_LAPS)
+
+    projection.pit_laps = len(pit_index)
+    projection.recent_pit_laps.extend(lap_times[is_pit][-RECENT_LAPS:].tolist())
+    if len(pit_index) > 0:
+      projection.laps_before_last_pit = int(np.sum(~is_pit[:pit_index[-1]]))
+    projection.stint_laps = len(driver_times) - projection.laps_before_last_pit
+
+    return projection
+
+  def add_lap(self, lap_time, driver_name):
+    # Constant time per lap, so the projection follows a live race
+    self.laps        += 1
+    self.total_time  += lap_time
+    self.driver_name  = driver_name
+
+    if driver_name == race_model.PIT_DRIVER:
+      self.pit_laps             += 1
+      self.recent_pit_laps.append(lap_time)
+      self.laps_before_last_pit += self.stint_laps
+      self.stint_laps            = 0
+      return
+
+    self.stint_laps += 1
+    self.recent_laps.append(lap_time)
+    if driver_name not in self.driver_laps:
+      self.driver_laps[driver_name] = collections.deque(maxlen = RECENT_LAPS)
+    self.driver_laps[driver_name].append(lap_time)
+
+  def pools(self):
+    # The lap times to sample from. A team without driver laps yet uses the
+    # average of all its laps
+    team_laps = np.array(self.recent_laps) if self.recent_laps else \
+                np.array([self.total_time / max(self.laps, 1)])
+
+    pools = {TEAM_POOL : team_laps}
+    pools.update((driver_name, np.array(driver_laps)) for driver_name, driver_laps in self.driver_laps.items())
+
+    return pools
+
+  def pit_extras(self, pools):
+    # The times the recent pit laps added to a normal lap of the team
+    if self.pit_laps == 0:
+      return np.array([DEFAULT_PIT_EXTRA])
+
+    return np.maximum(np.array(self.recent_pit_laps) - np.median(pools[TEAM_POOL]), 0.0)
+
+  def stint_segments(self, pools, plan):
+    # The pools and the laps of the coming stints, the last stint repeats.
+    # Without a planned rotation the current driver finishes an average stint
+    # and the next stints use the pace of the whole team. Without pit stops so
+    # far the current stint goes on until the end
+    if plan is None:
+      if self.pit_laps == 0:
+        return [(self.driver_name, np.inf)]
+
+      average_stint = max(self.laps_before_last_pit / self.pit_laps, 1.0)
+      return [(self.driver_name, max(average_stint - self.stint_laps, 1.0)),
+              (TEAM_POOL, average_stint)]
+
+    # The planned stints from the current race time, only the part of the
+    # stint in progress that is left. The minutes become laps at the pace of
+    # the planned driver and the last planned driver goes on until the end
+    plan_ends = np.cumsum([stint["minutes"] * 60 for stint in plan])
+    current   = int(np.searchsorted(plan_ends, self.total_time, side = "right"))
+    if current >= len(plan):
+      return [(plan[-1]["driver"], np.inf)]
+
+    segments = []
+    for stint, plan_end in zip(plan[current:], plan_ends[current:]):
+      pool_key = stint["driver"] if stint["driver"] in pools else TEAM_POOL
+      duration = plan_end - max(plan_end - stint["minutes"] * 60, self.total_time)
+      segments.append((pool_key, duration / np.median(pools[pool_key])))
+    segments.append((segments[-1][0], np.inf))
+
+    return segments
+
+  def future_laps(self, remaining_time, plan = None):
+    # The pool of every future lap and the pit laps, enough laps to cover the
+    # remaining time with the fastest laps of the pools. A pit lap starts every
+    # stint after the current one
+    pools       = self.pools()
+    fastest_lap = min(pool.min() for pool in pools.values())
+    max_laps    = int(np.ceil(remaining_time / fastest_lap)) + 1
+    segments    = self.stint_segments(pools, plan)
+
+    lap_pools = []
+    is_pit    = []
+    segment   = 0
+    while len(lap_pools) < max_laps:
+      pool_key, length = segments[min(segment, len(segments) - 1)]
+      if pool_key not in pools:
+        pool_key = TEAM_POOL
+
+      stint_laps = min(int(round(length)), max_laps) if np.isfinite(length) else max_laps
+      if segment > 0:
+        lap_pools.append(pool_key)
+        is_pit.append(True)
+        stint_laps = max(stint_laps, 1)
+
+      lap_pools.extend([pool_key] * stint_laps)
+      is_pit.extend([False] * stint_laps)
+      segment += 1
+
+    return pools, lap_pools[:max_laps], np.array(is_pit[:max_laps], dtype = bool)
+
+  def expected_cumulative_times(self, end_time, plan = None):
+    # The cumulative times of the future laps at the median pace of their pool
+    # up to the first lap that ends after the end time
+    remaining_time = end_time - self.total_time
+    if remaining_time <= 0:
+      return np.zeros(0)
+
+    pools, lap_pools, is_pit = self.future_laps(remaining_time, plan)
+    medians                  = {pool_key : float(np.median(pool)) for pool_key, pool in pools.items()}
+    lap_times                = np.array([medians[pool_key] for pool_key in lap_pools]) + \
+                               is_pit * float(np.median(self.pit_extras(pools)))
+    cumulative               = self.total_time + np.cumsum(lap_times)
+
+    return cumulative[:int(np.searchsorted(cumulative, end_time, side = "left")) + 1]
+
+  def sample_distances(self, end_time, samples, rng, plan = None):
+    # The bootstrapped laps of the team at the end time. Every future lap is
+    # sampled from its pool, every pit lap also gets a sampled pit extra and
+    # the distance includes the part of the lap in progress at the end time. A
+    # team past the end time was that part of a lap less far at the end time
+    remaining_time = end_time - self.total_time
+    if self.has_stopped:
+      return np.full(samples, float(self.laps))
+    if remaining_time <= 0:
+      return np.full(samples, self.laps + remaining_time / float(np.median(self.pools()[TEAM_POOL])))
+
+    pools, lap_pools, is_pit = self.future_laps(remaining_time, plan)
+    pit_extras               = self.pit_extras(pools)
+
+    pool_keys   = list(pools)
+    pool_index  = np.array([pool_keys.index(pool_key) for pool_key in lap_pools])
+    pool_sizes  = np.array([len(pools[pool_key]) for pool_key in pool_keys])
+    pool_starts = np.cumsum(pool_sizes) - pool_sizes
+    all_laps    = np.concatenate([pools[pool_key] for pool_key in pool_keys])
+
+    sampled    = pool_starts[pool_index] + (rng.random((samples, len(pool_index))) * pool_sizes[pool_index]).astype(np.int64)
+    lap_times  = all_laps[sampled]
+    lap_times[:, is_pit] += pit_extras[rng.integers(len(pit_extras), size = (samples, int(is_pit.sum())))]
+    cumulative = np.cumsum(lap_times, axis = 1)
+    laps_done  = np.sum(cumulative <= remaining_time, axis = 1)
+
+    last_times = np.concatenate([np.zeros((samples, 1)), cumulative], axis = 1)[np.arange(samples), laps_done]
+    next_laps  = lap_times[np.arange(samples), np.minimum(laps_done, len(pool_index) - 1)]
+
+    return self.laps + laps_done + (remaining_time - last_times) / next_laps
+
+#####################
+# Finish projection #
+#####################
+class FinishProjection:
+  __slots__ = ("teams", "plans")
+
+  def __init__(self, plans = None):
+    self.teams = {}
+
+    # The planned rotation of the teams that have one, the stints like in the
+    # output of the stint planner
+    self.plans = plans or {}
+
+  @classmethod
+  def from_race(cls, race, plans = None, end_time = None):
+    # The projection from all the laps of the race that end before the end
+    # time, for a projection in the middle of a finished race
+    projection = cls(plans)
+    for team in race.teams:
+      lap_count = len(team.lap_times) if end_time is None else \
+                  int(np.searchsorted(race_model.cumulative_times(team), end_time, side = "right"))
+
+      projection.teams[team.name] = TeamProjection.from_laps(team.name,
+                                                             team.lap_times[:lap_count],
+                                                             race_model.lap_driver_names(race, team)[:lap_count],
+                                                             team.has_stopped and end_time is None)
+
+    return projection
+
+  def add_lap(self, team_name, lap_time, driver_name):
+    if team_name not in self.teams:
+      self.teams[team_name] = TeamProjection(team_name)
+    self.teams[team_name].add_lap(lap_time, driver_name)
+
+  def project(self, end_time, samples = DEFAULT_SAMPLES, seed = None):
+    # The final laps and the final position of every team with their
+    # confidence intervals. The samples of all the teams are ranked together,
+    # so every sample is one possible end of the race. Every team finishes the
+    # lap it is in at the end time
+    rng       = np.random.default_rng(seed)
+    teams     = list(self.teams.values())
+    distances = np.array([team.sample_distances(end_time, samples, rng, self.plans.get(team.name))
+                          for team in teams])
+    positions = np.argsort(np.argsort(-distances, axis = 0), axis = 0) + 1
+
+    quantiles = [(1 - CONFIDENCE) / 2, 0.5, (1 + CONFIDENCE) / 2]
+    is_done   = np.array([[team.has_stopped or team.total_time >= end_time] for team in teams])
+    laps      = np.quantile(np.where(is_done, [[team.laps] for team in teams], np.ceil(distances)), quantiles, axis = 1)
+    places    = np.quantile(positions, quantiles, axis = 1, method = "nearest")
+
+    return sorted(({"team"              : team.name,
+                    "laps"              : team.laps,
+                    "final_laps"        : float(laps[1, index]),
+                    "final_laps_low"    : float(laps[0, index]),
+                    "final_laps_high"   : float(laps[2, index]),
+                    "expected_position" : float(positions[index].mean()),
+                    "position_low"      : int(places[0, index]),
+                    "position_high"     : int(places[2, index])}
+                   for index, team in enumerate(teams)),
+                  key = lambda team: team["expected_position"])
+
+####################
+# Helper functions #
+####################
+def race_end_time(race):
+  # Every team that didn't stop crosses the line once more after the end of
+  # the race, so the race ended after the second to last lap of all of them
+  return max((float(race_model.cumulative_times(team)[-2]) for team in race.teams
+              if not team.has_stopped and len(team.lap_times) > 1),
+             default = race_model.total_race_time(race))
+
+def load_plans(filename):
+  # A YAML file with the planned stints of every team, like
+  # TEAM 1: [{driver: Joost, minutes: 30}, {driver: BertP, minutes: 30}]
+  with open(filename, 'r') as plan_file:
+    return yaml.safe_load(plan_file)
+
+################
+# Main program #
+################
+if __name__ == "__main__":
+  parser = argparse.ArgumentParser(description = "Project the final laps and positions of " +
+                                                 "every team at a moment of a race.")
+
+  parser.add_argument("-i", "--input",
+                      required = True,
+                      help     = "The input YAML file containing all the karting data")
+  parser.add_argument("-a", "--at",
+                      type = float,
+                      help = "The race time in minutes of the projection. The default is " +
+                             "the end of the race")
+  parser.add_argument("-t", "--race_duration",
+                      type = float,
+                      help = "The duration of the race in minutes. The default is the " +
+                             "end of the race in the karting data")
+  parser.add_argument("-p", "--plans",
+                      help = "The YAML file with the planned stints of the teams")
+  parser.add_argument("-n", "--samples",
+                      type    = int,
+                      default = DEFAULT_SAMPLES,
+                      help    = "The number of bootstrapped race ends")
+  parser.add_argument("-s", "--seed",
+                      type = int,
+                      help = "The seed of the bootstrap")
+
+  args = parser.parse_args()
+
+  race     = race_model.load_race(args.input)
+  end_time = race_end_time(race) if args.race_duration is None else args.race_duration * 60
+  at_time  = None if args.at is None else args.at * 60
+
+  projection = FinishProjection.from_race(race     = race,
+                                          plans    = None if args.plans is None else load_plans(args.plans),
+                                          end_time = at_time)
+
+  for position, team in enumerate(projection.project(end_time, args.samples, args.seed)):
+    print(f"P{position + 1:<3} {team['team']:<30} lap {team['laps']:>5} "
+          f"final laps {team['final_laps']:6.0f} [{team['final_laps_low']:.0f} - {team['final_laps_high']:.0f}] "
+          f"position [{team['position_low']} - {team['position_high']}]")
@@ -2,288 +2,16 @@ import numpy as np
 
 import os
 import subprocess
-import copy
 import argparse
-import yaml
 import plotly.graph_objects as plotly_go
+import plotly.io as plotly_io
 import pandas
-import bar_chart_race
-import bisect
 
-#################
-# Input parsing #
-#################
-parser = argparse.ArgumentParser(description = "Analyse the karting data and " +
-                                               "generate plots.")
-
-parser.add_argument("-i", "--input",
-                    required = True,
-                    help     = "The input YAML file containing all the karting data")
-parser.add_argument("-o", "--output_folder",
-                    required = True,
-                    help     = "The output directory where the plots will be created")
-
-args = parser.parse_args()
-
-################
-# data parsing #
-################
-with open(args.input, 'r') as data_file:
-  karting_data = yaml.safe_load(data_file)
-
-##################################################
-# Calculate some data out of the karting results #
-##################################################
-def are_floats_close(lhs, rhs, tolerance = 1e-6):
-  return abs(lhs - rhs) <= tolerance
-
-number_of_teams = len(karting_data["results"])
-
-team_has_stopped = {}
-for team_data in karting_data["results"]:
-  team_has_stopped[team_data["team_name"]] = False
-  if "has_stopped" in team_data and team_data["has_stopped"]:
-    team_has_stopped[team_data["team_name"]] = True
-
-lap_times = {}
-for team_data in karting_data["results"]:
-  times = [lap["time"] for lap in team_data["laps"]]
-  lap_times[team_data["team_name"]] = times
-
-lap_drivers = {}
-for team_data in karting_data["results"]:
-  drivers = [lap["driver"] for lap in team_data["laps"]]
-  lap_drivers[team_data["team_name"]] = drivers
-
-cumulative_times = {}
-for team_data in karting_data["results"]:
-  times = [lap["time"] for lap in team_data["laps"]]
-  cumulative_times[team_data["team_name"]] = np.cumsum(times)
-
-running_averages = {}
-for team_data in karting_data["results"]:
-  team_name = team_data["team_name"]
-  cumulative_time = cumulative_times[team_name]
-  running_averages[team_name] = cumulative_time / np.arange(1, len(cumulative_time) + 1)
-
-# Update the cumulative times for easier interpolation
-cumulative_times_extended = copy.deepcopy(cumulative_times)
-for team_name in cumulative_times_extended:
-  # Add the value 0 to start of the cumulative times
-  cumulative_times_extended[team_name] = np.insert(cumulative_times_extended[team_name], 0, 0)
-
-max_cumulative_time = max([cumulative_time[-1] for cumulative_time in cumulative_times.values()])
-for team_name in cumulative_times_extended:
-  # Extend the cumulative times with the last running average of the team
-  while cumulative_times_extended[team_name][-1] < max_cumulative_time:
-    cumulative_times_extended[team_name] = np.append(cumulative_times_extended[team_name],
-                                                     cumulative_times_extended[team_name][-1] + running_averages[team_name][-1])
-
-# Calculate interpolated laps
-all_cumulative_times = []
-for team_cumulative_times in cumulative_times.values():
-  all_cumulative_times.extend(team_cumulative_times)
-
-all_cumulative_times.sort()
-
-interpolated_laps = {}
-teams_max_cumulative_time_index = {}
-for team_name, team_cumulative_times_extended in cumulative_times_extended.items():
-
-  interpolated_laps[team_name] = []
-  current_lap_index = 0
-  for i, cumulative_time in enumerate(all_cumulative_times):
-    while team_cumulative_times_extended[current_lap_index + 1] < cumulative_time:
-      current_lap_index += 1
-
-    if cumulative_time > cumulative_times[team_name][-1] and \
-       not are_floats_close(cumulative_time, cumulative_times[team_name][-1]):
-      if team_name not in teams_max_cumulative_time_index:
-        teams_max_cumulative_time_index[team_name] = i - 1
-
-    if team_has_stopped[team_name] and \
-       (cumulative_times[team_name][-1] < team_cumulative_times_extended[current_lap_index] or
-        are_floats_close(cumulative_times[team_name][-1],
-                         team_cumulative_times_extended[current_lap_index])):
-      # The team has stopped so the laps don't increase anymore
-      interpolated_laps[team_name].append(len(cumulative_times[team_name]))
-    else:
-      # Interpolate
-      current_cumulative_time = team_cumulative_times_extended[current_lap_index]
-      next_cumulative_time    = team_cumulative_times_extended[current_lap_index + 1]
-      interpolated_lap = current_lap_index + (cumulative_time - current_cumulative_time) / \
-                                             (next_cumulative_time - current_cumulative_time)
-      interpolated_laps[team_name].append(interpolated_lap)
-
-  if team_name not in teams_max_cumulative_time_index:
-    teams_max_cumulative_time_index[team_name] = len(all_cumulative_times) - 1
-
-total_running_average = []
-for i, cumulative_time in enumerate(all_cumulative_times):
-  sum_team_laps       = 0
-  sum_cumulative_time = 0
-  for team_name, team_interpolated_laps in interpolated_laps.items():
-    max_index = teams_max_cumulative_time_index[team_name]
-
-    # We only sum the valid laps and not the one after a team has stopped
-    if i <= max_index or not team_has_stopped[team_name]:
-      sum_team_laps       += team_interpolated_laps[i]
-      sum_cumulative_time += cumulative_time
-    else:
-      sum_team_laps       += team_interpolated_laps[max_index]
-      sum_cumulative_time += all_cumulative_times[max_index]
-
-  total_running_average.append(sum_cumulative_time / sum_team_laps)
-
-total_running_average_diff = {}
-for team_name in cumulative_times:
-  total_running_average_diff[team_name] = []
-  for i, cumulative_time in enumerate(all_cumulative_times):
-    total_running_average_diff[team_name].append(cumulative_time / interpolated_laps[team_name][i] -
-                                                 total_running_average[i])
-
-# We assume that the driver only rides for one team
-all_drivers = set()
-for team_data in karting_data["results"]:
-  for lap in team_data["laps"]:
-    driver_name = lap["driver"]
-
-    if driver_name == "Pit":
-      continue
-
-    all_drivers.add(driver_name)
-
-all_drivers = list(all_drivers)
-all_drivers.sort()
-
-number_of_drivers = len(all_drivers)
-
-lap_per_drivers = {driver : [] for driver in all_drivers}
-for team_data in karting_data["results"]:
-  for lap in team_data["laps"]:
-    driver_name = lap["driver"]
-
-    if driver_name == "Pit":
-      continue
-
-    if driver_name not in lap_per_drivers:
-      lap_per_drivers[driver_name] = []
-
-    lap_per_drivers[driver_name].append(lap["time"])
-
-cumulative_times_per_driver = {driver : [] for driver in all_drivers}
-for driver_name, driver_lap_times in lap_per_drivers.items():
-  cumulative_times_per_driver[driver_name] = np.cumsum(driver_lap_times)
-
-running_averages_per_driver = {driver : [] for driver in all_drivers}
-for driver_name, driver_lap_times in lap_per_drivers.items():
-  cumulative_time = cumulative_times_per_driver[driver_name]
-  running_averages_per_driver[driver_name] = cumulative_time / np.arange(1, len(cumulative_time) + 1)
-
-# Calculate interpolated running averages per driver
-all_cumulative_times_driver = []
-for driver_cumulative_times in cumulative_times_per_driver.values():
-  all_cumulative_times_driver.extend(driver_cumulative_times)
-
-all_cumulative_times_driver.sort()
-
-interpolated_running_averages_per_driver = {driver : [] for driver in all_drivers}
-drivers_max_cumulative_time_index = {}
-for driver_name, driver_running_averages in running_averages_per_driver.items():
-
-  driver_cumulative_times = cumulative_times_per_driver[driver_name]
-  driver_running_averages = running_averages_per_driver[driver_name]
-
-  current_lap_index = 0
-  for i, cumulative_time in enumerate(all_cumulative_times_driver):
-
-    while current_lap_index + 1 < len(driver_cumulative_times) and \
-          driver_cumulative_times[current_lap_index + 1] < cumulative_time:
-      current_lap_index += 1
-
-    if current_lap_index == len(driver_cumulative_times) - 1:
-      interpolated_running_average = driver_running_averages[-1]
-
-      if driver_name not in drivers_max_cumulative_time_index:
-        drivers_max_cumulative_time_index[driver_name] = i - 1
-
-    elif cumulative_time < driver_cumulative_times[current_lap_index]:
-
-      # We assume that the driver started out with the same running average as
-      # at his first measured lap
-      interpolated_running_average = driver_running_averages[0]
-
-    else:
-      # Interpolate
-      current_cumulative_time = driver_cumulative_times[current_lap_index]
-      next_cumulative_time    = driver_cumulative_times[current_lap_index + 1]
-      current_running_average = driver_running_averages[current_lap_index]
-      next_running_average    = driver_running_averages[current_lap_index + 1]
-      interpolated_running_average = \
-        current_running_average + \
-        (cumulative_time - current_cumulative_time) * \
-        (next_running_average - current_running_average) / \
-        (next_cumulative_time - current_cumulative_time)
-
-    interpolated_running_averages_per_driver[driver_name].append(interpolated_running_average)
-
-  if driver_name not in drivers_max_cumulative_time_index:
-    drivers_max_cumulative_time_index[driver_name] = len(all_cumulative_times_driver) - 1
-
-# Calculate interpolated laps per driver
-interpolated_laps_per_driver = {driver : [] for driver in all_drivers}
-for driver_name, driver_cumulative_times in cumulative_times_per_driver.items():
-
-  current_lap_index = 0
-  for i, cumulative_time in enumerate(all_cumulative_times_driver):
-    while current_lap_index + 1 < len(driver_cumulative_times) and \
-          driver_cumulative_times[current_lap_index + 1] < cumulative_time:
-      current_lap_index += 1
-
-    if current_lap_index == len(driver_cumulative_times) - 1:
-
-      # The driver did not ride anymore laps than this so the laps don't
-      # increase anymore
-      interpolated_lap = len(cumulative_times_per_driver[driver_name])
-
-    elif cumulative_time < driver_cumulative_times[current_lap_index]:
-
-      # Interpolate but we add an extra point where the driver has riden 0 laps
-      # at time 0. This is for a more correct interpolation
-      next_cumulative_time = driver_cumulative_times[0]
-      interpolated_lap = cumulative_time / next_cumulative_time
-
-    else:
-      # Interpolate
-      current_cumulative_time = driver_cumulative_times[current_lap_index]
-      next_cumulative_time    = driver_cumulative_times[current_lap_index + 1]
-      interpolated_lap = current_lap_index + 1 + (cumulative_time - current_cumulative_time) / \
-                                                 (next_cumulative_time - current_cumulative_time)
-
-    interpolated_laps_per_driver[driver_name].append(interpolated_lap)
-
-total_running_average_driver = []
-for i, cumulative_time in enumerate(all_cumulative_times_driver):
-  sum_driver_laps     = 0
-  sum_cumulative_time = 0
-  for driver_name, driver_interpolated_laps in interpolated_laps_per_driver.items():
-    max_index = drivers_max_cumulative_time_index[driver_name]
-
-    # We only sum the laps that the driver has actually driven
-    if i <= max_index:
-      sum_driver_laps     += driver_interpolated_laps[i]
-      sum_cumulative_time += cumulative_time
-    else:
-      sum_driver_laps     += driver_interpolated_laps[max_index]
-      sum_cumulative_time += all_cumulative_times_driver[max_index]
-
-  total_running_average_driver.append(sum_cumulative_time / sum_driver_laps)
-
-total_running_average_diff_driver = {driver : [] for driver in all_drivers}
-for driver_name in cumulative_times_per_driver:
-  for i, cumulative_time in enumerate(all_cumulative_times_driver):
-    total_running_average_diff_driver[driver_name].append(cumulative_time / interpolated_laps_per_driver[driver_name][i] -
-                                                          total_running_average_driver[i])
+import race_model
+import race_analysis
+import lap_flags
+import stage_cache
+import stage_profiler
 
 ###############
 # Plots setup #
@@ -330,15 +58,8 @@ color_palette = [
   "#2F5D9B", "#6C5E46", "#D25B88", "#5B656C", "#00B57F", "#545C46", "#866097", "#365D25",
   "#252F99", "#00CCFF", "#674E60", "#FC009C", "#92896B"]
 
-# Setup the output directory
-os.makedirs(name     = args.output_folder,
-            exist_ok = True)
-
-# Generate the docinfo file for the asciidoctor output of the Plotly plots. This
-# contains the header needed to be included in the html
-docinfo_filename = os.path.join(args.output_folder, "docinfo.html")
-with open(docinfo_filename, 'w') as docinfo_file:
-  docinfo_file.write("<script src=\"https://cdn.plot.ly/plotly-3.3.0.min.js\"></script>\n")
+# The formats of the static images of the figures
+IMAGE_FORMATS = ["png", "svg", "pdf"]
 
 ####################
 # Helper functions #
@@ -359,10 +80,21 @@ def setup_figure_layout(figure,
                        yaxis_title = y_axis_title,
                        colorway    = color_palette)
 
+def make_adoc_table(title, headers, rows):
+  # The table cells are separated by '|' so escape it in the cell text
+  lines  = [f"== {title}", "[%autowidth]", "|==="]
+  lines += [" ".join(f"|{header}" for header in headers), ""]
+  lines += [" ".join("|" + str(cell).replace("|", "\\|") for cell in row) for row in rows]
+  lines += ["|===", "", ""]
+
+  return "\n".join(lines)
+
 def make_html(adoc_title,
               info_text,
               figures,
-              filename):
+              filename,
+              profiler = stage_profiler.NO_PROFILER,
+              tables   = []):
 
   result  = f"= {adoc_title}\n"
   result += ":last-update-label!:\n"
@@ -380,450 +112,852 @@ def make_html(adoc_title,
   result += "[pass]\n"
   result += "++++\n"
 
-  for figure in figures:
-    # Extract html result to embed into html reports
-    html_div = figure.to_html(include_plotlyjs = False,
-                              full_html        = False)
+  with profiler.stage(f"Convert the figures to HTML ({adoc_title})"):
+    for figure in figures:
+      # Extract html result to embed into html reports
+      html_div = figure.to_html(include_plotlyjs = False,
+                                full_html        = False)
 
-    result += html_div + "\n"
+      result += html_div + "\n"
 
   result += "++++\n\n"
 
+  for title, headers, rows in tables:
+    result += make_adoc_table(title, headers, rows)
+
   with open(filename, "w") as file:
     file.write(result)
 
   # Generate the HTML from the Asciidoc file
-  subprocess.run(args  = ["asciidoctor", filename],
-                 check = True)
+  with profiler.stage(f"Run asciidoctor ({adoc_title})"):
+    subprocess.run(args  = ["asciidoctor", filename],
+                   check = True)
 
   # Remove the Asciidoc file
   os.remove(filename)
 
-##########################
-# Add the lap times plot #
-##########################
-hovertemplate  = "Team: %{fullData.name}<br>"
-hovertemplate += "Time: %{x:.3f} sec<br>"
-hovertemplate += "Lap time: %{y:.3f} sec<br>"
-hovertemplate += "Driver: %{customdata}"
-hovertemplate += "<extra></extra>"
-
-figure_lap_times = plotly_go.Figure()
-
-for team_name, team_lap_times in lap_times.items():
-  figure_lap_times.add_trace(plotly_go.Scatter(name          = team_name,
-                                               x             = cumulative_times[team_name],
-                                               y             = team_lap_times,
-                                               customdata    = lap_drivers[team_name],
-                                               hovertemplate = hovertemplate,
-                                               mode          = "lines"))
-
-setup_figure_layout(figure        = figure_lap_times,
-                    title         = "Lap times",
-                    x_axis_title  = "Time [sec]",
-                    y_axis_title  = "Lap time [sec]",
-                    color_palette = color_palette)
-
-##########################################
-# Add the running average lap times plot #
-##########################################
-hovertemplate  = "Team: %{fullData.name}<br>"
-hovertemplate += "Time: %{x:.3f} sec<br>"
-hovertemplate += "Average lap time: %{y:.3f} sec<br>"
-hovertemplate += "Driver: %{customdata}"
-hovertemplate += "<extra></extra>"
-
-figure_average_lap = plotly_go.Figure()
-
-for team_name, team_running_averages in running_averages.items():
-  figure_average_lap.add_trace(plotly_go.Scatter(name          = team_name,
+###############################
+# Total karting results plots #
+###############################
+def create_lap_times_figure(analysis):
+  lap_times        = analysis["lap_times"]
+  lap_drivers      = analysis["lap_drivers"]
+  cumulative_times = analysis["cumulative_times"]
+  team_lap_flags   = analysis["lap_flags"]
+  caution_windows  = analysis["caution_windows"]
+
+  hovertemplate  = "Team: %{fullData.name}<br>"
+  hovertemplate += "Time: %{x:.3f} sec<br>"
+  hovertemplate += "Lap time: %{y:.3f} sec<br>"
+  hovertemplate += "Driver: %{customdata[0]}<br>"
+  hovertemplate += "Lap type: %{customdata[1]}"
+  hovertemplate += "<extra></extra>"
+
+  figure_lap_times = plotly_go.Figure()
+
+  for team_name, team_lap_times in lap_times.items():
+    customdata = np.stack([lap_drivers[team_name],
+                           lap_flags.lap_type_names(team_lap_flags[team_name])], axis = -1)
+
+    figure_lap_times.add_trace(plotly_go.Scatter(name          = team_name,
                                                  x             = cumulative_times[team_name],
-                                                 y             = team_running_averages,
-                                                 customdata    = lap_drivers[team_name],
+                                                 y             = team_lap_times,
+                                                 customdata    = customdata,
                                                  hovertemplate = hovertemplate,
                                                  mode          = "lines"))
 
-setup_figure_layout(figure        = figure_average_lap,
-                    title         = "Running average lap times",
-                    x_axis_title  = "Time [sec]",
-                    y_axis_title  = "Average lap time [sec]",
-                    color_palette = color_palette)
-
-###############################################
-# Add the running distance to the winner plot #
-###############################################
-hovertemplate  = "Team: %{fullData.name}<br>"
-hovertemplate += "Time: %{x:.3f} sec<br>"
-hovertemplate += "Distance to winner: %{y:.3f} laps<br>"
-hovertemplate += "Driver: %{customdata}"
-hovertemplate += "<extra></extra>"
-
-figure_winner_distance = plotly_go.Figure()
-
-winner_team_name = karting_data["results"][0]["team_name"]
-for team_name, team_interpolated_laps in interpolated_laps.items():
-  max_index = teams_max_cumulative_time_index[team_name]
-
-  distance_to_winner         = []
-  drivers                    = []
-  team_cumulative_time_index = 0
-  current_driver             = lap_drivers[team_name][team_cumulative_time_index]
-  for i, cumulative_time in enumerate(all_cumulative_times[:max_index + 1]):
-    distance_to_winner.append(interpolated_laps[winner_team_name][i] - team_interpolated_laps[i])
-
-    if cumulative_time > cumulative_times[team_name][team_cumulative_time_index] and \
-       not are_floats_close(cumulative_time,
-                            cumulative_times[team_name][team_cumulative_time_index]):
-      team_cumulative_time_index += 1
-      current_driver             = lap_drivers[team_name][team_cumulative_time_index]
-
-    drivers.append(current_driver)
-
-  figure_winner_distance.add_trace(plotly_go.Scatter(name          = team_name,
-                                                     x             = all_cumulative_times[:max_index + 1],
-                                                     y             = distance_to_winner,
-                                                     customdata    = drivers,
-                                                     hovertemplate = hovertemplate,
-                                                     mode          = "lines"))
-
-setup_figure_layout(figure        = figure_winner_distance,
-                    title         = "Running distance to winner",
-                    x_axis_title  = "Time [sec]",
-                    y_axis_title  = "Distance to winner [laps]",
-                    color_palette = color_palette)
-
-###############################################
-# Add the running distance to the leader plot #
-###############################################
-hovertemplate  = "Team: %{fullData.name}<br>"
-hovertemplate += "Time: %{x:.3f} sec<br>"
-hovertemplate += "Distance to leader: %{y:.3f} laps<br>"
-hovertemplate += "Driver: %{customdata}"
-hovertemplate += "<extra></extra>"
-
-figure_leader_distance = plotly_go.Figure()
-
-for team_name, team_interpolated_laps in interpolated_laps.items():
-  max_index = teams_max_cumulative_time_index[team_name]
-
-  distance_to_leader         = []
-  drivers                    = []
-  team_cumulative_time_index = 0
-  current_driver             = lap_drivers[team_name][team_cumulative_time_index]
-  for i, cumulative_time in enumerate(all_cumulative_times[:max_index + 1]):
-    leader_team_name = team_name
-    highest_lap      = interpolated_laps[team_name][i]
-    for other_team_name, other_team_interpolated_laps in interpolated_laps.items():
-      if other_team_interpolated_laps[i] > highest_lap:
-        highest_lap = other_team_interpolated_laps[i]
-        leader_team_name = other_team_name
-
-    distance_to_leader.append(interpolated_laps[leader_team_name][i] - team_interpolated_laps[i])
-
-    if cumulative_time > cumulative_times[team_name][team_cumulative_time_index] and \
-       not are_floats_close(cumulative_time,
-                            cumulative_times[team_name][team_cumulative_time_index]):
-      team_cumulative_time_index += 1
-      current_driver             = lap_drivers[team_name][team_cumulative_time_index]
-
-    drivers.append(current_driver)
-
-  figure_leader_distance.add_trace(plotly_go.Scatter(name          = team_name,
-                                                     x             = all_cumulative_times[:max_index + 1],
-                                                     y             = distance_to_leader,
-                                                     customdata    = drivers,
-                                                     hovertemplate = hovertemplate,
-                                                     mode          = "lines"))
-
-setup_figure_layout(figure        = figure_leader_distance,
-                    title         = "Running distance to leader",
-                    x_axis_title  = "Time [sec]",
-                    y_axis_title  = "Distance to leader [laps]",
-                    color_palette = color_palette)
-
-###############################################
-# Add the running average lap times diff plot #
-###############################################
-hovertemplate  = "Team: %{fullData.name}<br>"
-hovertemplate += "Time: %{x:.3f} sec<br>"
-hovertemplate += "Diff to total average lap time: %{y:.3f} [sec]<br>"
-hovertemplate += "Driver: %{customdata}"
-hovertemplate += "<extra></extra>"
-
-figure_average_diff = plotly_go.Figure()
-
-for team_name in interpolated_laps.keys():
-  max_index = teams_max_cumulative_time_index[team_name]
-
-  drivers                    = []
-  team_cumulative_time_index = 0
-  current_driver             = lap_drivers[team_name][team_cumulative_time_index]
-  for i, cumulative_time in enumerate(all_cumulative_times[:max_index + 1]):
-    if cumulative_time > cumulative_times[team_name][team_cumulative_time_index] and \
-       not are_floats_close(cumulative_time,
-                            cumulative_times[team_name][team_cumulative_time_index]):
-      team_cumulative_time_index += 1
-      current_driver             = lap_drivers[team_name][team_cumulative_time_index]
-
-    drivers.append(current_driver)
-
-  figure_average_diff.add_trace(plotly_go.Scatter(name          = team_name,
-                                                  x             = all_cumulative_times[:max_index + 1],
-                                                  y             = total_running_average_diff[team_name][:max_index + 1],
-                                                  customdata    = drivers,
-                                                  hovertemplate = hovertemplate,
-                                                  mode          = "lines"))
-
-setup_figure_layout(figure        = figure_average_diff,
-                    title         = "Diff to total running average lap time",
-                    x_axis_title  = "Time [sec]",
-                    y_axis_title  = "Diff to total average lap time [sec]",
-                    color_palette = color_palette)
-
-#####################################
-# Add the lap times per driver plot #
-#####################################
-hovertemplate  = "Driver: %{fullData.name}<br>"
-hovertemplate += "Time: %{x:.3f} sec<br>"
-hovertemplate += "Lap time: %{y:.3f} sec<br>"
-hovertemplate += "<extra></extra>"
-
-figure_driver_lap_times = plotly_go.Figure()
-
-for driver_name, driver_lap_times in lap_per_drivers.items():
-  figure_driver_lap_times.add_trace(plotly_go.Scatter(name          = driver_name,
-                                                      x             = cumulative_times_per_driver[driver_name],
-                                                      y             = driver_lap_times,
-                                                      hovertemplate = hovertemplate,
-                                                      mode          = "lines"))
-
-setup_figure_layout(figure        = figure_driver_lap_times,
-                    title         = "Lap times",
-                    x_axis_title  = "Time [sec]",
-                    y_axis_title  = "Lap time [sec]",
-                    color_palette = color_palette)
-
-############################################################
-# Add the lap times per driver plot aligned with race time #
-############################################################
-hovertemplate  = "Driver: %{fullData.name}<br>"
-hovertemplate += "Time: %{x:.3f} sec<br>"
-hovertemplate += "Lap time: %{y:.3f} sec<br>"
-hovertemplate += "<extra></extra>"
-
-figure_driver_lap_times_aligned = plotly_go.Figure()
-
-driver_colors = {}
-driver_rank   = {}
-for i, driver_name in enumerate(all_drivers):
-  driver_rank[driver_name]   = i
-  driver_colors[driver_name] = color_palette[i]
-
-drivers_already_traced = set()
-for team_name, team_lap_times in lap_times.items():
-  team_cumulative_times = cumulative_times[team_name]
-  team_lap_drivers      = lap_drivers[team_name]
-
-  start_index = 0
-  end_index   = 0
-  driver_name = team_lap_drivers[start_index]
-  while end_index < len(team_lap_times):
-    if driver_name != team_lap_drivers[end_index] or \
-       end_index + 1 == len(team_lap_times):
-      if driver_name != "Pit":
-        show_legend = True
-        if driver_name in drivers_already_traced:
-          show_legend = False
-
-        color = driver_colors[driver_name]
-        rank  = driver_rank[driver_name]
-
-        figure_driver_lap_times_aligned.add_trace(plotly_go.Scatter(name          = driver_name,
-                                                                    x             = team_cumulative_times[start_index:end_index],
-                                                                    y             = team_lap_times[start_index:end_index],
-                                                                    hovertemplate = hovertemplate,
-                                                                    mode          = "lines",
-                                                                    line          = {"color" : color},
-                                                                    legendgroup   = driver_name,
-                                                                    legendrank    = rank,
-                                                                    showlegend    = show_legend))
-
-        drivers_already_traced.add(driver_name)
-
-      driver_name = team_lap_drivers[end_index]
-      start_index = end_index
-
-    end_index += 1
-
-setup_figure_layout(figure        = figure_driver_lap_times_aligned,
-                    title         = "Lap times aligned with the race time",
-                    x_axis_title  = "Time [sec]",
-                    y_axis_title  = "Lap time [sec]",
-                    color_palette = color_palette)
-
-#####################################################
-# Add the running average lap times per driver plot #
-#####################################################
-hovertemplate  = "Driver: %{fullData.name}<br>"
-hovertemplate += "Time: %{x:.3f} sec<br>"
-hovertemplate += "Average lap time: %{y:.3f} sec<br>"
-hovertemplate += "<extra></extra>"
-
-figure_driver_average_lap = plotly_go.Figure()
-
-for driver_name, driver_running_averages in running_averages_per_driver.items():
-  figure_driver_average_lap.add_trace(plotly_go.Scatter(name          = driver_name,
+  setup_figure_layout(figure        = figure_lap_times,
+                      title         = "Lap times",
+                      x_axis_title  = "Time [sec]",
+                      y_axis_title  = "Lap time [sec]",
+                      color_palette = color_palette)
+
+  # Shade the periods where the whole field slowed down
+  for start, end in caution_windows:
+    figure_lap_times.add_vrect(x0         = start,
+                               x1         = end,
+                               fillcolor  = "gold",
+                               opacity    = 0.3,
+                               line_width = 0)
+
+  return figure_lap_times
+
+def create_average_lap_figure(analysis):
+  lap_drivers      = analysis["lap_drivers"]
+  cumulative_times = analysis["cumulative_times"]
+  running_averages = analysis["running_averages"]
+
+  hovertemplate  = "Team: %{fullData.name}<br>"
+  hovertemplate += "Time: %{x:.3f} sec<br>"
+  hovertemplate += "Average lap time: %{y:.3f} sec<br>"
+  hovertemplate += "Driver: %{customdata}"
+  hovertemplate += "<extra></extra>"
+
+  figure_average_lap = plotly_go.Figure()
+
+  for team_name, team_running_averages in running_averages.items():
+    figure_average_lap.add_trace(plotly_go.Scatter(name          = team_name,
+                                                   x             = cumulative_times[team_name],
+                                                   y             = team_running_averages,
+                                                   customdata    = lap_drivers[team_name],
+                                                   hovertemplate = hovertemplate,
+                                                   mode          = "lines"))
+
+  setup_figure_layout(figure        = figure_average_lap,
+                      title         = "Running average lap times",
+                      x_axis_title  = "Time [sec]",
+                      y_axis_title  = "Average lap time [sec]",
+                      color_palette = color_palette)
+
+  return figure_average_lap
+
+def create_winner_distance_figure(analysis):
+  interpolated_laps               = analysis["interpolated_laps"]
+  all_cumulative_times            = analysis["all_cumulative_times"]
+  teams_max_cumulative_time_index = analysis["teams_max_cumulative_time_index"]
+  team_drivers                    = analysis["team_drivers"]
+  winner_team_name                = analysis["winner_team_name"]
+
+  hovertemplate  = "Team: %{fullData.name}<br>"
+  hovertemplate += "Time: %{x:.3f} sec<br>"
+  hovertemplate += "Distance to winner: %{y:.3f} laps<br>"
+  hovertemplate += "Driver: %{customdata}"
+  hovertemplate += "<extra></extra>"
+
+  figure_winner_distance = plotly_go.Figure()
+
+  for team_name, team_interpolated_laps in interpolated_laps.items():
+    max_index = teams_max_cumulative_time_index[team_name]
+
+    distance_to_winner = []
+    for i in range(max_index + 1):
+      distance_to_winner.append(interpolated_laps[winner_team_name][i] - team_interpolated_laps[i])
+
+    figure_winner_distance.add_trace(plotly_go.Scatter(name          = team_name,
+                                                       x             = all_cumulative_times[:max_index + 1],
+                                                       y             = distance_to_winner,
+                                                       customdata    = team_drivers[team_name],
+                                                       hovertemplate = hovertemplate,
+                                                       mode          = "lines"))
+
+  setup_figure_layout(figure        = figure_winner_distance,
+                      title         = "Running distance to winner",
+                      x_axis_title  = "Time [sec]",
+                      y_axis_title  = "Distance to winner [laps]",
+                      color_palette = color_palette)
+
+  return figure_winner_distance
+
+def create_leader_distance_figure(analysis):
+  interpolated_laps               = analysis["interpolated_laps"]
+  all_cumulative_times            = analysis["all_cumulative_times"]
+  teams_max_cumulative_time_index = analysis["teams_max_cumulative_time_index"]
+  team_drivers                    = analysis["team_drivers"]
+
+  hovertemplate  = "Team: %{fullData.name}<br>"
+  hovertemplate += "Time: %{x:.3f} sec<br>"
+  hovertemplate += "Distance to leader: %{y:.3f} laps<br>"
+  hovertemplate += "Driver: %{customdata}"
+  hovertemplate += "<extra></extra>"
+
+  figure_leader_distance = plotly_go.Figure()
+
+  # The laps of the leader at every merged cumulative time
+  leader_laps = np.max(np.array(list(interpolated_laps.values())), axis = 0)
+
+  for team_name, team_interpolated_laps in interpolated_laps.items():
+    max_index = teams_max_cumulative_time_index[team_name]
+
+    distance_to_leader = leader_laps[:max_index + 1] - np.array(team_interpolated_laps[:max_index + 1])
+
+    figure_leader_distance.add_trace(plotly_go.Scatter(name          = team_name,
+                                                       x             = all_cumulative_times[:max_index + 1],
+                                                       y             = distance_to_leader,
+                                                       customdata    = team_drivers[team_name],
+                                                       hovertemplate = hovertemplate,
+                                                       mode          = "lines"))
+
+  setup_figure_layout(figure        = figure_leader_distance,
+                      title         = "Running distance to leader",
+                      x_axis_title  = "Time [sec]",
+                      y_axis_title  = "Distance to leader [laps]",
+                      color_palette = color_palette)
+
+  return figure_leader_distance
+
+def create_average_diff_figure(analysis):
+  interpolated_laps               = analysis["interpolated_laps"]
+  all_cumulative_times            = analysis["all_cumulative_times"]
+  teams_max_cumulative_time_index = analysis["teams_max_cumulative_time_index"]
+  total_running_average_diff      = analysis["total_running_average_diff"]
+  team_drivers                    = analysis["team_drivers"]
+
+  hovertemplate  = "Team: %{fullData.name}<br>"
+  hovertemplate += "Time: %{x:.3f} sec<br>"
+  hovertemplate += "Diff to total average lap time: %{y:.3f} [sec]<br>"
+  hovertemplate += "Driver: %{customdata}"
+  hovertemplate += "<extra></extra>"
+
+  figure_average_diff = plotly_go.Figure()
+
+  for team_name in interpolated_laps.keys():
+    max_index = teams_max_cumulative_time_index[team_name]
+
+    figure_average_diff.add_trace(plotly_go.Scatter(name          = team_name,
+                                                    x             = all_cumulative_times[:max_index + 1],
+                                                    y             = total_running_average_diff[team_name][:max_index + 1],
+                                                    customdata    = team_drivers[team_name],
+                                                    hovertemplate = hovertemplate,
+                                                    mode          = "lines"))
+
+  setup_figure_layout(figure        = figure_average_diff,
+                      title         = "Diff to total running average lap time",
+                      x_axis_title  = "Time [sec]",
+                      y_axis_title  = "Diff to total average lap time [sec]",
+                      color_palette = color_palette)
+
+  return figure_average_diff
+
+def create_positions_figure(analysis):
+  cumulative_times = analysis["cumulative_times"]
+  position_times   = analysis["position_times"]
+  positions        = analysis["positions"]
+
+  hovertemplate  = "Team: %{fullData.name}<br>"
+  hovertemplate += "Time: %{x:.3f} sec<br>"
+  hovertemplate += "Position: %{y}"
+  hovertemplate += "<extra></extra>"
+
+  figure_positions = plotly_go.Figure()
+
+  for team_name, team_positions in positions.items():
+    # Keep the last position until the team finished
+    end_time = max(cumulative_times[team_name][-1], position_times[team_name][-1])
+
+    figure_positions.add_trace(plotly_go.Scatter(name          = team_name,
+                                                 x             = np.append(position_times[team_name], end_time),
+                                                 y             = np.append(team_positions, team_positions[-1]),
+                                                 hovertemplate = hovertemplate,
+                                                 mode          = "lines",
+                                                 line_shape    = "hv"))
+
+  setup_figure_layout(figure        = figure_positions,
+                      title         = "Positions",
+                      x_axis_title  = "Time [sec]",
+                      y_axis_title  = "Position",
+                      color_palette = color_palette)
+  figure_positions.update_yaxes(autorange = "reversed")
+
+  return figure_positions
+
+# Every figure with the analysis entries it uses, so a figure is only created
+# again when one of them changed
+TOTAL_FIGURES = [(create_lap_times_figure,
+                  ["lap_times", "lap_drivers", "cumulative_times", "lap_flags", "caution_windows"]),
+                 (create_average_lap_figure,
+                  ["lap_drivers", "cumulative_times", "running_averages"]),
+                 (create_winner_distance_figure,
+                  ["interpolated_laps",
+                   "all_cumulative_times",
+                   "teams_max_cumulative_time_index",
+                   "team_drivers",
+                   "winner_team_name"]),
+                 (create_leader_distance_figure,
+                  ["interpolated_laps",
+                   "all_cumulative_times",
+                   "teams_max_cumulative_time_index",
+                   "team_drivers"]),
+                 (create_average_diff_figure,
+                  ["interpolated_laps",
+                   "all_cumulative_times",
+                   "teams_max_cumulative_time_index",
+                   "total_running_average_diff",
+                   "team_drivers"]),
+                 (create_positions_figure,
+                  ["cumulative_times", "position_times", "positions"])]
+
+def create_total_figures(analysis):
+  return [create_figure(analysis) for create_figure, _ in TOTAL_FIGURES]
+
+def create_total_tables(analysis):
+  rows = [[f"{overtake['time']:.3f}",
+           overtake["lap"],
+           overtake["position"],
+           overtake["team"],
+           overtake["driver"],
+           overtake["overtaken_team"],
+           overtake["overtaken_driver"]] for overtake in analysis["overtakes"]]
+
+  caution_rows = [[f"{start:.0f}",
+                   f"{end:.0f}",
+                   f"{end - start:.0f}"] for start, end in analysis["caution_windows"]]
+
+  return [("Caution periods",
+           ["Start [sec]", "End [sec]", "Duration [sec]"],
+           caution_rows),
+          ("Overtakes",
+           ["Time [sec]", "Lap", "Position", "Team", "Driver", "Overtaken team", "Overtaken driver"],
+           rows)]
+
+################################
+# Driver karting results plots #
+################################
+def create_driver_lap_times_figure(analysis):
+  lap_per_drivers             = analysis["lap_per_drivers"]
+  cumulative_times_per_driver = analysis["cumulative_times_per_driver"]
+
+  hovertemplate  = "Driver: %{fullData.name}<br>"
+  hovertemplate += "Time: %{x:.3f} sec<br>"
+  hovertemplate += "Lap time: %{y:.3f} sec<br>"
+  hovertemplate += "<extra></extra>"
+
+  figure_driver_lap_times = plotly_go.Figure()
+
+  for driver_name, driver_lap_times in lap_per_drivers.items():
+    figure_driver_lap_times.add_trace(plotly_go.Scatter(name          = driver_name,
                                                         x             = cumulative_times_per_driver[driver_name],
-                                                        y             = driver_running_averages,
+                                                        y             = driver_lap_times,
                                                         hovertemplate = hovertemplate,
                                                         mode          = "lines"))
 
-setup_figure_layout(figure        = figure_driver_average_lap,
-                    title         = "Running average lap times",
-                    x_axis_title  = "Time [sec]",
-                    y_axis_title  = "Average lap time [sec]",
-                    color_palette = color_palette)
-
-############################################################
-# Add the running average diff with the faster driver plot #
-############################################################
-hovertemplate  = "Driver: %{fullData.name}<br>"
-hovertemplate += "Time: %{x:.3f} sec<br>"
-hovertemplate += "Diff with fastest driver: %{y:.3f} sec<br>"
-hovertemplate += "<extra></extra>"
-
-figure_fastest_driver_diff = plotly_go.Figure()
-
-fastest_driver_name = all_drivers[0]
-fastest_average     = running_averages_per_driver[fastest_driver_name][-1]
-for driver_name, driver_running_average in running_averages_per_driver.items():
-  if driver_running_average[-1] < fastest_average:
-    fastest_driver_name = driver_name
-    fastest_average     = driver_running_average[-1]
-
-for driver_name, driver_interpolated_running_averages in interpolated_running_averages_per_driver.items():
-  max_index = drivers_max_cumulative_time_index[driver_name]
-
-  diff_to_fastest_driver = []
-  for i, cumulative_time in enumerate(all_cumulative_times_driver[:max_index + 1]):
-    diff_to_fastest_driver.append(driver_interpolated_running_averages[i] -
-                                  interpolated_running_averages_per_driver[fastest_driver_name][i])
-
-  figure_fastest_driver_diff.add_trace(plotly_go.Scatter(name          = driver_name,
-                                                         x             = all_cumulative_times_driver[:max_index + 1],
-                                                         y             = diff_to_fastest_driver,
-                                                         hovertemplate = hovertemplate,
-                                                         mode          = "lines"))
-
-setup_figure_layout(figure        = figure_fastest_driver_diff,
-                    title         = "Running average diff to the fastest driver",
-                    x_axis_title  = "Time [sec]",
-                    y_axis_title  = "Diff with the fastest driver [sec]",
-                    color_palette = color_palette)
-
-###################################################################
-# Add the running average diff with the total average driver plot #
-###################################################################
-hovertemplate  = "Driver: %{fullData.name}<br>"
-hovertemplate += "Time: %{x:.3f} sec<br>"
-hovertemplate += "Diff with total average driver: %{y:.3f} sec<br>"
-hovertemplate += "<extra></extra>"
-
-figure_average_driver_diff = plotly_go.Figure()
-
-for driver_name, driver_interpolated_laps in interpolated_laps_per_driver.items():
-  max_index = drivers_max_cumulative_time_index[driver_name]
-
-  figure_average_driver_diff.add_trace(plotly_go.Scatter(name          = driver_name,
-                                                         x             = all_cumulative_times_driver[:max_index + 1],
-                                                         y             = total_running_average_diff_driver[driver_name][:max_index + 1],
-                                                         hovertemplate = hovertemplate,
-                                                         mode          = "lines"))
-
-setup_figure_layout(figure        = figure_average_driver_diff,
-                    title         = "Diff with the total running average driver",
-                    x_axis_title  = "Time [sec]",
-                    y_axis_title  = "Diff with the total average driver [sec]",
-                    color_palette = color_palette)
+  setup_figure_layout(figure        = figure_driver_lap_times,
+                      title         = "Lap times",
+                      x_axis_title  = "Time [sec]",
+                      y_axis_title  = "Lap time [sec]",
+                      color_palette = color_palette)
+
+  return figure_driver_lap_times
+
+def create_driver_lap_times_aligned_figure(analysis):
+  lap_times        = analysis["lap_times"]
+  lap_drivers      = analysis["lap_drivers"]
+  cumulative_times = analysis["cumulative_times"]
+  all_drivers      = analysis["all_drivers"]
+
+  hovertemplate  = "Driver: %{fullData.name}<br>"
+  hovertemplate += "Time: %{x:.3f} sec<br>"
+  hovertemplate += "Lap time: %{y:.3f} sec<br>"
+  hovertemplate += "<extra></extra>"
+
+  figure_driver_lap_times_aligned = plotly_go.Figure()
+
+  driver_colors = {}
+  driver_rank   = {}
+  for i, driver_name in enumerate(all_drivers):
+    driver_rank[driver_name]   = i
+    driver_colors[driver_name] = color_palette[i]
+
+  drivers_already_traced = set()
+  for team_name, team_lap_times in lap_times.items():
+    team_cumulative_times = cumulative_times[team_name]
+    team_lap_drivers      = lap_drivers[team_name]
+
+    start_index = 0
+    end_index   = 0
+    driver_name = team_lap_drivers[start_index]
+    while end_index < len(team_lap_times):
+      if driver_name != team_lap_drivers[end_index] or \
+         end_index + 1 == len(team_lap_times):
+        if driver_name != "Pit":
+          show_legend = True
+          if driver_name in drivers_already_traced:
+            show_legend = False
+
+          color = driver_colors[driver_name]
+          rank  = driver_rank[driver_name]
+
+          figure_driver_lap_times_aligned.add_trace(plotly_go.Scatter(name          = driver_name,
+                                                                      x             = team_cumulative_times[start_index:end_index],
+                                                                      y             = team_lap_times[start_index:end_index],
+                                                                      hovertemplate = hovertemplate,
+                                                                      mode          = "lines",
+                                                                      line          = {"color" : color},
+                                                                      legendgroup   = driver_name,
+                                                                      legendrank    = rank,
+                                                                      showlegend    = show_legend))
+
+          drivers_already_traced.add(driver_name)
+
+        driver_name = team_lap_drivers[end_index]
+        start_index = end_index
+
+      end_index += 1
+
+  setup_figure_layout(figure        = figure_driver_lap_times_aligned,
+                      title         = "Lap times aligned with the race time",
+                      x_axis_title  = "Time [sec]",
+                      y_axis_title  = "Lap time [sec]",
+                      color_palette = color_palette)
+
+  return figure_driver_lap_times_aligned
+
+def create_driver_average_lap_figure(analysis):
+  cumulative_times_per_driver = analysis["cumulative_times_per_driver"]
+  running_averages_per_driver = analysis["running_averages_per_driver"]
+
+  hovertemplate  = "Driver: %{fullData.name}<br>"
+  hovertemplate += "Time: %{x:.3f} sec<br>"
+  hovertemplate += "Average lap time: %{y:.3f} sec<br>"
+  hovertemplate += "<extra></extra>"
+
+  figure_driver_average_lap = plotly_go.Figure()
+
+  for driver_name, driver_running_averages in running_averages_per_driver.items():
+    figure_driver_average_lap.add_trace(plotly_go.Scatter(name          = driver_name,
+                                                          x             = cumulative_times_per_driver[driver_name],
+                                                          y             = driver_running_averages,
+                                                          hovertemplate = hovertemplate,
+                                                          mode          = "lines"))
+
+  setup_figure_layout(figure        = figure_driver_average_lap,
+                      title         = "Running average lap times",
+                      x_axis_title  = "Time [sec]",
+                      y_axis_title  = "Average lap time [sec]",
+                      color_palette = color_palette)
+
+  return figure_driver_average_lap
+
+def create_fastest_driver_diff_figure(analysis):
+  all_drivers                              = analysis["all_drivers"]
+  running_averages_per_driver              = analysis["running_averages_per_driver"]
+  all_cumulative_times_driver              = analysis["all_cumulative_times_driver"]
+  interpolated_running_averages_per_driver = analysis["interpolated_running_averages_per_driver"]
+  drivers_max_cumulative_time_index        = analysis["drivers_max_cumulative_time_index"]
+
+  hovertemplate  = "Driver: %{fullData.name}<br>"
+  hovertemplate += "Time: %{x:.3f} sec<br>"
+  hovertemplate += "Diff with fastest driver: %{y:.3f} sec<br>"
+  hovertemplate += "<extra></extra>"
+
+  figure_fastest_driver_diff = plotly_go.Figure()
+
+  fastest_driver_name = all_drivers[0]
+  fastest_average     = running_averages_per_driver[fastest_driver_name][-1]
+  for driver_name, driver_running_average in running_averages_per_driver.items():
+    if driver_running_average[-1] < fastest_average:
+      fastest_driver_name = driver_name
+      fastest_average     = driver_running_average[-1]
+
+  for driver_name, driver_interpolated_running_averages in interpolated_running_averages_per_driver.items():
+    max_index = drivers_max_cumulative_time_index[driver_name]
+
+    diff_to_fastest_driver = []
+    for i in range(max_index + 1):
+      diff_to_fastest_driver.append(driver_interpolated_running_averages[i] -
+                                    interpolated_running_averages_per_driver[fastest_driver_name][i])
+
+    figure_fastest_driver_diff.add_trace(plotly_go.Scatter(name          = driver_name,
+                                                           x             = all_cumulative_times_driver[:max_index + 1],
+                                                           y             = diff_to_fastest_driver,
+                                                           hovertemplate = hovertemplate,
+                                                           mode          = "lines"))
+
+  setup_figure_layout(figure        = figure_fastest_driver_diff,
+                      title         = "Running average diff to the fastest driver",
+                      x_axis_title  = "Time [sec]",
+                      y_axis_title  = "Diff with the fastest driver [sec]",
+                      color_palette = color_palette)
+
+  return figure_fastest_driver_diff
+
+def create_average_driver_diff_figure(analysis):
+  all_cumulative_times_driver       = analysis["all_cumulative_times_driver"]
+  drivers_max_cumulative_time_index = analysis["drivers_max_cumulative_time_index"]
+  interpolated_laps_per_driver      = analysis["interpolated_laps_per_driver"]
+  total_running_average_diff_driver = analysis["total_running_average_diff_driver"]
+
+  hovertemplate  = "Driver: %{fullData.name}<br>"
+  hovertemplate += "Time: %{x:.3f} sec<br>"
+  hovertemplate += "Diff with total average driver: %{y:.3f} sec<br>"
+  hovertemplate += "<extra></extra>"
+
+  figure_average_driver_diff = plotly_go.Figure()
+
+  for driver_name in interpolated_laps_per_driver.keys():
+    max_index = drivers_max_cumulative_time_index[driver_name]
+
+    figure_average_driver_diff.add_trace(plotly_go.Scatter(name          = driver_name,
+                                                           x             = all_cumulative_times_driver[:max_index + 1],
+                                                           y             = total_running_average_diff_driver[driver_name][:max_index + 1],
+                                                           hovertemplate = hovertemplate,
+                                                           mode          = "lines"))
+
+  setup_figure_layout(figure        = figure_average_driver_diff,
+                      title         = "Diff with the total running average driver",
+                      x_axis_title  = "Time [sec]",
+                      y_axis_title  = "Diff with the total average driver [sec]",
+                      color_palette = color_palette)
+
+  return figure_average_driver_diff
+
+def create_stint_rolling_average_figure(analysis):
+  cumulative_times  = analysis["cumulative_times"]
+  all_drivers       = analysis["all_drivers"]
+  rolling_lap_means = analysis["rolling_lap_means"]
+  rolling_lap_stds  = analysis["rolling_lap_stds"]
+  stint_metrics     = analysis["stint_metrics"]
+
+  hovertemplate  = "Driver: %{fullData.name}<br>"
+  hovertemplate += "Time: %{x:.3f} sec<br>"
+  hovertemplate += "Rolling average: %{y:.3f} sec<br>"
+  hovertemplate += "Rolling standard deviation: %{customdata:.3f} sec"
+  hovertemplate += "<extra></extra>"
+
+  figure_stint_rolling_average = plotly_go.Figure()
+
+  drivers_already_traced = set()
+  for stint in stint_metrics:
+    driver_name = stint["driver"]
+    team_name   = stint["team"]
+    first_index = stint["first_lap"] - 1
+    end_index   = first_index + stint["laps"]
+    rank        = all_drivers.index(driver_name)
+
+    figure_stint_rolling_average.add_trace(plotly_go.Scatter(name          = driver_name,
+                                                             x             = cumulative_times[team_name][first_index:end_index],
+                                                             y             = rolling_lap_means[team_name][first_index:end_index],
+                                                             customdata    = rolling_lap_stds[team_name][first_index:end_index],
+                                                             hovertemplate = hovertemplate,
+                                                             mode          = "lines",
+                                                             line          = {"color" : color_palette[rank]},
+                                                             legendgroup   = driver_name,
+                                                             legendrank    = rank,
+                                                             showlegend    = driver_name not in drivers_already_traced))
+
+    drivers_already_traced.add(driver_name)
+
+  setup_figure_layout(figure        = figure_stint_rolling_average,
+                      title         = "Rolling average lap time per stint",
+                      x_axis_title  = "Time [sec]",
+                      y_axis_title  = "Rolling average lap time [sec]",
+                      color_palette = color_palette)
+
+  return figure_stint_rolling_average
+
+def add_lap_distribution_traces(figure, names, histograms, densities, bin_edges, grid):
+  # Every driver or team gets a histogram and a density in the same color that
+  # are shown and hidden together. Single precision keeps the figure small with
+  # a lot of drivers
+  bin_centers = ((bin_edges[:-1] + bin_edges[1:]) / 2).astype(np.float32)
+  grid        = grid.astype(np.float32)
+  histograms  = histograms.astype(np.float32)
+  densities   = densities.astype(np.float32)
+
+  hovertemplate  = "%{fullData.name}<br>"
+  hovertemplate += "Lap time: %{x:.3f} sec<br>"
+  hovertemplate += "Density: %{y:.3f}"
+  hovertemplate += "<extra></extra>"
+
+  for i, name in enumerate(names):
+    # Drivers or teams without clean laps have no distribution
+    if np.all(np.isnan(densities[i])):
+      continue
+
+    color = color_palette[i % len(color_palette)]
+
+    figure.add_trace(plotly_go.Bar(name          = name,
+                                   x             = bin_centers,
+                                   y             = histograms[i],
+                                   width         = bin_edges[1] - bin_edges[0],
+                                   hovertemplate = hovertemplate,
+                                   marker        = {"color" : color},
+                                   opacity       = 0.3,
+                                   legendgroup   = name,
+                                   legendrank    = i,
+                                   showlegend    = False))
+    figure.add_trace(plotly_go.Scatter(name          = name,
+                                       x             = grid,
+                                       y             = densities[i],
+                                       hovertemplate = hovertemplate,
+                                       mode          = "lines",
+                                       line          = {"color" : color},
+                                       legendgroup   = name,
+                                       legendrank    = i))
+
+  figure.update_layout(barmode = "overlay", bargap = 0)
+
+def create_driver_lap_distribution_figure(analysis):
+  distributions = analysis["lap_distributions"]
+
+  figure_driver_lap_distribution = plotly_go.Figure()
+
+  add_lap_distribution_traces(figure     = figure_driver_lap_distribution,
+                              names      = distributions["driver_names"],
+                              histograms = distributions["driver_histograms"],
+                              densities  = distributions["driver_densities"],
+                              bin_edges  = distributions["bin_edges"],
+                              grid       = distributions["grid"])
+
+  setup_figure_layout(figure        = figure_driver_lap_distribution,
+                      title         = "Clean lap time distribution per driver",
+                      x_axis_title  = "Lap time [sec]",
+                      y_axis_title  = "Density [1/sec]",
+                      color_palette = color_palette)
+
+  return figure_driver_lap_distribution
+
+def create_team_lap_distribution_figure(analysis):
+  distributions = analysis["lap_distributions"]
+
+  figure_team_lap_distribution = plotly_go.Figure()
+
+  add_lap_distribution_traces(figure     = figure_team_lap_distribution,
+                              names      = distributions["team_names"],
+                              histograms = distributions["team_histograms"],
+                              densities  = distributions["team_densities"],
+                              bin_edges  = distributions["bin_edges"],
+                              grid       = distributions["grid"])
+
+  setup_figure_layout(figure        = figure_team_lap_distribution,
+                      title         = "Clean lap time distribution per team",
+                      x_axis_title  = "Lap time [sec]",
+                      y_axis_title  = "Density [1/sec]",
+                      color_palette = color_palette)
+
+  return figure_team_lap_distribution
+
+def create_head_to_head_figure(analysis):
+  comparisons = analysis["head_to_head"]
+
+  hovertemplate  = "Driver: %{y}<br>"
+  hovertemplate += "Compared with: %{x}<br>"
+  hovertemplate += "Pace delta: %{z:+.3f} sec<br>"
+  hovertemplate += "Overlap: %{customdata:.0f} sec"
+  hovertemplate += "<extra></extra>"
+
+  # Negative deltas mean the driver of the row was faster while both drivers
+  # were on track, so they are green
+  figure_head_to_head = plotly_go.Figure()
+  figure_head_to_head.add_trace(plotly_go.Heatmap(x             = comparisons["driver_names"],
+                                                  y             = comparisons["driver_names"],
+                                                  z             = comparisons["pace_deltas"].astype(np.float32),
+                                                  customdata    = comparisons["overlap_durations"].astype(np.float32),
+                                                  hovertemplate = hovertemplate,
+                                                  colorscale    = "RdYlGn",
+                                                  reversescale  = True,
+                                                  zmid          = 0,
+                                                  colorbar      = {"title" : {"text" : "Pace delta [sec]"}}))
+
+  setup_figure_layout(figure        = figure_head_to_head,
+                      title         = "Head-to-head pace delta while on track together",
+                      x_axis_title  = "Compared with",
+                      y_axis_title  = "Driver",
+                      color_palette = color_palette)
+  figure_head_to_head.update_yaxes(autorange = "reversed")
+
+  return figure_head_to_head
+
+DRIVER_FIGURES = [(create_driver_lap_times_figure,
+                   ["lap_per_drivers", "cumulative_times_per_driver"]),
+                  (create_driver_average_lap_figure,
+                   ["cumulative_times_per_driver", "running_averages_per_driver"]),
+                  (create_driver_lap_times_aligned_figure,
+                   ["lap_times", "lap_drivers", "cumulative_times", "all_drivers"]),
+                  (create_fastest_driver_diff_figure,
+                   ["all_drivers",
+                    "running_averages_per_driver",
+                    "all_cumulative_times_driver",
+                    "interpolated_running_averages_per_driver",
+                    "drivers_max_cumulative_time_index"]),
+                  (create_average_driver_diff_figure,
+                   ["all_cumulative_times_driver",
+                    "drivers_max_cumulative_time_index",
+                    "interpolated_laps_per_driver",
+                    "total_running_average_diff_driver"]),
+                  (create_stint_rolling_average_figure,
+                   ["cumulative_times",
+                    "all_drivers",
+                    "rolling_lap_means",
+                    "rolling_lap_stds",
+                    "stint_metrics"]),
+                  (create_driver_lap_distribution_figure,
+                   ["lap_distributions"]),
+                  (create_team_lap_distribution_figure,
+                   ["lap_distributions"]),
+                  (create_head_to_head_figure,
+                   ["head_to_head"])]
+
+def create_driver_figures(analysis):
+  return [create_figure(analysis) for create_figure, _ in DRIVER_FIGURES]
+
+def create_driver_tables(analysis):
+  rows = [[stint["team"],
+           stint["driver"],
+           stint["first_lap"],
+           stint["laps"],
+           stint["clean_laps"],
+           f"{stint['average']:.3f}",
+           f"{stint['standard_deviation']:.3f}",
+           f"{stint['best_rolling']:.3f}",
+           f"{stint['drift']:+.4f}"] for stint in analysis["stint_metrics"]]
+
+  return [("Stints",
+           ["Team", "Driver", "First lap", "Laps", "Clean laps", "Average lap [sec]",
+            "Standard deviation [sec]", "Best rolling average [sec]", "Drift [sec/lap]"],
+           rows)]
 
 ###########################
 # Generate the HTML files #
 ###########################
-race_name = karting_data["race_name"]
-info_text = f"These are the total karting results of the following race: {race_name}"
-make_html(adoc_title = "Total karting results",
-          info_text  = info_text,
-          figures    = [figure_lap_times,
-                        figure_average_lap,
-                        figure_winner_distance,
-                        figure_leader_distance,
-                        figure_average_diff],
-          filename   = os.path.join(args.output_folder, "total_karting_results.adoc"))
-
-info_text = f"These are the individual driver karting results of the following race: {race_name}"
-make_html(adoc_title = "Driver karting results",
-          info_text  = info_text,
-          figures    = [figure_driver_lap_times,
-                        figure_driver_average_lap,
-                        figure_driver_lap_times_aligned,
-                        figure_fastest_driver_diff,
-                        figure_average_driver_diff],
-          filename   = os.path.join(args.output_folder, "driver_karting_results.adoc"))
-
-################
-# Some cleanup #
-################
-# Remove the docinfo file
-os.remove(docinfo_filename)
+def create_figures_json(analysis, figures, cache):
+  # Every figure is cached on its own with only the analysis entries it uses
+  # in its key. The figures that an edit of the race didn't touch come from the
+  # cache
+  figures_json = []
+  for create_figure, analysis_names in figures:
+    key = [stage_cache.code_version(__file__),
+           stage_cache.hash_values({name : analysis[name] for name in analysis_names})]
+
+    figures_json.append(cache.cached(stage_name = f"figure {create_figure.__name__}",
+                                     key        = key,
+                                     compute    = lambda: create_figure(analysis).to_json()))
+
+  return figures_json
+
+def make_cached_html(adoc_title,
+                     info_text,
+                     figures_json,
+                     output_folder,
+                     profiler = stage_profiler.NO_PROFILER,
+                     cache    = stage_cache.NO_CACHE,
+                     tables   = []):
+  basename = adoc_title.lower().replace(" ", "_")
+
+  def compute():
+    make_html(adoc_title = adoc_title,
+              info_text  = info_text,
+              figures    = [plotly_io.from_json(figure_json) for figure_json in figures_json],
+              filename   = os.path.join(output_folder, basename + ".adoc"),
+              profiler   = profiler,
+              tables     = tables)
+
+  key = [stage_cache.code_version(__file__),
+         adoc_title,
+         info_text,
+         figures_json,
+         tables]
+
+  cache.cached_file(stage_name      = "report",
+                    key             = key,
+                    output_filename = os.path.join(output_folder, basename + ".html"),
+                    compute         = compute)
+
+def generate_html_reports(analysis,
+                          output_folder,
+                          profiler = stage_profiler.NO_PROFILER,
+                          cache    = stage_cache.NO_CACHE):
+  # Setup the output directory
+  os.makedirs(name     = output_folder,
+              exist_ok = True)
+
+  # Generate the docinfo file for the asciidoctor output of the Plotly plots.
+  # This contains the header needed to be included in the html
+  docinfo_filename = os.path.join(output_folder, "docinfo.html")
+  with open(docinfo_filename, 'w') as docinfo_file:
+    docinfo_file.write("<script src=\"https://cdn.plot.ly/plotly-3.3.0.min.js\"></script>\n")
+
+  with profiler.stage("Add the total karting results plots"):
+    total_figures_json = create_figures_json(analysis       = analysis,
+                                             figures        = TOTAL_FIGURES,
+                                             cache          = cache)
+
+  with profiler.stage("Add the driver karting results plots"):
+    driver_figures_json = create_figures_json(analysis       = analysis,
+                                              figures        = DRIVER_FIGURES,
+                                              cache          = cache)
+
+  race_name = analysis["race_name"]
+  info_text = f"These are the total karting results of the following race: {race_name}"
+  make_cached_html(adoc_title    = "Total karting results",
+                   info_text     = info_text,
+                   figures_json  = total_figures_json,
+                   output_folder = output_folder,
+                   profiler      = profiler,
+                   cache         = cache,
+                   tables        = create_total_tables(analysis))
+
+  info_text = f"These are the individual driver karting results of the following race: {race_name}"
+  make_cached_html(adoc_title    = "Driver karting results",
+                   info_text     = info_text,
+                   figures_json  = driver_figures_json,
+                   output_folder = output_folder,
+                   profiler      = profiler,
+                   cache         = cache,
+                   tables        = create_driver_tables(analysis))
+
+  ################
+  # Some cleanup #
+  ################
+  # Remove the docinfo file
+  os.remove(docinfo_filename)
+
+############################
+# Export the static images #
+############################
+class ImageRenderer:
+  # One kaleido renderer that stays open for all the images of all the races,
+  # instead of starting a browser for every image
+  def __enter__(self):
+    # Kaleido is only needed for the static images so only import it when they
+    # are requested
+    import kaleido
+
+    self.kaleido = kaleido
+    self.kaleido.start_sync_server(silence_warnings = True)
+    return self
+
+  def __exit__(self, *exc_info):
+    self.kaleido.stop_sync_server(silence_warnings = True)
+
+  def write(self, figure_json, filename):
+    plotly_io.write_image(fig  = plotly_io.from_json(figure_json),
+                          file = filename)
+
+def figure_name(create_figure):
+  # The name of the image of a figure, like lap_times for
+  # create_lap_times_figure
+  return create_figure.__name__.removeprefix("create_").removesuffix("_figure")
+
+def generate_static_images(analysis,
+                           output_folder,
+                           renderer,
+                           formats  = IMAGE_FORMATS,
+                           profiler = stage_profiler.NO_PROFILER,
+                           cache    = stage_cache.NO_CACHE):
+  # Every figure of both reports in every format in a folder per report. The
+  # figures are the cached figures of the HTML reports and an image is only
+  # rendered again when its figure changed
+  for adoc_title, figures in [("Total karting results",  TOTAL_FIGURES),
+                              ("Driver karting results", DRIVER_FIGURES)]:
+    report_folder = os.path.join(output_folder, adoc_title.lower().replace(" ", "_"))
+    os.makedirs(name     = report_folder,
+                exist_ok = True)
+
+    with profiler.stage(f"Create the figures ({adoc_title})"):
+      figures_json = create_figures_json(analysis = analysis,
+                                         figures  = figures,
+                                         cache    = cache)
+
+    with profiler.stage(f"Render the images ({adoc_title})"):
+      for (create_figure, _), figure_json in zip(figures, figures_json):
+        for image_format in formats:
+          filename = os.path.join(report_folder, f"{figure_name(create_figure)}.{image_format}")
+          key      = [stage_cache.code_version(__file__),
+                      figure_json,
+                      image_format]
+
+          cache.cached_file(stage_name      = "image",
+                            key             = key,
+                            output_filename = filename,
+                            compute         = lambda: renderer.write(figure_json, filename))
 
 ###############################
 # Generate the bar-chart-race #
 ###############################
-number_of_points = 120
-
-# Setup the initial team order
-initial_team_order = [team_name for team_name in interpolated_laps.keys()]
-initial_team_order.sort(key     = lambda team_name: interpolated_laps[team_name][0],
-                        reverse = True)
-
-# Add the starting lap of 0 to all the interpolated data
-all_cumulative_times.insert(0, 0)
-for team_name in interpolated_laps.keys():
-  interpolated_laps[team_name].insert(0, 0)
-
-# Create the display data with equidistant points
-# We insert a very small start value so the bars show up at the start
-interpolated_laps_display = {team_name : [1e-6] for team_name in initial_team_order}
-cumulative_times_display  = np.linspace(start = 0,
-                                        stop  = all_cumulative_times[-1],
-                                        num   = number_of_points)
-for team_name, team_interpolated_laps in interpolated_laps.items():
-
-  current_index = 0
-  for cumulative_time in cumulative_times_display[1:]:
-
-    while current_index + 1 < len(all_cumulative_times) and \
-        all_cumulative_times[current_index + 1] < cumulative_time:
-      current_index += 1
-
-    # Interpolate
-    current_lap             = team_interpolated_laps[current_index]
-    next_lap                = team_interpolated_laps[current_index + 1]
-    current_cumulative_time = all_cumulative_times[current_index]
-    next_cumulative_time    = all_cumulative_times[current_index + 1]
-    interpolated_lap = current_lap + \
-                       (cumulative_time - current_cumulative_time) * \
-                       (next_lap - current_lap) / \
-                       (next_cumulative_time - current_cumulative_time)
-    interpolated_laps_display[team_name].append(interpolated_lap)
-
-bar_chart_race_data = pandas.DataFrame(data  = interpolated_laps_display,
-                                       index = cumulative_times_display)
-
 def get_bar_text(current_lap, team_name, lap_drivers):
   lap_index = int(current_lap)
 
-  if are_floats_close(current_lap, lap_index):
+  if race_analysis.are_floats_close(current_lap, lap_index):
     lap_index -= 1
 
   lap_index = max(lap_index, 0)
@@ -831,12 +965,81 @@ def get_bar_text(current_lap, team_name, lap_drivers):
 
   return f"{current_lap:.2f}\n{lap_drivers[team_name][lap_index]}"
 
-bar_chart_race.bar_chart_race(df                 = bar_chart_race_data,
-                              filename           = os.path.join(args.output_folder, "bar_chart_race.mp4"),
-                              title              = "Race results",
-                              tick_template      = "{x:.2f}",
-                              tick_label         = "Total laps [laps]",
-                              bar_texttemplate   = get_bar_text,
-                              customdata         = lap_drivers,
-                              interpolate_period = True,
-                              period_template    = "Time: {x:.0f} sec")
+def generate_bar_chart_race(analysis,
+                            output_folder,
+                            number_of_points = 120,
+                            profiler         = stage_profiler.NO_PROFILER,
+                            cache            = stage_cache.NO_CACHE):
+  os.makedirs(name     = output_folder,
+              exist_ok = True)
+
+  def compute():
+    # The bar_chart_race package comes from the external repo so only import
+    # it when the video is requested
+    import bar_chart_race
+
+    with profiler.stage("Calculate the bar-chart-race data"):
+      cumulative_times_display, interpolated_laps_display = \
+        race_analysis.calculate_display_laps(analysis         = analysis,
+                                             number_of_points = number_of_points)
+
+      bar_chart_race_data = pandas.DataFrame(data  = interpolated_laps_display,
+                                             index = cumulative_times_display)
+
+    profiler.start("Generate the bar-chart-race")
+    bar_chart_race.bar_chart_race(df                 = bar_chart_race_data,
+                                  filename           = os.path.join(output_folder, "bar_chart_race.mp4"),
+                                  title              = "Race results",
+                                  tick_template      = "{x:.2f}",
+                                  tick_label         = "Total laps [laps]",
+                                  bar_texttemplate   = get_bar_text,
+                                  customdata         = analysis["lap_drivers"],
+                                  interpolate_period = True,
+                                  period_template    = "Time: {x:.0f} sec")
+    profiler.stop()
+
+  key = [stage_cache.code_version(__file__),
+         analysis["timeline_digest"],
+         number_of_points]
+
+  cache.cached_file(stage_name      = "video",
+                    key             = key,
+                    output_filename = os.path.join(output_folder, "bar_chart_race.mp4"),
+                    compute         = compute)
+
+################
+# Main program #
+################
+if __name__ == "__main__":
+  parser = argparse.ArgumentParser(description = "Analyse the karting data and " +
+                                                 "generate plots.")
+
+  parser.add_argument("-i", "--input",
+                      required = True,
+                      help     = "The input YAML file containing all the karting data")
+  parser.add_argument("-o", "--output_folder",
+                      required = True,
+                      help     = "The output directory where the plots will be created")
+  stage_profiler.add_profile_arguments(parser)
+  stage_cache.add_cache_arguments(parser)
+
+  args = parser.parse_args()
+
+  profiler = stage_profiler.create_profiler(args)
+  cache    = stage_cache.create_cache(args)
+
+  with profiler.stage("data parsing"):
+    race = race_model.load_race(args.input, cache)
+
+  analysis = race_analysis.analyse_race(race, profiler, cache)
+
+  generate_html_reports(analysis      = analysis,
+                        output_folder = args.output_folder,
+                        profiler      = profiler,
+                        cache         = cache)
+  generate_bar_chart_race(analysis      = analysis,
+                          output_folder = args.output_folder,
+                          profiler      = profiler,
+                          cache         = cache)
+
+  profiler.write_report(os.path.join(args.output_folder, "profile_report.json"))
@@ -0,0 +1,471 @@
+import numpy as np
+import scipy.optimize as optimize
+import scipy.sparse as sparse
+
+import os
+import time
+import heapq
+import json
+import itertools
+import argparse
+import concurrent.futures
+import yaml
+
+import race_archive
+
+DEFAULT_RESTARTS = 1000
+
+# A swap has to lower the standard deviation by more than this to count as an
+# improvement, so swapping two equal karters never loops
+IMPROVEMENT_TOLERANCE = 1e-12
+
+# The cost of the team positions a karter doesn't want in the random starting
+# assignment
+UNWANTED_COST = 1e9
+
+# The exact solver enumerates every possible team, so it is only used for the
+# groups up to this many karters. It stops when the best groups are within the
+# tolerance of the lower bound or when the time limit is reached
+EXACT_MAX_KARTERS  = 40
+EXACT_TOLERANCE    = 1e-4
+DEFAULT_TIME_LIMIT = 10.0
+SOLVERS            = ["auto", "exact", "heuristic"]
+
+# The status of scipy.optimize.milp for a problem without a solution
+MILP_INFEASIBLE = 2
+
+####################
+# Helper functions #
+####################
+def load_config(filename):
+  with open(filename, 'r') as config_file:
+    return yaml.safe_load(config_file)
+
+def load_ratings(results_folder, database_filename):
+  # The driver ratings of the archive with the new races added
+  database = race_archive.load_database(database_filename)
+  race_archive.update_database(database, results_folder)
+  race_archive.save_database(database, database_filename)
+
+  ratings, circuit_references = race_archive.calculate_ratings(database)
+
+  return ratings, circuit_references, race_archive.latest_circuit(database)
+
+def create_karters(config, ratings, circuit_reference):
+  # The karters of the balancer like in kart_info.hpp. The average lap comes
+  # from the ratings of the archive unless the config gives one
+  karters = []
+  for karter in config["karters"]:
+    average_lap = karter.get("average_lap")
+    if average_lap is None:
+      if karter["name"] not in ratings:
+        raise ValueError(f"Karter {karter['name']} has no races in the archive, " +
+                         "give an average_lap in the config")
+
+      average_lap = ratings[karter["name"]]["rating"] * circuit_reference
+
+    karters.append({"name"                : karter["name"],
+                    "average_lap"         : float(average_lap),
+                    "race_effort"         : float(karter.get("race_effort", 1.0)),
+                    "group"               : int(karter.get("group", 0)),
+                    "unwanted_team_sizes" : list(karter.get("unwanted_team_sizes", []))})
+
+  return karters
+
+def check_group_sizes(group_sizes, karters):
+  for group_number, team_sizes in enumerate(group_sizes):
+    total_karters = sum(karter["group"] == group_number for karter in karters)
+    if total_karters != sum(team_sizes):
+      raise ValueError(f"{total_karters} karters are in karting group {group_number} " +
+                       f"while {sum(team_sizes)} karters are expected")
+
+def team_average_laps(average_laps, race_efforts, teams, number_of_teams):
+  # The race effort is used as a weight for the average lap time of a team.
+  # Teams is an array of assignments with the team of every karter
+  rows = np.arange(teams.shape[0])[:, np.newaxis] * number_of_teams
+
+  weights = np.bincount((rows + teams).ravel(),
+                        weights   = np.broadcast_to(race_efforts, teams.shape).ravel(),
+                        minlength = teams.shape[0] * number_of_teams)
+  rates   = np.bincount((rows + teams).ravel(),
+                        weights   = np.broadcast_to(race_efforts / average_laps, teams.shape).ravel(),
+                        minlength = teams.shape[0] * number_of_teams)
+
+  return weights.reshape(-1, number_of_teams), rates.reshape(-1, number_of_teams)
+
+def group_costs(team_averages):
+  # The standard deviation of the average lap times of the teams
+  return np.std(team_averages, axis = -1)
+
+#####################
+# Swap local search #
+#####################
+def random_assignments(team_sizes, is_allowed, restarts, rng):
+  # Random valid starting assignments. Every karter gets a random cost for every
+  # team position and the cheapest assignment respects the unwanted team sizes
+  position_teams = np.repeat(np.arange(len(team_sizes)), team_sizes)
+
+  teams = np.empty((restarts, len(position_teams)), dtype = np.int64)
+  for restart in range(restarts):
+    costs = rng.random((len(position_teams), len(position_teams))) + \
+            UNWANTED_COST * ~is_allowed[:, position_teams]
+
+    karters, positions = optimize.linear_sum_assignment(costs)
+    if np.any(costs[karters, positions] >= UNWANTED_COST):
+      raise ValueError("No valid starting karter allocation found based on the preferences")
+
+    teams[restart, karters] = position_teams[positions]
+
+  return teams
+
+def improve_assignments(average_laps, race_efforts, is_allowed, teams):
+  # Best improvement swap search on all the restarts at once. Every step
+  # evaluates the swap of every pair of karters of every restart in one batch
+  # and does the best swap of every restart that still improves
+  restarts, number_of_karters = teams.shape
+  number_of_teams             = is_allowed.shape[1]
+  rates                       = race_efforts / average_laps
+  karter_indices              = np.arange(number_of_karters)
+  restart_indices             = np.arange(restarts)
+
+  is_active = np.ones(restarts, dtype = bool)
+  while np.any(is_active):
+    active_teams = teams[is_active]
+
+    team_weights, team_rates = team_average_laps(average_laps, race_efforts, active_teams, number_of_teams)
+    team_averages            = team_weights / team_rates
+    costs                    = group_costs(team_averages)
+
+    # Karter a of team A swaps with karter b of team B. The sums of the other
+    # teams don't change, so only the averages of A and B are calculated again.
+    # The averages are relative to the current mean to keep the precision
+    center    = team_averages.mean(axis = 1, keepdims = True)
+    deviation = team_averages - center
+    total     = deviation.sum(axis = 1)[:, np.newaxis, np.newaxis]
+    square    = (deviation ** 2).sum(axis = 1)[:, np.newaxis, np.newaxis]
+
+    teams_a = active_teams[:, :, np.newaxis]
+    teams_b = active_teams[:, np.newaxis, :]
+    rows    = np.arange(len(active_teams))[:, np.newaxis, np.newaxis]
+
+    weight_change = race_efforts[np.newaxis, :] - race_efforts[:, np.newaxis]
+    rate_change   = rates[np.newaxis, :] - rates[:, np.newaxis]
+
+    new_average_a = (team_weights[rows, teams_a] + weight_change) / (team_rates[rows, teams_a] + rate_change) - center[:, :, np.newaxis]
+    new_average_b = (team_weights[rows, teams_b] - weight_change) / (team_rates[rows, teams_b] - rate_change) - center[:, :, np.newaxis]
+
+    new_total  = total - deviation[rows, teams_a] - deviation[rows, teams_b] + new_average_a + new_average_b
+    new_square = square - deviation[rows, teams_a] ** 2 - deviation[rows, teams_b] ** 2 + \
+                 new_average_a ** 2 + new_average_b ** 2
+    new_costs  = np.sqrt(np.maximum(new_square / number_of_teams - (new_total / number_of_teams) ** 2, 0.0))
+
+    # Only swaps between different teams where both karters accept the size of
+    # their new team
+    is_valid = (teams_a != teams_b) & \
+               is_allowed[karter_indices[:, np.newaxis], teams_b] & \
+               is_allowed[karter_indices[np.newaxis, :], teams_a]
+    new_costs[~is_valid] = np.inf
+
+    best_swaps = np.argmin(new_costs.reshape(len(active_teams), -1), axis = 1)
+    best_costs = new_costs.reshape(len(active_teams), -1)[np.arange(len(active_teams)), best_swaps]
+    improves   = best_costs < costs - IMPROVEMENT_TOLERANCE
+
+    swap_restarts        = restart_indices[is_active][improves]
+    karters_a, karters_b = np.divmod(best_swaps[improves], number_of_karters)
+    teams[swap_restarts, karters_a], teams[swap_restarts, karters_b] = \
+      teams[swap_restarts, karters_b], teams[swap_restarts, karters_a]
+
+    is_active[restart_indices[is_active][~improves]] = False
+
+  return teams
+
+def search_group(average_laps, race_efforts, is_allowed, team_sizes, restarts, seed):
+  # A batch of restarts of the swap search. Returns the best assignment and
+  # its cost
+  rng   = np.random.default_rng(seed)
+  teams = random_assignments(team_sizes, is_allowed, restarts, rng)
+  teams = improve_assignments(average_laps, race_efforts, is_allowed, teams)
+
+  team_weights, team_rates = team_average_laps(average_laps, race_efforts, teams, len(team_sizes))
+  costs                    = group_costs(team_weights / team_rates)
+  best                     = int(np.argmin(costs))
+
+  return teams[best], float(costs[best])
+
+################
+# Exact solver #
+################
+def team_columns(average_laps, race_efforts, is_allowed, team_sizes):
+  # Every possible team of every team size with its average lap time. The
+  # teams with a karter that doesn't want the team size are left out
+  columns = []
+  for team_size in np.unique(team_sizes):
+    team_index = int(np.flatnonzero(team_sizes == team_size)[0])
+    members    = np.array(list(itertools.combinations(range(len(average_laps)), team_size)),
+                          dtype = np.int64).reshape(-1, team_size)
+    members    = members[is_allowed[members, team_index].all(axis = 1)]
+
+    averages = race_efforts[members].sum(axis = 1) / (race_efforts[members] / average_laps[members]).sum(axis = 1)
+    columns.append((team_size, members, averages))
+
+  return columns
+
+def solve_mean_interval(averages, partition, number_of_teams, low, high, is_integral, time_limit):
+  # The lower bound of the variance of the groups whose mean team average is in
+  # [low, high]. The variance is the mean square minus the square of the mean.
+  # The square of the mean lies above its chord over the interval, which makes
+  # the bound linear in the chosen teams
+  mean_constraint = optimize.LinearConstraint(averages[np.newaxis, :],
+                                              number_of_teams * low,
+                                              number_of_teams * high)
+  result          = optimize.milp(c           = (averages ** 2 - (low + high) * averages) / number_of_teams,
+                                  constraints = [partition, mean_constraint],
+                                  integrality = np.full(len(averages), int(is_integral)),
+                                  bounds      = optimize.Bounds(0, 1),
+                                  options     = {"time_limit" : max(time_limit, 0.0)})
+
+  if result.status == MILP_INFEASIBLE:
+    return np.inf, None
+
+  # A solve stopped by the time limit only proves its dual bound, or nothing
+  # when it stopped before having one
+  bound = result.mip_dual_bound if is_integral else result.fun
+  if bound is None or not np.isfinite(bound):
+    return 0.0, result.x
+
+  return float(np.sqrt(max(bound + low * high, 0.0))), result.x
+
+def exact_group(average_laps, race_efforts, is_allowed, team_sizes, teams, cost, time_limit):
+  # Split the possible means of the team averages in intervals and bound the
+  # standard deviation in every interval with a set partitioning MILP over all
+  # the possible teams. The intervals with a bound above the best groups are
+  # dropped and the others are split until the best groups are proven optimal
+  # within the tolerance. Returns the best assignment, its cost and the lower
+  # bound
+  number_of_teams = len(team_sizes)
+  columns         = team_columns(average_laps, race_efforts, is_allowed, team_sizes)
+  sizes           = np.concatenate([np.full(len(members), team_size) for team_size, members, _ in columns])
+  averages        = np.concatenate([column_averages for _, _, column_averages in columns])
+  unique_sizes    = np.unique(team_sizes)
+
+  # Every karter is in exactly one team and every team size is used as often as
+  # in the team sizes
+  karter_rows   = np.concatenate([members.ravel() for _, members, _ in columns])
+  member_counts = np.concatenate([np.full(len(members), members.shape[1]) for _, members, _ in columns])
+  column_rows   = np.repeat(np.arange(len(averages)), member_counts)
+  size_rows     = len(average_laps) + np.searchsorted(unique_sizes, sizes)
+  matrix        = sparse.csr_matrix((np.ones(len(karter_rows) + len(averages)),
+                                     (np.concatenate([karter_rows, size_rows]),
+                                      np.concatenate([column_rows, np.arange(len(averages))]))),
+                                    shape = (len(average_laps) + len(unique_sizes), len(averages)))
+  totals        = np.concatenate([np.ones(len(average_laps)),
+                                  [np.count_nonzero(team_sizes == team_size) for team_size in unique_sizes]])
+  partition     = optimize.LinearConstraint(matrix, totals, totals)
+
+  deadline      = time.perf_counter() + time_limit
+  intervals     = [(0.0, float(averages.min()), float(averages.max()))]
+  closed_bounds = []
+  while intervals and time.perf_counter() < deadline:
+    bound, low, high = heapq.heappop(intervals)
+    if bound >= cost - EXACT_TOLERANCE:
+      closed_bounds.append(bound)
+      continue
+
+    # The LP relaxation drops most of the intervals without solving the MILP.
+    # Wide intervals are split first because their chord is too loose. The
+    # bound of an interval is never below the bound of the interval it was
+    # split from
+    interval_bound = bound
+    bound, _       = solve_mean_interval(averages, partition, number_of_teams, low, high, False,
+                                         deadline - time.perf_counter())
+    bound          = max(bound, interval_bound)
+    if bound >= cost - EXACT_TOLERANCE:
+      closed_bounds.append(bound)
+      continue
+
+    if high - low <= 2 * cost:
+      bound, chosen = solve_mean_interval(averages, partition, number_of_teams, low, high, True,
+                                          deadline - time.perf_counter())
+      bound         = max(bound, interval_bound)
+      if chosen is not None:
+        chosen_columns = np.flatnonzero(chosen > 0.5)
+        chosen_cost    = float(np.std(averages[chosen_columns]))
+        if chosen_cost < cost:
+          teams, cost = columns_to_teams(columns, sizes, team_sizes, chosen_columns, len(average_laps)), chosen_cost
+
+      if bound >= cost - EXACT_TOLERANCE:
+        closed_bounds.append(bound)
+        continue
+
+    middle = (low + high) / 2
+    heapq.heappush(intervals, (bound, low, middle))
+    heapq.heappush(intervals, (bound, middle, high))
+
+  lower_bound = min([bound for bound, _, _ in intervals] + closed_bounds + [cost])
+
+  return teams, cost, lower_bound
+
+def columns_to_teams(columns, sizes, team_sizes, chosen_columns, number_of_karters):
+  # The team of every karter for the chosen teams. The chosen teams of every
+  # size get the team indices of that size in order
+  members    = [column_members for _, column_members, _ in columns]
+  offsets    = np.cumsum([0] + [len(column_members) for column_members in members])
+  next_teams = {int(team_size) : list(np.flatnonzero(team_sizes == team_size)) for team_size in np.unique(team_sizes)}
+
+  teams = np.empty(number_of_karters, dtype = np.int64)
+  for column in chosen_columns:
+    column_index = int(np.searchsorted(offsets, column, side = "right")) - 1
+    team_index   = next_teams[int(sizes[column])].pop(0)
+    teams[members[column_index][column - offsets[column_index]]] = team_index
+
+  return teams
+
+##################
+# Group balancer #
+##################
+def balance_groups(group_sizes,
+                   karters,
+                   restarts   = DEFAULT_RESTARTS,
+                   workers    = None,
+                   seed       = None,
+                   solver     = "auto",
+                   time_limit = DEFAULT_TIME_LIMIT):
+  # Balance the teams of every group. The restarts are split in batches over
+  # the worker processes and the best assignment of all the batches wins. The
+  # exact solver starts from the best assignment of the swap search, so the
+  # swap search is the fallback for the groups that are too large
+  check_group_sizes(group_sizes, karters)
+
+  workers = workers or os.cpu_count()
+  batches = np.array_split(np.arange(restarts), workers)
+  seeds   = np.random.SeedSequence(seed).spawn(len(group_sizes) * len(batches))
+  results = []
+
+  with concurrent.futures.ProcessPoolExecutor(max_workers = workers) as executor:
+    futures = []
+    for group_number, team_sizes in enumerate(group_sizes):
+      group_karters = [karter for karter in karters if karter["group"] == group_number]
+
+      average_laps = np.array([karter["average_lap"] for karter in group_karters])
+      race_efforts = np.array([karter["race_effort"] for karter in group_karters])
+      is_allowed   = np.array([[team_size not in karter["unwanted_team_sizes"] for team_size in team_sizes]
+                               for karter in group_karters], dtype = bool).reshape(len(group_karters), len(team_sizes))
+
+      group_futures = [executor.submit(search_group,
+                                       average_laps,
+                                       race_efforts,
+                                       is_allowed,
+                                       np.array(team_sizes),
+                                       len(batch),
+                                       seeds[group_number * len(batches) + batch_index])
+                       for batch_index, batch in enumerate(batches) if len(batch) > 0]
+      futures.append((group_karters, average_laps, race_efforts, is_allowed, team_sizes, group_futures))
+
+    for group_number, (group_karters, average_laps, race_efforts, is_allowed, team_sizes, group_futures) in enumerate(futures):
+      teams, cost = min((future.result() for future in group_futures), key = lambda result: result[1])
+
+      lower_bound = None
+      if solver == "exact" or (solver == "auto" and len(group_karters) <= EXACT_MAX_KARTERS):
+        teams, cost, lower_bound = exact_group(average_laps = average_laps,
+                                               race_efforts = race_efforts,
+                                               is_allowed   = is_allowed,
+                                               team_sizes   = np.array(team_sizes),
+                                               teams        = teams,
+                                               cost         = cost,
+                                               time_limit   = time_limit)
+
+      results.append(group_result(group_number, group_karters, average_laps, race_efforts,
+                                  team_sizes, teams, cost, lower_bound))
+
+  return results
+
+def group_result(group_number, group_karters, average_laps, race_efforts, team_sizes, teams, cost, lower_bound):
+  team_weights, team_rates = team_average_laps(average_laps, race_efforts, teams[np.newaxis, :], len(team_sizes))
+  team_averages            = (team_weights / team_rates)[0]
+
+  # Without a lower bound the groups come from the swap search and their
+  # quality is unknown
+  return {"group"              : group_number,
+          "standard_deviation" : cost,
+          "lower_bound"        : lower_bound,
+          "is_optimal"         : lower_bound is not None and cost - lower_bound <= EXACT_TOLERANCE,
+          "teams"              : [{"karters"     : [karter["name"] for karter, team in zip(group_karters, teams)
+                                                    if team == team_index],
+                                   "average_lap" : float(team_averages[team_index])}
+                                  for team_index in range(len(team_sizes))]}
+
+################
+# Main program #
+################
+if __name__ == "__main__":
+  parser = argparse.ArgumentParser(description = "Balance the karters over teams of equal " +
+                                                 "pace with their pace from the results archive.")
+
+  parser.add_argument("-i", "--input",
+                      required = True,
+                      help     = "The YAML file with the group sizes and the karters")
+  parser.add_argument("-o", "--output",
+                      help = "The output YAML or JSON file with the balanced groups. " +
+                             "The groups are printed when no output is given")
+  parser.add_argument("-r", "--results_folder",
+                      default = race_archive.DEFAULT_RESULTS_FOLDER,
+                      help    = "The results folder with a folder per year and per race")
+  parser.add_argument("-d", "--database",
+                      default = race_archive.DEFAULT_DATABASE,
+                      help    = "The YAML file with the paces of every race")
+  parser.add_argument("-c", "--circuit",
+                      help = "The circuit of the average lap times. The default is the " +
+                             "circuit in the config or else the circuit of the latest race")
+  parser.add_argument("-n", "--restarts",
+                      type    = int,
+                      default = DEFAULT_RESTARTS,
+                      help    = "The number of random restarts of the swap search")
+  parser.add_argument("-j", "--workers",
+                      type = int,
+                      help = "The number of worker processes. The default is the number of CPUs")
+  parser.add_argument("-s", "--seed",
+                      type = int,
+                      help = "The seed of the random restarts")
+  parser.add_argument("--solver",
+                      choices = SOLVERS,
+                      default = "auto",
+                      help    = "The exact solver proves the groups optimal or gives a " +
+                                "lower bound. The auto solver only uses it for groups up " +
+                                f"to {EXACT_MAX_KARTERS} karters and else keeps the swap search")
+  parser.add_argument("--time_limit",
+                      type    = float,
+                      default = DEFAULT_TIME_LIMIT,
+                      help    = "The time limit in seconds of the exact solver for every group")
+
+  args = parser.parse_args()
+
+  config = load_config(args.input)
+
+  ratings, circuit_references, latest_circuit = load_ratings(args.results_folder, args.database)
+
+  circuit = args.circuit or config.get("circuit") or latest_circuit
+  if circuit not in circuit_references:
+    parser.error(f"No races on circuit {circuit}, the circuits are " +
+                 ", ".join(sorted(circuit_references)))
+
+  karters = create_karters(config, ratings, circuit_references[circuit])
+  groups  = balance_groups(group_sizes = config["group_sizes"],
+                           karters     = karters,
+                           restarts    = args.restarts,
+                           workers     = args.workers,
+                           seed        = args.seed,
+                           solver      = args.solver,
+                           time_limit  = args.time_limit)
+
+  result = {"circuit" : circuit,
+            "karters" : karters,
+            "groups"  : groups}
+
+  if args.output is None:
+    print(yaml.safe_dump(result, sort_keys = False, allow_unicode = True), end = "")
+  elif args.output.endswith(".json"):
+    with open(args.output, 'w') as output_file:
+      json.dump(result, output_file, indent = 2, ensure_ascii = False)
+  else:
+    with open(args.output, 'w') as output_file:
+      yaml.safe_dump(result, output_file, sort_keys = False, allow_unicode = True)
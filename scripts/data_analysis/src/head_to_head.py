@@ -0,0 +1,215 @@
+import numpy as np
+
+import argparse
+
+import race_model
+import lap_flags
+import caution_windows
+
+# Two drivers are only compared in the driver matrix when they were on track
+# at the same time for at least this many seconds
+MIN_OVERLAP = 60.0
+
+####################
+# Helper functions #
+####################
+def clean_driver_laps(race, team_lap_flags):
+  # The clean laps of all the drivers in one array with the start and end time
+  # of every lap. Returns the driver names and the lap arrays
+  driver_names = race_model.race_driver_names(race)
+  driver_index = {name : index for index, name in enumerate(driver_names)}
+  driver_codes = np.array([driver_index.get(name, -1) for name in race.drivers], dtype = np.int64)
+
+  lap_ends    = np.concatenate([race_model.cumulative_times(team) for team in race.teams])
+  lap_times   = np.concatenate([team.lap_times for team in race.teams])
+  lap_drivers = np.concatenate([team.lap_drivers for team in race.teams])
+  lap_teams   = np.repeat(np.arange(len(race.teams)), [len(team.lap_times) for team in race.teams])
+  flags       = np.concatenate([team_lap_flags[team.name] for team in race.teams])
+
+  is_clean = lap_flags.is_clean(flags) & (lap_drivers != race_model.PIT_CODE)
+
+  laps = {"index"    : np.flatnonzero(is_clean),
+          "start"    : (lap_ends - lap_times)[is_clean],
+          "end"      : lap_ends[is_clean],
+          "lap_time" : lap_times[is_clean],
+          "driver"   : driver_codes[lap_drivers[is_clean]],
+          "team"     : lap_teams[is_clean]}
+
+  return driver_names, laps
+
+def join_intervals(starts_a, ends_a, starts_b, ends_b):
+  # All the pairs of intervals of a and b that overlap. The intervals of b are
+  # sorted and don't overlap, so the intervals of b that overlap with an
+  # interval of a are one range found with two binary searches
+  first  = np.searchsorted(ends_b, starts_a, side = "right")
+  end    = np.searchsorted(starts_b, ends_a, side = "left")
+  counts = np.maximum(end - first, 0)
+
+  pair_a = np.repeat(np.arange(len(starts_a)), counts)
+  pair_b = np.repeat(first, counts) + np.arange(counts.sum()) - np.repeat(np.cumsum(counts) - counts, counts)
+
+  return pair_a, pair_b
+
+def clean_runs(laps):
+  # The runs of consecutive clean laps of the same driver. Within a run the
+  # driver covers the track continuously, so the number of laps covered in any
+  # part of the run follows from the cumulative times of the team
+  is_first      = np.ones(len(laps["index"]), dtype = bool)
+  is_first[1:]  = (laps["index"][1:] != laps["index"][:-1] + 1) | \
+                  (laps["driver"][1:] != laps["driver"][:-1]) | \
+                  (laps["team"][1:] != laps["team"][:-1])
+  run_first     = np.flatnonzero(is_first)
+  run_last      = np.append(run_first[1:], len(is_first)) - 1
+
+  return {"start"  : laps["start"][run_first],
+          "end"    : laps["end"][run_last],
+          "driver" : laps["driver"][run_first],
+          "team"   : laps["team"][run_first]}
+
+def laps_covered(race, teams, starts, ends):
+  # The interpolated number of laps every team covered between the start and
+  # the end times. The cumulative times of every team get a different offset so
+  # one interpolation handles all the teams
+  team_cumulative_times = [np.concatenate([[0.0], race_model.cumulative_times(team)]) for team in race.teams]
+  offsets               = np.arange(len(race.teams)) * (2 * max(times[-1] for times in team_cumulative_times) + 1)
+
+  keys = np.concatenate([times + offset for times, offset in zip(team_cumulative_times, offsets)])
+  laps = np.concatenate([np.arange(len(times), dtype = np.float64) for times in team_cumulative_times])
+
+  return np.interp(ends + offsets[teams], keys, laps) - np.interp(starts + offsets[teams], keys, laps)
+
+#######################
+# Driver comparisons #
+#######################
+def compare_drivers(race, team_lap_flags, driver_a, driver_b):
+  # Compare the clean laps of two drivers that were on track at the same time.
+  # Every overlap of a lap of a with a lap of b is a piece in which both
+  # drivers are in one lap. The pace of a driver is the overlap duration
+  # divided by the laps covered during it and the gap is the time a lost to b
+  driver_names, laps = clean_driver_laps(race, team_lap_flags)
+  for driver in [driver_a, driver_b]:
+    if driver not in driver_names:
+      raise ValueError(f"Driver {driver} didn't drive in the race")
+
+  driver_laps = []
+  for driver in [driver_a, driver_b]:
+    is_driver = laps["driver"] == driver_names.index(driver)
+    order     = np.argsort(laps["start"][is_driver], kind = "stable")
+    driver_laps.append({name : values[is_driver][order] for name, values in laps.items()})
+
+  laps_a, laps_b = driver_laps
+  pair_a, pair_b = join_intervals(laps_a["start"], laps_a["end"], laps_b["start"], laps_b["end"])
+
+  piece_starts = np.maximum(laps_a["start"][pair_a], laps_b["start"][pair_b])
+  piece_ends   = np.minimum(laps_a["end"][pair_a], laps_b["end"][pair_b])
+  durations    = piece_ends - piece_starts
+  lap_times_a  = laps_a["lap_time"][pair_a]
+  lap_times_b  = laps_b["lap_time"][pair_b]
+
+  overlap_duration = float(durations.sum())
+  with np.errstate(invalid = "ignore", divide = "ignore"):
+    pace_a = overlap_duration / float(np.sum(durations / lap_times_a))
+    pace_b = overlap_duration / float(np.sum(durations / lap_times_b))
+
+  return {"driver_a"         : driver_a,
+          "driver_b"         : driver_b,
+          "overlap_duration" : overlap_duration,
+          "pace_a"           : pace_a,
+          "pace_b"           : pace_b,
+          "pace_delta"       : pace_a - pace_b,
+          "times"            : piece_ends,
+          "gaps"             : np.cumsum(durations * (lap_times_a / lap_times_b - 1))}
+
+def compare_all_drivers(race, team_lap_flags):
+  # The pace delta and the overlap duration of every pair of drivers. All the
+  # clean runs are joined with each other in one sweep over the runs sorted on
+  # their start, so every pair of overlapping runs is found once
+  driver_names, laps = clean_driver_laps(race, team_lap_flags)
+  runs               = clean_runs(laps)
+
+  order = np.argsort(runs["start"], kind = "stable")
+  runs  = {name : values[order] for name, values in runs.items()}
+
+  # The runs that overlap with a run start after it and before its end
+  counts = np.searchsorted(runs["start"], runs["end"], side = "left") - np.arange(len(order)) - 1
+  counts = np.maximum(counts, 0)
+  pair_a = np.repeat(np.arange(len(order)), counts)
+  pair_b = pair_a + 1 + np.arange(counts.sum()) - np.repeat(np.cumsum(counts) - counts, counts)
+
+  pair_starts = np.maximum(runs["start"][pair_a], runs["start"][pair_b])
+  pair_ends   = np.minimum(runs["end"][pair_a], runs["end"][pair_b])
+  is_overlap  = (pair_ends > pair_starts) & (runs["driver"][pair_a] != runs["driver"][pair_b])
+
+  pair_a, pair_b = pair_a[is_overlap], pair_b[is_overlap]
+  pair_starts    = pair_starts[is_overlap]
+  pair_ends      = pair_ends[is_overlap]
+
+  laps_a = laps_covered(race, runs["team"][pair_a], pair_starts, pair_ends)
+  laps_b = laps_covered(race, runs["team"][pair_b], pair_starts, pair_ends)
+
+  # Every pair of runs counts for both orders of the drivers
+  number_of_drivers = len(driver_names)
+  drivers_a         = runs["driver"][pair_a]
+  drivers_b         = runs["driver"][pair_b]
+  cells             = np.concatenate([drivers_a * number_of_drivers + drivers_b,
+                                      drivers_b * number_of_drivers + drivers_a])
+  durations         = np.tile(pair_ends - pair_starts, 2)
+
+  def accumulate(weights):
+    return np.bincount(cells, weights = weights, minlength = number_of_drivers ** 2). \
+             reshape(number_of_drivers, number_of_drivers)
+
+  overlap_durations = accumulate(durations)
+  row_laps          = accumulate(np.concatenate([laps_a, laps_b]))
+  column_laps       = accumulate(np.concatenate([laps_b, laps_a]))
+
+  with np.errstate(invalid = "ignore", divide = "ignore"):
+    pace_deltas = overlap_durations / row_laps - overlap_durations / column_laps
+  pace_deltas[overlap_durations < MIN_OVERLAP] = np.nan
+
+  return {"driver_names"      : driver_names,
+          "overlap_durations" : overlap_durations,
+          "pace_deltas"       : pace_deltas}
+
+################
+# Main program #
+################
+if __name__ == "__main__":
+  parser = argparse.ArgumentParser(description = "Compare the pace of drivers that " +
+                                                 "were on track at the same time.")
+
+  parser.add_argument("-i", "--input",
+                      required = True,
+                      help     = "The input YAML file containing all the karting data")
+  parser.add_argument("-a", "--driver_a",
+                      help = "The first driver to compare, all the pairs of drivers " +
+                             "are listed when no drivers are given")
+  parser.add_argument("-b", "--driver_b",
+                      help = "The second driver to compare")
+
+  args = parser.parse_args()
+
+  race           = race_model.load_race(args.input)
+  team_lap_flags = caution_windows.classify_laps(race)[0]
+
+  if args.driver_a is not None or args.driver_b is not None:
+    if args.driver_a is None or args.driver_b is None:
+      parser.error("Give both drivers to compare")
+
+    comparison = compare_drivers(race, team_lap_flags, args.driver_a, args.driver_b)
+
+    print(f"Overlap: {comparison['overlap_duration']:.0f} sec")
+    print(f"Average lap {args.driver_a}: {comparison['pace_a']:.3f} sec")
+    print(f"Average lap {args.driver_b}: {comparison['pace_b']:.3f} sec")
+    print(f"Pace delta: {comparison['pace_delta']:+.3f} sec")
+    for time, gap in zip(comparison["times"], comparison["gaps"]):
+      print(f"{time:10.3f} sec gap {gap:+8.3f} sec")
+  else:
+    comparisons = compare_all_drivers(race, team_lap_flags)
+
+    driver_names = comparisons["driver_names"]
+    for a, b in zip(*np.nonzero(comparisons["overlap_durations"] >= MIN_OVERLAP)):
+      if a < b:
+        print(f"{driver_names[a]:<30} {driver_names[b]:<30} "
+              f"overlap {comparisons['overlap_durations'][a, b]:8.0f} sec "
+              f"pace delta {comparisons['pace_deltas'][a, b]:+7.3f} sec")
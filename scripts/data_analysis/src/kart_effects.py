@@ -0,0 +1,142 @@
+import numpy as np
+import scipy.sparse as sparse
+import scipy.sparse.linalg as sparse_linalg
+
+import os
+import argparse
+
+import race_model
+import race_archive
+import lap_flags
+import caution_windows
+
+# The offsets are pulled towards 0 with the weight of this many laps, so a
+# driver or a kart with only a few laps doesn't get an extreme offset. It also
+# splits the offset between the driver and the kart when a driver only drove
+# one kart
+RIDGE_LAPS = 5.0
+
+####################
+# Helper functions #
+####################
+def session_laps(race):
+  # The clean laps of the race with the driver name and the kart number of
+  # every lap
+  team_lap_flags = caution_windows.classify_laps(race)[0]
+
+  lap_times   = np.concatenate([team.lap_times for team in race.teams])
+  lap_drivers = np.concatenate([team.lap_drivers for team in race.teams])
+  lap_karts   = np.repeat([team.kart_number for team in race.teams], [len(team.lap_times) for team in race.teams])
+  flags       = np.concatenate([team_lap_flags[team.name] for team in race.teams])
+
+  is_driver = np.concatenate([race_model.named_driver_laps_mask(race, team) for team in race.teams])
+  is_clean  = lap_flags.is_clean(flags) & is_driver
+
+  return (lap_times[is_clean],
+          np.array(race.drivers, dtype = object)[lap_drivers[is_clean]],
+          lap_karts[is_clean])
+
+def collect_circuit_laps(results_folder):
+  # The clean laps of every circuit of the archive. Every lap gets the index of
+  # its session within the circuit
+  circuits = {}
+  for race_file in race_archive.find_race_files(results_folder):
+    filename = os.path.join(results_folder, race_file)
+    race     = race_model.parse_race(filename)
+    circuit  = race_archive.race_circuit(race, os.path.dirname(filename))
+
+    lap_times, lap_drivers, lap_karts = session_laps(race)
+    if len(lap_times) == 0:
+      continue
+
+    circuit_laps = circuits.setdefault(circuit, {"lap_times" : [],
+                                                 "drivers"   : [],
+                                                 "karts"     : [],
+                                                 "sessions"  : []})
+    circuit_laps["lap_times"].append(lap_times)
+    circuit_laps["drivers"].append(lap_drivers)
+    circuit_laps["karts"].append(lap_karts)
+    circuit_laps["sessions"].append(np.full(len(lap_times), len(circuit_laps["sessions"])))
+
+  return {circuit : {name : np.concatenate(values) for name, values in circuit_laps.items()}
+          for circuit, circuit_laps in circuits.items()}
+
+################
+# Effects fit #
+################
+def fit_effects(lap_times, drivers, karts, sessions):
+  # Fit every lap time as the median of its session plus a session offset, a
+  # driver offset and a kart offset. Every lap is a row of a sparse matrix with
+  # three ones, so the least squares fit stays cheap for all the laps of an
+  # archive
+  driver_names, driver_indices = np.unique(drivers, return_inverse = True)
+  kart_numbers, kart_indices   = np.unique(karts, return_inverse = True)
+  number_of_sessions           = int(sessions.max()) + 1
+
+  session_medians = np.array([np.median(lap_times[sessions == session]) for session in range(number_of_sessions)])
+  deviations      = lap_times - session_medians[sessions]
+
+  number_of_laps = len(lap_times)
+  columns        = np.concatenate([sessions,
+                                   number_of_sessions + driver_indices,
+                                   number_of_sessions + len(driver_names) + kart_indices])
+  rows           = np.tile(np.arange(number_of_laps), 3)
+  design         = sparse.csr_matrix((np.ones(3 * number_of_laps), (rows, columns)),
+                                     shape = (number_of_laps,
+                                              number_of_sessions + len(driver_names) + len(kart_numbers)))
+
+  solution = sparse_linalg.lsqr(design, deviations, damp = np.sqrt(RIDGE_LAPS))[0]
+
+  driver_offsets = solution[number_of_sessions:number_of_sessions + len(driver_names)]
+  kart_offsets   = solution[number_of_sessions + len(driver_names):]
+
+  # Every lap has one driver and one kart, so moving a constant between them
+  # and the sessions doesn't change the fit. The offsets are relative to the
+  # average driver and the average kart
+  driver_offsets = driver_offsets - driver_offsets.mean()
+  kart_offsets   = kart_offsets - kart_offsets.mean()
+
+  return {"reference"      : float(np.median(session_medians)),
+          "driver_names"   : driver_names.tolist(),
+          "driver_offsets" : driver_offsets,
+          "driver_laps"    : np.bincount(driver_indices, minlength = len(driver_names)),
+          "kart_numbers"   : kart_numbers.tolist(),
+          "kart_offsets"   : kart_offsets,
+          "kart_laps"      : np.bincount(kart_indices, minlength = len(kart_numbers))}
+
+def fit_archive(results_folder):
+  # The driver and kart offsets of every circuit of the archive
+  return {circuit : fit_effects(**circuit_laps)
+          for circuit, circuit_laps in collect_circuit_laps(results_folder).items()}
+
+################
+# Main program #
+################
+if __name__ == "__main__":
+  parser = argparse.ArgumentParser(description = "Estimate the pace of every kart and the " +
+                                                 "kart corrected pace of every driver.")
+
+  parser.add_argument("-r", "--results_folder",
+                      default = race_archive.DEFAULT_RESULTS_FOLDER,
+                      help    = "The results folder with a folder per year and per race")
+  parser.add_argument("-c", "--circuit",
+                      help = "Only show this circuit")
+
+  args = parser.parse_args()
+
+  for circuit, effects in fit_archive(args.results_folder).items():
+    if args.circuit is not None and circuit != args.circuit:
+      continue
+
+    print(f"Circuit {circuit} (reference lap {effects['reference']:.3f} sec)")
+
+    print("Karts:")
+    for index in np.argsort(effects["kart_offsets"]):
+      print(f"  Kart {effects['kart_numbers'][index]:<4} {effects['kart_offsets'][index]:+7.3f} sec "
+            f"({effects['kart_laps'][index]} laps)")
+
+    print("Kart corrected drivers:")
+    for index in np.argsort(effects["driver_offsets"]):
+      print(f"  {effects['driver_names'][index]:<30} "
+            f"{effects['reference'] + effects['driver_offsets'][index]:7.3f} sec "
+            f"({effects['driver_laps'][index]} laps)")
@@ -0,0 +1,166 @@
+import os
+import argparse
+
+import race_model
+import race_analysis
+import race_edits
+import generate_excel
+import generate_plots
+import stage_cache
+import stage_profiler
+
+####################
+# Command handlers #
+####################
+def run_excel(analysis, args, profiler, cache):
+  generate_excel.generate_excel(analysis = analysis,
+                                filename = args.output,
+                                profiler = profiler,
+                                cache    = cache)
+
+def run_plots(analysis, args, profiler, cache):
+  generate_plots.generate_html_reports(analysis      = analysis,
+                                       output_folder = args.output_folder,
+                                       profiler      = profiler,
+                                       cache         = cache)
+
+def run_video(analysis, args, profiler, cache):
+  generate_plots.generate_bar_chart_race(analysis      = analysis,
+                                         output_folder = args.output_folder,
+                                         profiler      = profiler,
+                                         cache         = cache)
+
+def run_images(analysis, args, profiler, cache):
+  with generate_plots.ImageRenderer() as renderer:
+    generate_plots.generate_static_images(analysis      = analysis,
+                                          output_folder = args.output_folder,
+                                          renderer      = renderer,
+                                          formats       = args.formats,
+                                          profiler      = profiler,
+                                          cache         = cache)
+
+def run_all(analysis, args, profiler, cache):
+  os.makedirs(name     = os.path.dirname(os.path.abspath(args.excel_output)),
+              exist_ok = True)
+
+  generate_excel.generate_excel(analysis = analysis,
+                                filename = args.excel_output,
+                                profiler = profiler,
+                                cache    = cache)
+  generate_plots.generate_html_reports(analysis      = analysis,
+                                       output_folder = args.output_folder,
+                                       profiler      = profiler,
+                                       cache         = cache)
+  generate_plots.generate_bar_chart_race(analysis      = analysis,
+                                         output_folder = args.output_folder,
+                                         profiler      = profiler,
+                                         cache         = cache)
+
+def get_profile_report_filename(args):
+  if args.command == "excel":
+    return os.path.splitext(args.output)[0] + "_profile.json"
+
+  return os.path.join(args.output_folder, "profile_report.json")
+
+#################
+# Input parsing #
+#################
+def create_parser():
+  parser = argparse.ArgumentParser(description = "Analyse the karting data once and " +
+                                                 "generate the requested outputs.")
+
+  subparsers = parser.add_subparsers(dest     = "command",
+                                     required = True)
+
+  parser_excel = subparsers.add_parser("excel",
+                                       help = "Generate the Excel file")
+  parser_excel.add_argument("-o", "--output",
+                            required = True,
+                            help     = "The output Excel file containing the " +
+                                       "analysed karting data")
+  parser_excel.set_defaults(handler = run_excel)
+
+  parser_plots = subparsers.add_parser("plots",
+                                       help = "Generate the HTML files with the plots")
+  parser_plots.add_argument("-o", "--output_folder",
+                            required = True,
+                            help     = "The output directory where the plots will " +
+                                       "be created")
+  parser_plots.set_defaults(handler = run_plots)
+
+  parser_video = subparsers.add_parser("video",
+                                       help = "Generate the bar-chart-race video")
+  parser_video.add_argument("-o", "--output_folder",
+                            required = True,
+                            help     = "The output directory where the video will " +
+                                       "be created")
+  parser_video.set_defaults(handler = run_video)
+
+  parser_images = subparsers.add_parser("images",
+                                        help = "Export the figures of the plots as " +
+                                               "static images")
+  parser_images.add_argument("-o", "--output_folder",
+                             required = True,
+                             help     = "The output directory where the images will " +
+                                        "be created")
+  parser_images.add_argument("-f", "--formats",
+                             nargs   = "+",
+                             choices = generate_plots.IMAGE_FORMATS,
+                             default = generate_plots.IMAGE_FORMATS,
+                             help    = "The formats of the images")
+  parser_images.set_defaults(handler = run_images)
+
+  parser_all = subparsers.add_parser("all",
+                                     help = "Generate the Excel file, the plots and " +
+                                            "the video")
+  parser_all.add_argument("-o", "--output_folder",
+                          required = True,
+                          help     = "The output directory where the plots and the " +
+                                     "video will be created")
+  parser_all.add_argument("-e", "--excel_output",
+                          help = "The output Excel file. Defaults to " +
+                                 "karting_results.xlsx in the output directory")
+  parser_all.set_defaults(handler = run_all)
+
+  for subparser in [parser_excel, parser_plots, parser_video, parser_images, parser_all]:
+    subparser.add_argument("-i", "--input",
+                           required = True,
+                           help     = "The input YAML file containing all the " +
+                                      "karting data")
+    subparser.add_argument("--edits",
+                           help = "A YAML file with lap corrections and stopped " +
+                                  "teams. Only the parts of the analysis that the " +
+                                  "edits change are calculated again")
+    stage_profiler.add_profile_arguments(subparser)
+    stage_cache.add_cache_arguments(subparser)
+
+  return parser
+
+################
+# Main program #
+################
+def main():
+  args = create_parser().parse_args()
+
+  if args.command == "all" and args.excel_output is None:
+    args.excel_output = os.path.join(args.output_folder, "karting_results.xlsx")
+
+  profiler = stage_profiler.create_profiler(args)
+  cache    = stage_cache.create_cache(args)
+
+  # The race is only parsed and analysed once for all the outputs. Stages whose
+  # inputs didn't change since the previous run come from the cache
+  with profiler.stage("data parsing"):
+    race = race_model.load_race(args.input, cache)
+
+  analysis = race_analysis.analyse_race(race, profiler, cache)
+
+  if args.edits is not None:
+    analysis = race_edits.edit_race(analysis, race_edits.load_edits(args.edits), profiler, cache)
+
+  args.handler(analysis, args, profiler, cache)
+
+  profiler.write_report(get_profile_report_filename(args))
+
+if __name__ == "__main__":
+  main()
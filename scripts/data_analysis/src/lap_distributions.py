@@ -0,0 +1,141 @@
+import numpy as np
+
+import argparse
+
+import race_model
+import lap_flags
+import caution_windows
+
+# All the histograms share the same bins between these quantiles of the clean
+# laps, so a single very slow clean lap doesn't stretch the bins of everyone
+NUMBER_OF_BINS = 60
+EDGE_QUANTILES = (0.005, 0.995)
+
+# The densities are evaluated on a fixed grid over the same range as the bins
+GRID_POINTS = 200
+
+####################
+# Helper functions #
+####################
+def shared_bin_edges(lap_times):
+  if len(lap_times) == 0:
+    return np.linspace(0.0, 1.0, NUMBER_OF_BINS + 1)
+
+  low, high = np.quantile(lap_times, EDGE_QUANTILES)
+  if high <= low:
+    high = low + 1.0
+
+  return np.linspace(low, high, NUMBER_OF_BINS + 1)
+
+def group_histograms(values, groups, number_of_groups, bin_edges):
+  # The histogram of every group in one bincount over all the values. The
+  # histograms are densities so groups with few laps compare to groups with a
+  # lot of laps. Values outside of the bins count for the group but are not
+  # shown
+  number_of_bins = len(bin_edges) - 1
+  bins           = np.searchsorted(bin_edges, values, side = "right") - 1
+  bins[values == bin_edges[-1]] = number_of_bins - 1
+  in_range       = (bins >= 0) & (bins < number_of_bins)
+
+  counts = np.bincount(groups[in_range] * number_of_bins + bins[in_range],
+                       minlength = number_of_groups * number_of_bins)
+  counts = counts.reshape(number_of_groups, number_of_bins)
+  totals = np.bincount(groups, minlength = number_of_groups)
+
+  with np.errstate(invalid = "ignore", divide = "ignore"):
+    return counts / (totals[:, np.newaxis] * np.diff(bin_edges))
+
+def group_densities(values, groups, number_of_groups, grid):
+  # Gaussian kernel densities of every group on the grid. The values are binned
+  # on the grid first, so all the groups are one batched FFT convolution of
+  # their grid counts with their own kernel
+  grid_points = len(grid)
+  grid_step   = grid[1] - grid[0]
+  grid_bins   = np.rint((values - grid[0]) / grid_step).astype(np.int64)
+  in_range    = (grid_bins >= 0) & (grid_bins < grid_points)
+
+  grid_counts = np.bincount(groups[in_range] * grid_points + grid_bins[in_range],
+                            minlength = number_of_groups * grid_points)
+  grid_counts = grid_counts.reshape(number_of_groups, grid_points).astype(np.float64)
+
+  # Silverman's rule of thumb for the bandwidth of every group. The bandwidth
+  # is at least one grid step so the kernel is never narrower than the grid
+  totals = np.bincount(groups, minlength = number_of_groups).astype(np.float64)
+  sums   = np.bincount(groups, weights = values, minlength = number_of_groups)
+  square = np.bincount(groups, weights = values * values, minlength = number_of_groups)
+
+  with np.errstate(invalid = "ignore", divide = "ignore"):
+    means      = sums / totals
+    stds       = np.sqrt(np.maximum(square / totals - means ** 2, 0.0))
+    bandwidths = np.fmax(1.06 * stds * totals ** -0.2, grid_step)
+
+    offsets = np.arange(-(grid_points - 1), grid_points) * grid_step
+    kernels = np.exp(-0.5 * (offsets / bandwidths[:, np.newaxis]) ** 2) / \
+              (bandwidths[:, np.newaxis] * np.sqrt(2 * np.pi))
+
+    # The linear convolution needs at least 3 * grid_points - 2 points
+    fft_size  = 4 * grid_points
+    densities = np.fft.irfft(np.fft.rfft(grid_counts, fft_size) * np.fft.rfft(kernels, fft_size), fft_size)
+    densities = densities[:, grid_points - 1:2 * grid_points - 1] / totals[:, np.newaxis]
+
+  return np.maximum(densities, 0.0)
+
+##########################
+# Lap time distributions #
+##########################
+def calculate_lap_distributions(race, team_lap_flags):
+  # The histograms and the densities of the clean laps of every driver and of
+  # every team, all on the same bins and the same grid
+  lap_times   = np.concatenate([team.lap_times for team in race.teams])
+  lap_drivers = np.concatenate([team.lap_drivers for team in race.teams])
+  lap_teams   = np.repeat(np.arange(len(race.teams)), [len(team.lap_times) for team in race.teams])
+  flags       = np.concatenate([team_lap_flags[team.name] for team in race.teams])
+
+  is_clean    = lap_flags.is_clean(flags) & (lap_drivers != race_model.PIT_CODE)
+  lap_times   = lap_times[is_clean]
+  lap_drivers = lap_drivers[is_clean]
+  lap_teams   = lap_teams[is_clean]
+
+  bin_edges = shared_bin_edges(lap_times)
+  grid      = np.linspace(bin_edges[0], bin_edges[-1], GRID_POINTS)
+
+  # The drivers are in the order of the other driver plots
+  driver_names  = race_model.race_driver_names(race)
+  driver_index  = {name : index for index, name in enumerate(driver_names)}
+  code_to_index = np.array([driver_index.get(name, -1) for name in race.drivers], dtype = np.int64)
+  lap_groups    = code_to_index[lap_drivers]
+
+  team_names = [team.name for team in race.teams]
+
+  return {"bin_edges"         : bin_edges,
+          "grid"              : grid,
+          "driver_names"      : driver_names,
+          "driver_histograms" : group_histograms(lap_times, lap_groups, len(driver_names), bin_edges),
+          "driver_densities"  : group_densities(lap_times, lap_groups, len(driver_names), grid),
+          "team_names"        : team_names,
+          "team_histograms"   : group_histograms(lap_times, lap_teams, len(team_names), bin_edges),
+          "team_densities"    : group_densities(lap_times, lap_teams, len(team_names), grid)}
+
+################
+# Main program #
+################
+if __name__ == "__main__":
+  parser = argparse.ArgumentParser(description = "Show the most common clean lap time " +
+                                                 "of every driver.")
+
+  parser.add_argument("-i", "--input",
+                      required = True,
+                      help     = "The input YAML file containing all the karting data")
+
+  args = parser.parse_args()
+
+  race          = race_model.load_race(args.input)
+  distributions = calculate_lap_distributions(race, caution_windows.classify_laps(race)[0])
+
+  grid = distributions["grid"]
+  for driver_name, densities in zip(distributions["driver_names"], distributions["driver_densities"]):
+    if np.all(np.isnan(densities)):
+      print(f"{driver_name:<30} no clean laps")
+      continue
+
+    print(f"{driver_name:<30} most common lap time {grid[np.nanargmax(densities)]:7.3f} sec")
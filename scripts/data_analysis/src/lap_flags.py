@@ -0,0 +1,154 @@
+import numpy as np
+
+import argparse
+
+import race_model
+
+# The lap flags are bits so a lap can be an in lap and an outlier at the same
+# time. A lap without flags is a clean lap. The caution laps are flagged by
+# the caution windows of the whole field
+LAP_PIT     = 1
+LAP_IN      = 2
+LAP_OUT     = 4
+LAP_OUTLIER = 8
+LAP_CAUTION = 16
+
+# The names of the lap types, the first flag of a lap gives its type
+LAP_TYPES = [(LAP_PIT,     "Pit"),
+             (LAP_IN,      "In"),
+             (LAP_OUT,     "Out"),
+             (LAP_CAUTION, "Caution"),
+             (LAP_OUTLIER, "Outlier")]
+CLEAN_LAP = "Clean"
+
+# The laps around every lap of the same stint that give its rolling median and
+# spread
+WINDOW_SIZE = 11
+
+# A lap is an outlier when it is this many robust standard deviations away
+# from the rolling median. The spread is at least MIN_SPREAD seconds so the
+# very consistent stints don't flag normal laps
+OUTLIER_THRESHOLD = 4.0
+MIN_SPREAD        = 0.2
+
+# A lap at a driver change that is this many seconds slower than the rolling
+# median is a pit lap, also when it isn't marked as one in the karting data
+PIT_EXTRA_TIME = 8.0
+
+####################
+# Helper functions #
+####################
+def rolling_statistics(values, segments, window_size = WINDOW_SIZE):
+  # The median and the median absolute deviation of the window around every
+  # value. The windows don't cross into the other segments
+  half_window     = window_size // 2
+  padded_values   = np.pad(values, half_window, constant_values = np.nan)
+  padded_segments = np.pad(segments, half_window, constant_values = -1)
+
+  windows = np.lib.stride_tricks.sliding_window_view(padded_values, window_size).copy()
+  windows[np.lib.stride_tricks.sliding_window_view(padded_segments, window_size) != segments[:, np.newaxis]] = np.nan
+
+  medians = np.nanmedian(windows, axis = 1)
+  spreads = np.nanmedian(np.abs(windows - medians[:, np.newaxis]), axis = 1)
+
+  return medians, spreads
+
+def rolling_lap_statistics(race, window_size = WINDOW_SIZE):
+  # The laps of all the teams in one array with the rolling median and spread
+  # of every lap. Returns the lap times, the driver codes, the end of every
+  # team in the arrays, the first lap of every stint and the statistics
+  lap_times   = np.concatenate([team.lap_times for team in race.teams])
+  lap_drivers = np.concatenate([team.lap_drivers for team in race.teams])
+  team_ends   = np.cumsum([len(team.lap_times) for team in race.teams])
+
+  # Every stint of every team is a segment, so the statistics are per team and
+  # per driver. A new team always starts a new segment
+  is_first                 = np.zeros(len(lap_times), dtype = bool)
+  is_first[0]              = True
+  is_first[team_ends[:-1]] = True
+  is_first[1:]            |= lap_drivers[1:] != lap_drivers[:-1]
+  segments                 = np.cumsum(is_first)
+
+  # The marked pit laps are not part of the statistics of the drivers and get
+  # no statistics themselves
+  driver_laps = np.flatnonzero(lap_drivers != race_model.PIT_CODE)
+  medians     = np.full(len(lap_times), np.nan)
+  spreads     = np.full(len(lap_times), np.nan)
+  medians[driver_laps], spreads[driver_laps] = rolling_statistics(lap_times[driver_laps],
+                                                                  segments[driver_laps],
+                                                                  window_size)
+
+  return lap_times, lap_drivers, team_ends, is_first, medians, spreads
+
+##################
+# Lap classifier #
+##################
+def classify_laps(race):
+  # Classify the laps of all the teams in one pass over all the laps of the
+  # race. Returns the lap flags of every team
+  lap_times, lap_drivers, team_ends, is_first, medians, spreads = rolling_lap_statistics(race)
+
+  is_marked         = lap_drivers == race_model.PIT_CODE
+  driver_laps       = np.flatnonzero(~is_marked)
+  deviations        = lap_times[driver_laps] - medians[driver_laps]
+  robust_deviations = np.abs(deviations) / np.maximum(1.4826 * spreads[driver_laps], MIN_SPREAD)
+
+  is_last                                              = np.append(is_first[1:], True)
+  is_team_start                                        = np.zeros(len(lap_times), dtype = bool)
+  is_team_start[np.concatenate([[0], team_ends[:-1]])] = True
+  is_team_end                                          = np.zeros(len(lap_times), dtype = bool)
+  is_team_end[team_ends - 1]                           = True
+
+  # A slow lap at a driver change is a pit lap that wasn't marked. The first
+  # lap of the race and the last lap of a team are no driver changes
+  at_driver_change = ((is_first & ~is_team_start) | (is_last & ~is_team_end))[driver_laps]
+
+  is_pit              = is_marked.copy()
+  is_pit[driver_laps] = at_driver_change & (deviations >= PIT_EXTRA_TIME)
+
+  # The laps before and after a pit lap of the same team
+  is_in  = np.append(is_pit[1:] & ~is_team_start[1:], False) & ~is_pit
+  is_out = np.insert(is_pit[:-1] & ~is_team_end[:-1], 0, False) & ~is_pit
+
+  is_outlier              = np.zeros(len(lap_times), dtype = bool)
+  is_outlier[driver_laps] = robust_deviations > OUTLIER_THRESHOLD
+  is_outlier             &= ~is_pit
+
+  flags = LAP_PIT * is_pit + LAP_IN * is_in + LAP_OUT * is_out + LAP_OUTLIER * is_outlier
+  flags = flags.astype(np.uint8)
+
+  return {team.name : team_flags for team, team_flags in zip(race.teams, np.split(flags, team_ends[:-1]))}
+
+def is_clean(flags):
+  return flags == 0
+
+def lap_type_names(flags):
+  # The name of the first flag of every lap
+  names = np.full(len(flags), CLEAN_LAP, dtype = object)
+  for flag, name in reversed(LAP_TYPES):
+    names[(flags & flag) != 0] = name
+
+  return names
+
+################
+# Main program #
+################
+if __name__ == "__main__":
+  parser = argparse.ArgumentParser(description = "Count the pit, in, out and outlier " +
+                                                 "laps of every team.")
+
+  parser.add_argument("-i", "--input",
+                      required = True,
+                      help     = "The input YAML file containing all the karting data")
+
+  args = parser.parse_args()
+
+  race      = race_model.load_race(args.input)
+  lap_flags = classify_laps(race)
+
+  for team in race.teams:
+    # The caution laps are listed by caution_windows.py
+    counts = {name : int(np.count_nonzero(lap_flags[team.name] & flag))
+              for flag, name in LAP_TYPES if flag != LAP_CAUTION}
+    print(f"{team.name:<30} " + " ".join(f"{name}: {count:<4}" for name, count in counts.items()) +
+          f" {CLEAN_LAP}: {int(np.count_nonzero(is_clean(lap_flags[team.name])))}")
@@ -0,0 +1,498 @@
+import numpy as np
+
+import os
+import copy
+import json
+import time
+import signal
+import asyncio
+import argparse
+
+import race_model
+import finish_projection
+
+##############
+# Live state #
+##############
+class LiveDriver:
+  __slots__ = ("name", "team_name", "laps", "total_time", "last_lap_time", "best_lap_time")
+
+  def __init__(self, name, team_name):
+    self.name          = name
+    self.team_name     = team_name
+    self.laps          = 0
+    self.total_time    = 0.0
+    self.last_lap_time = None
+    self.best_lap_time = None
+
+  def running_average(self):
+    return self.total_time / self.laps
+
+class LiveTeam:
+  __slots__ = ("name", "laps", "total_time", "last_lap_time", "best_lap_time",
+               "driver_name", "stint_first_lap", "stint_time", "pit_stops",
+               "crossing_position")
+
+  def __init__(self, name):
+    self.name          = name
+    self.laps          = 0
+    self.total_time    = 0.0
+    self.last_lap_time = None
+    self.best_lap_time = None
+    self.pit_stops     = 0
+
+    # The current stint contains the laps [stint_first_lap, laps[
+    self.driver_name     = None
+    self.stint_first_lap = 0
+    self.stint_time      = 0.0
+
+    # The position of the team when it crossed the line for the last time
+    self.crossing_position = None
+
+  def running_average(self):
+    return self.total_time / self.laps
+
+  def stint_laps(self):
+    return self.laps - self.stint_first_lap
+
+class LiveRace:
+  __slots__ = ("teams", "drivers", "lap_leader_times", "lap_crossings")
+
+  def __init__(self):
+    self.teams   = {}
+    self.drivers = {}
+
+    # The race time the leader completed every lap and the number of teams
+    # that completed every lap so far. Their length is the lap of the leader
+    self.lap_leader_times = []
+    self.lap_crossings    = []
+
+  def leader_laps(self):
+    return len(self.lap_leader_times)
+
+  def add_lap(self, team_name, lap_time, driver_name):
+    if team_name not in self.teams:
+      self.teams[team_name] = LiveTeam(team_name)
+    team = self.teams[team_name]
+
+    team.laps          += 1
+    team.total_time    += lap_time
+    team.last_lap_time  = lap_time
+
+    # A new stint starts when the driver changes
+    if driver_name != team.driver_name:
+      if driver_name == race_model.PIT_DRIVER:
+        team.pit_stops += 1
+
+      team.driver_name     = driver_name
+      team.stint_first_lap = team.laps - 1
+      team.stint_time      = 0.0
+    team.stint_time += lap_time
+
+    if driver_name != race_model.PIT_DRIVER:
+      if team.best_lap_time is None or lap_time < team.best_lap_time:
+        team.best_lap_time = lap_time
+
+      if driver_name not in self.drivers:
+        self.drivers[driver_name] = LiveDriver(driver_name, team_name)
+      driver = self.drivers[driver_name]
+
+      driver.laps          += 1
+      driver.total_time    += lap_time
+      driver.last_lap_time  = lap_time
+      if driver.best_lap_time is None or lap_time < driver.best_lap_time:
+        driver.best_lap_time = lap_time
+
+    # The laps arrive in the order they are completed, so the first team
+    # completing a lap is the leader and every team completing the same lap
+    # later is behind all the teams that completed it before
+    if team.laps > self.leader_laps():
+      self.lap_leader_times.append(team.total_time)
+      self.lap_crossings.append(0)
+    self.lap_crossings[team.laps - 1] += 1
+
+    team.crossing_position = self.lap_crossings[team.laps - 1]
+
+    return team
+
+  def gap_to_leader(self, team):
+    # The laps behind the leader and the time behind the leader on the last
+    # lap the team completed
+    laps_behind = self.leader_laps() - team.laps
+    time_behind = team.total_time - self.lap_leader_times[team.laps - 1]
+
+    return laps_behind, time_behind
+
+  def standings(self):
+    # The teams with the most laps lead and equal laps are decided on who
+    # completed them first
+    return sorted(self.teams.values(),
+                  key = lambda team: (-team.laps, team.total_time))
+
+  def to_dict(self):
+    teams = []
+    for position, team in enumerate(self.standings()):
+      laps_behind, time_behind = self.gap_to_leader(team)
+
+      teams.append({"position"        : position + 1,
+                    "team"            : team.name,
+                    "laps"            : team.laps,
+                    "total_time"      : team.total_time,
+                    "last_lap_time"   : team.last_lap_time,
+                    "best_lap_time"   : team.best_lap_time,
+                    "running_average" : team.running_average(),
+                    "laps_behind"     : laps_behind,
+                    "time_behind"     : time_behind,
+                    "driver"          : team.driver_name,
+                    "stint_laps"      : team.stint_laps(),
+                    "pit_stops"       : team.pit_stops})
+
+    drivers = []
+    for driver in sorted(self.drivers.values(), key = lambda driver: driver.running_average()):
+      drivers.append({"driver"          : driver.name,
+                      "team"            : driver.team_name,
+                      "laps"            : driver.laps,
+                      "last_lap_time"   : driver.last_lap_time,
+                      "best_lap_time"   : driver.best_lap_time,
+                      "running_average" : driver.running_average()})
+
+    return {"leader_laps" : self.leader_laps(),
+            "teams"       : teams,
+            "drivers"     : drivers}
+
+####################
+# Helper functions #
+####################
+def parse_lap(line):
+  # Every line of the lap feed is a JSON object with the team, the lap time
+  # and the driver of one completed lap
+  lap      = json.loads(line)
+  lap_time = float(lap["lap_time"])
+
+  # A lap time that isn't a positive number of seconds would break the
+  # standings and the projection of the team
+  if not np.isfinite(lap_time) or lap_time <= 0:
+    raise ValueError(f"Invalid lap time {lap_time}")
+
+  return str(lap["team"]), lap_time, str(lap["driver"])
+
+def format_lap(live_race, team):
+  laps_behind, time_behind = live_race.gap_to_leader(team)
+
+  if laps_behind == 0:
+    gap = f"+{time_behind:.3f} sec"
+  else:
+    gap = f"+{laps_behind} laps"
+
+  return (f"P{team.crossing_position:<3} {team.name:<30} "
+          f"lap {team.laps:>5} {team.last_lap_time:8.3f} sec "
+          f"avg {team.running_average():7.3f} sec {gap:>14} "
+          f"{team.driver_name} (stint {team.stint_laps()} laps)")
+
+def write_standings(standings, filename):
+  # Write to a temporary file first so readers never see a half written file
+  temporary_filename = filename + ".tmp"
+  with open(temporary_filename, 'w') as standings_file:
+    json.dump(standings, standings_file, indent = 2)
+  os.replace(temporary_filename, filename)
+
+class LiveTiming:
+  __slots__ = ("live_race", "output", "snapshot_interval", "quiet", "has_new_laps",
+               "projection", "race_duration", "projection_interval", "latest_projection",
+               "has_unprojected_laps")
+
+  def __init__(self,
+               output              = None,
+               snapshot_interval   = 1.0,
+               quiet               = False,
+               race_duration       = None,
+               plans               = None,
+               projection_interval = 30.0):
+    self.live_race         = LiveRace()
+    self.output            = output
+    self.snapshot_interval = snapshot_interval
+    self.quiet             = quiet
+    self.has_new_laps      = False
+
+    # The finish projection follows every lap, but bootstrapping it takes
+    # seconds for a long race with many teams. It is only bootstrapped every
+    # projection interval and the standings get the latest one
+    self.race_duration        = race_duration
+    self.projection           = None if race_duration is None else finish_projection.FinishProjection(plans)
+    self.projection_interval  = projection_interval
+    self.latest_projection    = None
+    self.has_unprojected_laps = False
+
+  def handle_line(self, line):
+    line = line.strip()
+    if not line:
+      return
+
+    try:
+      team_name, lap_time, driver_name = parse_lap(line)
+    except (ValueError, KeyError, TypeError) as error:
+      print(f"Skipping the invalid lap {line!r}: {error}")
+      return
+
+    team = self.live_race.add_lap(team_name, lap_time, driver_name)
+    self.has_new_laps = True
+
+    if self.projection is not None:
+      self.projection.add_lap(team_name, lap_time, driver_name)
+      self.has_unprojected_laps = True
+
+    if not self.quiet:
+      print(format_lap(self.live_race, team), flush = True)
+
+  def write_snapshot(self):
+    if self.output is None or not self.has_new_laps:
+      return
+
+    standings = self.live_race.to_dict()
+    if self.latest_projection is not None:
+      standings["projection"] = self.latest_projection
+
+    write_standings(standings, self.output)
+    self.has_new_laps = False
+
+  def take_projection(self):
+    # A copy of the projection so far, the laps keep coming in while it is
+    # bootstrapped
+    self.has_unprojected_laps = False
+    return copy.deepcopy(self.projection)
+
+  def project(self):
+    if self.projection is None or not self.has_unprojected_laps:
+      return
+
+    self.latest_projection = self.take_projection().project(self.race_duration)
+    self.has_new_laps      = True
+
+  async def write_snapshots(self):
+    # The standings are sorted, so only write them every now and then instead
+    # of on every lap
+    while True:
+      await asyncio.sleep(self.snapshot_interval)
+      self.write_snapshot()
+
+  async def update_projections(self):
+    # Bootstrap the projection in a worker thread, so the laps are still
+    # handled and the standings are still written in the meantime
+    loop = asyncio.get_running_loop()
+    while True:
+      await asyncio.sleep(self.projection_interval)
+      if not self.has_unprojected_laps:
+        continue
+
+      projection             = self.take_projection()
+      self.latest_projection = await loop.run_in_executor(None, projection.project, self.race_duration)
+      self.has_new_laps      = True
+
+#############
+# Lap feeds #
+#############
+async def follow_file(filename, handle_line, poll_interval = 0.2):
+  # Wait until the feed exists, like 'tail -F'
+  while not os.path.exists(filename):
+    await asyncio.sleep(poll_interval)
+
+  with open(filename, 'r') as feed_file:
+    partial_line = ""
+    while True:
+      data = feed_file.readline()
+      if not data:
+        await asyncio.sleep(poll_interval)
+        continue
+
+      # Only handle complete lines, the writer might still be busy
+      partial_line += data
+      if partial_line.endswith("\n"):
+        handle_line(partial_line)
+        partial_line = ""
+
+async def serve_socket(host, port, handle_line):
+  async def handle_connection(reader, writer):
+    while True:
+      line = await reader.readline()
+      if not line:
+        break
+
+      # A line that isn't valid UTF-8 is skipped as an invalid lap instead of
+      # closing the connection
+      handle_line(line.decode(errors = "replace"))
+
+    writer.close()
+
+  server = await asyncio.start_server(handle_connection, host, port)
+  print(f"Listening for laps on {host}:{port}")
+
+  async with server:
+    await server.serve_forever()
+
+async def run_live_timing(live_timing, feed):
+  feed_task       = asyncio.ensure_future(feed)
+  snapshot_task   = asyncio.ensure_future(live_timing.write_snapshots())
+  projection_task = asyncio.ensure_future(live_timing.update_projections()) \
+                    if live_timing.projection is not None else None
+
+  # Stop cleanly on Ctrl-C and on a kill so the last standings are written
+  loop = asyncio.get_running_loop()
+  for signal_number in [signal.SIGINT, signal.SIGTERM]:
+    loop.add_signal_handler(signal_number, feed_task.cancel)
+
+  try:
+    await feed_task
+  except asyncio.CancelledError:
+    pass
+  finally:
+    snapshot_task.cancel()
+    if projection_task is not None:
+      projection_task.cancel()
+
+    # The last standings have the projection of all the laps
+    live_timing.project()
+    live_timing.write_snapshot()
+
+####################
+# Replay of a race #
+####################
+def race_lap_events(race):
+  # All the laps of the race in the order they were completed
+  team_names   = []
+  lap_times    = []
+  driver_names = []
+  end_times    = []
+  for team in race.teams:
+    team_names.append(np.full(len(team.lap_times), team.name, dtype = object))
+    lap_times.append(team.lap_times)
+    driver_names.append(race_model.lap_driver_names(race, team))
+    end_times.append(race_model.cumulative_times(team))
+
+  end_times = np.concatenate(end_times)
+  order     = np.argsort(end_times, kind = "stable")
+
+  return (end_times[order],
+          np.concatenate(team_names)[order],
+          np.concatenate(lap_times)[order],
+          np.concatenate(driver_names)[order])
+
+async def replay_race(race, write_line, speed):
+  start_time = time.monotonic()
+  for end_time, team_name, lap_time, driver_name in zip(*race_lap_events(race)):
+    if speed > 0:
+      await asyncio.sleep(max(0.0, end_time / speed - (time.monotonic() - start_time)))
+
+    await write_line(json.dumps({"team"     : team_name,
+                                 "lap_time" : float(lap_time),
+                                 "driver"   : driver_name}) + "\n")
+
+async def replay_to_file(race, filename, speed):
+  with open(filename, 'a') as feed_file:
+    async def write_line(line):
+      feed_file.write(line)
+      feed_file.flush()
+
+    await replay_race(race, write_line, speed)
+
+async def replay_to_socket(race, host, port, speed):
+  _, writer = await asyncio.open_connection(host, port)
+
+  async def write_line(line):
+    writer.write(line.encode())
+    await writer.drain()
+
+  await replay_race(race, write_line, speed)
+
+  writer.close()
+  await writer.wait_closed()
+
+################
+# Main program #
+################
+if __name__ == "__main__":
+  parser = argparse.ArgumentParser(description = "Follow a live lap feed and keep the " +
+                                                 "standings and driver stats up to date.")
+
+  subparsers = parser.add_subparsers(dest     = "command",
+                                     required = True)
+
+  parser_follow = subparsers.add_parser("follow",
+                                        help = "Follow a lap feed file that is being appended")
+  parser_follow.add_argument("-i", "--input",
+                             required = True,
+                             help     = "The lap feed file with one JSON lap per line")
+
+  parser_listen = subparsers.add_parser("listen",
+                                        help = "Receive the laps on a local socket")
+
+  parser_replay = subparsers.add_parser("replay",
+                                        help = "Replay a finished race as a lap feed")
+  parser_replay.add_argument("-i", "--input",
+                             required = True,
+                             help     = "The input YAML file containing all the karting data")
+  parser_replay.add_argument("-o", "--output",
+                             help = "The lap feed file to append the laps to. Without it " +
+                                    "the laps are sent to the socket")
+  parser_replay.add_argument("--speed",
+                             type    = float,
+                             default = 60,
+                             help    = "How many times faster than real time the race is " +
+                                       "replayed. 0 replays it at once")
+
+  for subparser in [parser_listen, parser_replay]:
+    subparser.add_argument("--host",
+                           default = "127.0.0.1",
+                           help    = "The host of the lap feed socket")
+    subparser.add_argument("--port",
+                           type    = int,
+                           default = 8765,
+                           help    = "The port of the lap feed socket")
+
+  for subparser in [parser_follow, parser_listen]:
+    subparser.add_argument("-o", "--output",
+                           help = "The JSON file where the standings and driver stats " +
+                                  "are written to")
+    subparser.add_argument("--snapshot_interval",
+                           type    = float,
+                           default = 1.0,
+                           help    = "The minimum number of seconds between two writes " +
+                                     "of the standings")
+    subparser.add_argument("-q", "--quiet",
+                           action = "store_true",
+                           help   = "Don't print every lap")
+    subparser.add_argument("-t", "--race_duration",
+                           type = float,
+                           help = "The duration of the race in minutes. With it the standings " +
+                                  "also get the projected final laps and positions")
+    subparser.add_argument("-p", "--plans",
+                           help = "The YAML file with the planned stints of the teams for " +
+                                  "the projection")
+    subparser.add_argument("--projection_interval",
+                           type    = float,
+                           default = 30.0,
+                           help    = "The number of seconds between two updates of the " +
+                                     "projection, which takes a few seconds for a long race")
+
+  args = parser.parse_args()
+
+  if args.command == "replay":
+    race = race_model.load_race(args.input)
+
+    if args.output is not None:
+      asyncio.run(replay_to_file(race, args.output, args.speed))
+    else:
+      asyncio.run(replay_to_socket(race, args.host, args.port, args.speed))
+  else:
+    live_timing = LiveTiming(output              = args.output,
+                             snapshot_interval   = args.snapshot_interval,
+                             quiet               = args.quiet,
+                             race_duration       = None if args.race_duration is None else args.race_duration * 60,
+                             plans               = None if args.plans is None else finish_projection.load_plans(args.plans),
+                             projection_interval = args.projection_interval)
+
+    if args.command == "follow":
+      feed = follow_file(args.input, live_timing.handle_line)
+    else:
+      feed = serve_socket(args.host, args.port, live_timing.handle_line)
+
+    asyncio.run(run_live_timing(live_timing, feed))
@@ -0,0 +1,123 @@
+import numpy as np
+
+import argparse
+
+import race_model
+import fenwick_tree
+
+####################
+# Helper functions #
+####################
+def running_order_keys(race):
+  # Every team has a key for every number of completed laps. The running order
+  # is on the most laps first and then on who completed them first. Before the
+  # first lap the teams are ordered on the time they complete their first lap
+  team_indices = []
+  laps         = []
+  times        = []
+  for team_index, team in enumerate(race.teams):
+    cumulative_times = race_model.cumulative_times(team)
+
+    team_indices.append(np.full(len(team.lap_times) + 1, team_index))
+    laps.append(np.arange(len(team.lap_times) + 1))
+    times.append(np.concatenate([cumulative_times[:1], cumulative_times]))
+
+  team_indices = np.concatenate(team_indices)
+  laps         = np.concatenate(laps)
+  times        = np.concatenate(times)
+
+  # The rank of every key in the running order over all the keys of the race
+  order = np.lexsort((team_indices, times, -laps))
+  ranks = np.empty_like(order)
+  ranks[order] = np.arange(len(order))
+
+  return team_indices, laps, times, ranks, order
+
+###################
+# Position sweep #
+###################
+def sweep_positions(race):
+  team_indices, laps, times, ranks, rank_order = running_order_keys(race)
+
+  number_of_teams = len(race.teams)
+  row_starts      = np.concatenate([[0], np.cumsum([len(team.lap_times) + 1 for team in race.teams])[:-1]])
+  lap_drivers     = [race_model.lap_driver_names(race, team) for team in race.teams]
+
+  # The lap completions sorted on time. Equal times keep the order of the keys
+  events = np.flatnonzero(laps > 0)
+  events = events[np.lexsort((ranks[events], times[events]))]
+
+  # The Fenwick tree counts the current key of every team, so the prefix sum up
+  # to a key is the position of that key in the running order
+  present = np.zeros(len(ranks), dtype = np.int64)
+  present[ranks[row_starts]] = 1
+  running_order = fenwick_tree.FenwickTree(present.tolist())
+
+  position_times = [[0.0] for _ in range(number_of_teams)]
+  positions      = [[int(np.count_nonzero(ranks[row_starts] <= ranks[row_start]))]
+                    for row_start in row_starts]
+  overtakes      = []
+
+  team_of_rank = team_indices[rank_order]
+  lap_of_rank  = laps[rank_order]
+
+  for event, team_index, lap, time in zip(events.tolist(),
+                                          team_indices[events].tolist(),
+                                          laps[events].tolist(),
+                                          times[events].tolist()):
+    old_rank = int(ranks[event - 1])
+    new_rank = int(ranks[event])
+
+    running_order.add(old_rank, -1)
+    running_order.add(new_rank, 1)
+
+    new_position = running_order.prefix_sum(new_rank + 1)
+    old_position = positions[team_index][-1]
+    if new_position == old_position:
+      continue
+
+    position_times[team_index].append(time)
+    positions[team_index].append(new_position)
+
+    # Every team between the new and the old key got passed and dropped one
+    # position
+    for position in range(new_position + 1, old_position + 1):
+      passed_rank       = running_order.find_prefix(position)
+      passed_team_index = int(team_of_rank[passed_rank])
+      passed_laps       = int(lap_of_rank[passed_rank])
+      passed_drivers    = lap_drivers[passed_team_index]
+
+      position_times[passed_team_index].append(time)
+      positions[passed_team_index].append(position)
+
+      overtakes.append({"time"             : time,
+                        "lap"              : lap,
+                        "team"             : race.teams[team_index].name,
+                        "driver"           : lap_drivers[team_index][lap - 1],
+                        "overtaken_team"   : race.teams[passed_team_index].name,
+                        "overtaken_driver" : passed_drivers[min(passed_laps, len(passed_drivers) - 1)],
+                        "position"         : position - 1})
+
+  position_times = {team.name : np.array(position_times[i]) for i, team in enumerate(race.teams)}
+  positions      = {team.name : np.array(positions[i])      for i, team in enumerate(race.teams)}
+
+  return position_times, positions, overtakes
+
+################
+# Main program #
+################
+if __name__ == "__main__":
+  parser = argparse.ArgumentParser(description = "List all the overtakes of a race.")
+
+  parser.add_argument("-i", "--input",
+                      required = True,
+                      help     = "The input YAML file containing all the karting data")
+
+  args = parser.parse_args()
+
+  _, _, overtakes = sweep_positions(race_model.load_race(args.input))
+
+  for overtake in overtakes:
+    print(f"{overtake['time']:10.3f} sec lap {overtake['lap']:>5} "
+          f"P{overtake['position']:<3} {overtake['team']} ({overtake['driver']}) passed "
+          f"{overtake['overtaken_team']} ({overtake['overtaken_driver']})")
@@ -0,0 +1,445 @@
+import numpy as np
+
+import race_model
+import lap_flags
+import caution_windows
+import stint_metrics
+import lap_distributions
+import head_to_head
+import finish_projection
+import time_index
+import fenwick_tree
+import position_sweep
+import stage_cache
+import stage_profiler
+
+####################
+# Helper functions #
+####################
+def are_floats_close(lhs, rhs, tolerance = 1e-6):
+  return abs(lhs - rhs) <= tolerance
+
+def extend_cumulative_times(team_name, cumulative_times, lap_times, lap_drivers, max_cumulative_time):
+  # Add the value 0 to start of the cumulative times and extend them with the
+  # projected laps of the team. The projection follows the recent pace and the
+  # pit stops of the team instead of its running average over the whole race
+  projection = finish_projection.TeamProjection.from_laps(team_name, lap_times, lap_drivers)
+
+  return np.concatenate([[0.0],
+                         cumulative_times,
+                         projection.expected_cumulative_times(max_cumulative_time)])
+
+def interpolate_laps(cumulative_times_extended, cumulative_times, has_stopped, times):
+  # The index of the lap in progress at every time. A lap that ends exactly at
+  # the time is still in progress
+  times     = np.asarray(times, dtype = np.float64)
+  lap_index = np.maximum(np.searchsorted(cumulative_times_extended, times, side = "left") - 1, 0)
+
+  # Interpolate
+  current_cumulative_time = cumulative_times_extended[lap_index]
+  next_cumulative_time    = cumulative_times_extended[lap_index + 1]
+  interpolated_laps = lap_index + (times - current_cumulative_time) / \
+                                  (next_cumulative_time - current_cumulative_time)
+
+  # When the team has stopped the laps don't increase anymore
+  if has_stopped:
+    has_ended = (cumulative_times[-1] < current_cumulative_time) | \
+                (np.abs(cumulative_times[-1] - current_cumulative_time) <= 1e-6)
+    interpolated_laps = np.where(has_ended, len(cumulative_times), interpolated_laps)
+
+  return interpolated_laps
+
+def find_max_cumulative_time_index(all_cumulative_times, end_time):
+  # The index of the last time that is not after the end of the team
+  after_end = np.flatnonzero(np.asarray(all_cumulative_times) - end_time > 1e-6)
+  if len(after_end) == 0:
+    return len(all_cumulative_times) - 1
+
+  return int(after_end[0]) - 1
+
+##################################################
+# Calculate some data out of the karting results #
+##################################################
+def calculate_team_data(race, analysis):
+  team_has_stopped = {}
+  lap_times        = {}
+  lap_drivers      = {}
+  cumulative_times = {}
+  running_averages = {}
+  for team in race.teams:
+    team_has_stopped[team.name] = team.has_stopped
+    lap_times[team.name]        = team.lap_times
+    lap_drivers[team.name]      = race_model.lap_driver_names(race, team)
+    cumulative_times[team.name] = race_model.cumulative_times(team)
+    running_averages[team.name] = race_model.running_averages(team)
+
+  analysis["team_has_stopped"] = team_has_stopped
+  analysis["lap_times"]        = lap_times
+  analysis["lap_drivers"]      = lap_drivers
+  analysis["cumulative_times"] = cumulative_times
+  analysis["running_averages"] = running_averages
+
+def calculate_cumulative_times_extended(analysis):
+  cumulative_times = analysis["cumulative_times"]
+  lap_times        = analysis["lap_times"]
+  lap_drivers      = analysis["lap_drivers"]
+
+  max_cumulative_time = max([cumulative_time[-1] for cumulative_time in cumulative_times.values()])
+
+  cumulative_times_extended = {}
+  for team_name, team_cumulative_times in cumulative_times.items():
+    cumulative_times_extended[team_name] = extend_cumulative_times(team_name,
+                                                                   team_cumulative_times,
+                                                                   lap_times[team_name],
+                                                                   lap_drivers[team_name],
+                                                                   max_cumulative_time)
+
+  analysis["cumulative_times_extended"] = cumulative_times_extended
+
+def calculate_interpolated_laps(analysis):
+  cumulative_times          = analysis["cumulative_times"]
+  cumulative_times_extended = analysis["cumulative_times_extended"]
+  team_has_stopped          = analysis["team_has_stopped"]
+
+  all_cumulative_times = []
+  for team_cumulative_times in cumulative_times.values():
+    all_cumulative_times.extend(team_cumulative_times)
+
+  all_cumulative_times.sort()
+
+  interpolated_laps               = {}
+  teams_max_cumulative_time_index = {}
+  for team_name, team_cumulative_times_extended in cumulative_times_extended.items():
+    interpolated_laps[team_name] = interpolate_laps(team_cumulative_times_extended,
+                                                    cumulative_times[team_name],
+                                                    team_has_stopped[team_name],
+                                                    all_cumulative_times).tolist()
+
+    teams_max_cumulative_time_index[team_name] = find_max_cumulative_time_index(all_cumulative_times,
+                                                                                cumulative_times[team_name][-1])
+
+  analysis["all_cumulative_times"]            = all_cumulative_times
+  analysis["interpolated_laps"]               = interpolated_laps
+  analysis["teams_max_cumulative_time_index"] = teams_max_cumulative_time_index
+
+def calculate_total_running_average(analysis):
+  all_cumulative_times            = analysis["all_cumulative_times"]
+  interpolated_laps               = analysis["interpolated_laps"]
+  teams_max_cumulative_time_index = analysis["teams_max_cumulative_time_index"]
+  team_has_stopped                = analysis["team_has_stopped"]
+
+  total_running_average = []
+  for i, cumulative_time in enumerate(all_cumulative_times):
+    sum_team_laps       = 0
+    sum_cumulative_time = 0
+    for team_name, team_interpolated_laps in interpolated_laps.items():
+      max_index = teams_max_cumulative_time_index[team_name]
+
+      # We only sum the valid laps and not the one after a team has stopped
+      if i <= max_index or not team_has_stopped[team_name]:
+        sum_team_laps       += team_interpolated_laps[i]
+        sum_cumulative_time += cumulative_time
+      else:
+        sum_team_laps       += team_interpolated_laps[max_index]
+        sum_cumulative_time += all_cumulative_times[max_index]
+
+    total_running_average.append(sum_cumulative_time / sum_team_laps)
+
+  total_running_average_diff = {}
+  for team_name, team_interpolated_laps in interpolated_laps.items():
+    total_running_average_diff[team_name] = []
+    for i, cumulative_time in enumerate(all_cumulative_times):
+      total_running_average_diff[team_name].append(cumulative_time / team_interpolated_laps[i] -
+                                                   total_running_average[i])
+
+  analysis["total_running_average"]      = total_running_average
+  analysis["total_running_average_diff"] = total_running_average_diff
+
+def calculate_lap_flags(race, analysis):
+  # The laps in the periods where the whole field slowed down get the caution
+  # flag as well
+  team_lap_flags, race_caution_windows = caution_windows.classify_laps(race)
+
+  analysis["lap_flags"]       = team_lap_flags
+  analysis["caution_windows"] = race_caution_windows
+
+def calculate_time_index(race, analysis):
+  # The index extrapolates the teams after their last lap with the same
+  # projected laps as the interpolated laps of the plots
+  analysis["time_index"] = time_index.TimeIndex(race, analysis["cumulative_times_extended"])
+
+def calculate_positions(race, analysis):
+  position_times, positions, overtakes = position_sweep.sweep_positions(race)
+
+  analysis["position_times"] = position_times
+  analysis["positions"]      = positions
+  analysis["overtakes"]      = overtakes
+
+def calculate_team_drivers(analysis):
+  all_cumulative_times            = analysis["all_cumulative_times"]
+  teams_max_cumulative_time_index = analysis["teams_max_cumulative_time_index"]
+  race_time_index                 = analysis["time_index"]
+
+  # The driver in the kart of every team at each of the merged cumulative times
+  drivers = race_time_index.drivers_at(all_cumulative_times)
+
+  team_drivers = {}
+  for team_index, team_name in enumerate(race_time_index.team_names):
+    max_index = teams_max_cumulative_time_index[team_name]
+    team_drivers[team_name] = drivers[:max_index + 1, team_index].tolist()
+
+  analysis["team_drivers"] = team_drivers
+
+def calculate_driver_data(race, analysis):
+  all_drivers     = race_model.race_driver_names(race)
+  lap_per_drivers = race_model.driver_lap_times(race)
+  lap_per_drivers = {driver : lap_per_drivers[driver] for driver in all_drivers}
+
+  cumulative_times_per_driver = {}
+  running_averages_per_driver = {}
+  for driver_name, driver_lap_times in lap_per_drivers.items():
+    cumulative_time = np.cumsum(driver_lap_times)
+    cumulative_times_per_driver[driver_name] = cumulative_time
+    running_averages_per_driver[driver_name] = cumulative_time / np.arange(1, len(cumulative_time) + 1)
+
+  analysis["all_drivers"]                 = all_drivers
+  analysis["lap_per_drivers"]             = lap_per_drivers
+  analysis["cumulative_times_per_driver"] = cumulative_times_per_driver
+  analysis["running_averages_per_driver"] = running_averages_per_driver
+
+def calculate_stint_metrics(race, analysis):
+  rolling_lap_means, rolling_lap_stds, race_stint_metrics = \
+    stint_metrics.calculate_stint_metrics(race, analysis["lap_flags"])
+
+  analysis["rolling_lap_means"] = rolling_lap_means
+  analysis["rolling_lap_stds"]  = rolling_lap_stds
+  analysis["stint_metrics"]     = race_stint_metrics
+
+def calculate_lap_distributions(race, analysis):
+  analysis["lap_distributions"] = lap_distributions.calculate_lap_distributions(race, analysis["lap_flags"])
+
+def calculate_head_to_head(race, analysis):
+  analysis["head_to_head"] = head_to_head.compare_all_drivers(race, analysis["lap_flags"])
+
+def calculate_interpolated_driver_data(analysis):
+  all_drivers                 = analysis["all_drivers"]
+  cumulative_times_per_driver = analysis["cumulative_times_per_driver"]
+  running_averages_per_driver = analysis["running_averages_per_driver"]
+
+  all_cumulative_times_driver = []
+  for driver_cumulative_times in cumulative_times_per_driver.values():
+    all_cumulative_times_driver.extend(driver_cumulative_times)
+
+  all_cumulative_times_driver.sort()
+
+  # Calculate interpolated running averages per driver
+  interpolated_running_averages_per_driver = {driver : [] for driver in all_drivers}
+  drivers_max_cumulative_time_index        = {}
+  for driver_name, driver_running_averages in running_averages_per_driver.items():
+
+    driver_cumulative_times = cumulative_times_per_driver[driver_name]
+
+    current_lap_index = 0
+    for i, cumulative_time in enumerate(all_cumulative_times_driver):
+
+      while current_lap_index + 1 < len(driver_cumulative_times) and \
+            driver_cumulative_times[current_lap_index + 1] < cumulative_time:
+        current_lap_index += 1
+
+      if current_lap_index == len(driver_cumulative_times) - 1:
+        interpolated_running_average = driver_running_averages[-1]
+
+        if driver_name not in drivers_max_cumulative_time_index:
+          drivers_max_cumulative_time_index[driver_name] = i - 1
+
+      elif cumulative_time < driver_cumulative_times[current_lap_index]:
+
+        # We assume that the driver started out with the same running average
+        # as at his first measured lap
+        interpolated_running_average = driver_running_averages[0]
+
+      else:
+        # Interpolate
+        current_cumulative_time = driver_cumulative_times[current_lap_index]
+        next_cumulative_time    = driver_cumulative_times[current_lap_index + 1]
+        current_running_average = driver_running_averages[current_lap_index]
+        next_running_average    = driver_running_averages[current_lap_index + 1]
+        interpolated_running_average = \
+          current_running_average + \
+          (cumulative_time - current_cumulative_time) * \
+          (next_running_average - current_running_average) / \
+          (next_cumulative_time - current_cumulative_time)
+
+      interpolated_running_averages_per_driver[driver_name].append(interpolated_running_average)
+
+    if driver_name not in drivers_max_cumulative_time_index:
+      drivers_max_cumulative_time_index[driver_name] = len(all_cumulative_times_driver) - 1
+
+  # Calculate interpolated laps per driver
+  interpolated_laps_per_driver = {driver : [] for driver in all_drivers}
+  for driver_name, driver_cumulative_times in cumulative_times_per_driver.items():
+
+    current_lap_index = 0
+    for cumulative_time in all_cumulative_times_driver:
+      while current_lap_index + 1 < len(driver_cumulative_times) and \
+            driver_cumulative_times[current_lap_index + 1] < cumulative_time:
+        current_lap_index += 1
+
+      if current_lap_index == len(driver_cumulative_times) - 1:
+
+        # The driver did not ride anymore laps than this so the laps don't
+        # increase anymore
+        interpolated_lap = len(driver_cumulative_times)
+
+      elif cumulative_time < driver_cumulative_times[current_lap_index]:
+
+        # Interpolate but we add an extra point where the driver has riden 0
+        # laps at time 0. This is for a more correct interpolation
+        interpolated_lap = cumulative_time / driver_cumulative_times[0]
+
+      else:
+        # Interpolate
+        current_cumulative_time = driver_cumulative_times[current_lap_index]
+        next_cumulative_time    = driver_cumulative_times[current_lap_index + 1]
+        interpolated_lap = current_lap_index + 1 + (cumulative_time - current_cumulative_time) / \
+                                                   (next_cumulative_time - current_cumulative_time)
+
+      interpolated_laps_per_driver[driver_name].append(interpolated_lap)
+
+  total_running_average_driver = []
+  for i, cumulative_time in enumerate(all_cumulative_times_driver):
+    sum_driver_laps     = 0
+    sum_cumulative_time = 0
+    for driver_name, driver_interpolated_laps in interpolated_laps_per_driver.items():
+      max_index = drivers_max_cumulative_time_index[driver_name]
+
+      # We only sum the laps that the driver has actually driven
+      if i <= max_index:
+        sum_driver_laps     += driver_interpolated_laps[i]
+        sum_cumulative_time += cumulative_time
+      else:
+        sum_driver_laps     += driver_interpolated_laps[max_index]
+        sum_cumulative_time += all_cumulative_times_driver[max_index]
+
+    total_running_average_driver.append(sum_cumulative_time / sum_driver_laps)
+
+  total_running_average_diff_driver = {driver : [] for driver in all_drivers}
+  for driver_name in cumulative_times_per_driver:
+    for i, cumulative_time in enumerate(all_cumulative_times_driver):
+      total_running_average_diff_driver[driver_name].append(cumulative_time / interpolated_laps_per_driver[driver_name][i] -
+                                                            total_running_average_driver[i])
+
+  analysis["all_cumulative_times_driver"]              = all_cumulative_times_driver
+  analysis["interpolated_running_averages_per_driver"] = interpolated_running_averages_per_driver
+  analysis["drivers_max_cumulative_time_index"]        = drivers_max_cumulative_time_index
+  analysis["interpolated_laps_per_driver"]             = interpolated_laps_per_driver
+  analysis["total_running_average_diff_driver"]        = total_running_average_diff_driver
+
+def calculate_display_laps(analysis, number_of_points):
+  interpolated_laps    = analysis["interpolated_laps"]
+  all_cumulative_times = analysis["all_cumulative_times"]
+  race_time_index      = analysis["time_index"]
+
+  # Setup the initial team order
+  initial_team_order = list(interpolated_laps.keys())
+  initial_team_order.sort(key     = lambda team_name: interpolated_laps[team_name][0],
+                          reverse = True)
+
+  # Create the display data with equidistant points
+  cumulative_times_display = np.linspace(start = 0,
+                                         stop  = all_cumulative_times[-1],
+                                         num   = number_of_points)
+  laps_display = race_time_index.laps_at(cumulative_times_display[1:])
+
+  # We insert a very small start value so the bars show up at the start
+  interpolated_laps_display = {}
+  for team_name in initial_team_order:
+    team_index = race_time_index.team_names.index(team_name)
+    interpolated_laps_display[team_name] = [1e-6] + laps_display[:, team_index].tolist()
+
+  return cumulative_times_display, interpolated_laps_display
+
+#################
+# Race analysis #
+#################
+def analyse_timeline(race, analysis, profiler = stage_profiler.NO_PROFILER):
+  with profiler.stage("Calculate some data out of the karting results"):
+    calculate_team_data(race, analysis)
+
+  with profiler.stage("Classify the pit, in, out, outlier and caution laps"):
+    calculate_lap_flags(race, analysis)
+
+  with profiler.stage("Update the cumulative times for easier interpolation"):
+    calculate_cumulative_times_extended(analysis)
+
+  with profiler.stage("Calculate interpolated laps"):
+    calculate_interpolated_laps(analysis)
+
+  with profiler.stage("Calculate the total running average"):
+    calculate_total_running_average(analysis)
+
+  with profiler.stage("Build the time-point index"):
+    calculate_time_index(race, analysis)
+
+  with profiler.stage("Calculate the team drivers"):
+    calculate_team_drivers(analysis)
+
+  with profiler.stage("Sweep the position changes"):
+    calculate_positions(race, analysis)
+
+def analyse_drivers(race, analysis, profiler = stage_profiler.NO_PROFILER):
+  with profiler.stage("Calculate the driver data"):
+    calculate_driver_data(race, analysis)
+
+  with profiler.stage("Calculate interpolated running averages per driver"):
+    calculate_interpolated_driver_data(analysis)
+
+  with profiler.stage("Calculate the rolling stint metrics"):
+    calculate_stint_metrics(race, analysis)
+
+  with profiler.stage("Calculate the lap time distributions"):
+    calculate_lap_distributions(race, analysis)
+
+  with profiler.stage("Compare all the drivers head to head"):
+    calculate_head_to_head(race, analysis)
+
+def create_analysis(race):
+  # The timeline digest covers the race and the code of the analysis. The race
+  # name is not part of it so fixing a typo in it keeps the cached timeline
+  timeline_digest = stage_cache.hash_values(stage_cache.code_version(__file__,
+                                                                     race_model.__file__,
+                                                                     lap_flags.__file__,
+                                                                     caution_windows.__file__,
+                                                                     stint_metrics.__file__,
+                                                                     lap_distributions.__file__,
+                                                                     head_to_head.__file__,
+                                                                     finish_projection.__file__,
+                                                                     time_index.__file__,
+                                                                     position_sweep.__file__,
+                                                                     fenwick_tree.__file__),
+                                            stage_cache.race_digest(race))
+
+  return {"race"             : race,
+          "race_name"        : race.name,
+          "timeline_digest"  : timeline_digest,
+          "number_of_teams"  : len(race.teams),
+          "winner_team_name" : race.teams[0].name}
+
+def analyse_race(race,
+                 profiler = stage_profiler.NO_PROFILER,
+                 cache    = stage_cache.NO_CACHE):
+  analysis = create_analysis(race)
+
+  def analyse():
+    analyse_timeline(race, analysis, profiler)
+    analyse_drivers(race, analysis, profiler)
+
+    # The race itself is not part of the cached timeline
+    return {name : value for name, value in analysis.items()
+            if name not in ["race", "race_name"]}
+
+  analysis.update(cache.cached(stage_name = "timeline",
+                               key        = analysis["timeline_digest"],
+                               compute    = analyse))
+
+  return analysis
@@ -0,0 +1,247 @@
+import numpy as np
+
+import os
+import re
+import glob
+import argparse
+import yaml
+
+import race_model
+import lap_flags
+import caution_windows
+import stage_cache
+
+DEFAULT_RESULTS_FOLDER = os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                                      "..", "..", "..", "results")
+RACE_FILENAME          = "karting_results.yaml"
+DATABASE_FILENAME      = "driver_ratings.yaml"
+
+# The ratings database is generated, so it lives next to the stage cache
+# instead of in the tracked results folder. The stage cache only evicts the
+# files directly in its folder, so the database gets a subfolder of its own
+DEFAULT_DATABASE = os.path.join(stage_cache.DEFAULT_CACHE_FOLDER, "archive", DATABASE_FILENAME)
+
+# The circuit of a race is the circuit field of its karting data, or else it
+# comes from the name of the spreadsheet in its folder, like
+# 2025_12_20_karting_results_first_kart_inn.xlsx
+CIRCUIT_PATTERN = re.compile(r"^\d{4}_\d{2}_\d{2}_karting_results_(.+?)(_generated)?\.(xlsx|ods)$")
+UNKNOWN_CIRCUIT = "unknown"
+
+# A driver needs at least this many clean laps in a session to get a pace in
+# that session
+MIN_CLEAN_LAPS = 5
+
+####################
+# Helper functions #
+####################
+def rating_code_version():
+  # The ratings of the sessions are calculated again when this code changes
+  return stage_cache.code_version(__file__,
+                                  race_model.__file__,
+                                  lap_flags.__file__,
+                                  caution_windows.__file__)
+
+def find_race_files(results_folder):
+  # All the race files of the archive relative to the results folder, like
+  # 2025/2025_12_20/karting_results.yaml
+  pattern = os.path.join(results_folder, "*", "*", RACE_FILENAME)
+  return sorted(os.path.relpath(filename, results_folder) for filename in glob.glob(pattern))
+
+def find_circuit(race_folder):
+  for filename in sorted(os.listdir(race_folder)):
+    match = CIRCUIT_PATTERN.match(filename)
+    if match is not None:
+      return match.group(1)
+
+  return UNKNOWN_CIRCUIT
+
+def race_circuit(race, race_folder):
+  return race.circuit or find_circuit(race_folder)
+
+def last_known_circuit(circuits):
+  # The last circuit that isn't unknown, so a race without a circuit isn't the
+  # default circuit of the tools
+  known_circuits = [circuit for circuit in circuits if circuit != UNKNOWN_CIRCUIT]
+  return known_circuits[-1] if known_circuits else None
+
+def file_signature(filename):
+  # The size and modification time tell if a race file changed without reading
+  # it again
+  file_stat = os.stat(filename)
+  return [file_stat.st_size, file_stat.st_mtime_ns]
+
+#################
+# Session paces #
+#################
+def calculate_session(race):
+  # The outlier-robust pace of every driver in the session is the median of
+  # their clean laps. The reference of the session is the median pace of its
+  # drivers, so the relative paces of different sessions can be compared
+  team_lap_flags = caution_windows.classify_laps(race)[0]
+
+  lap_times   = np.concatenate([team.lap_times for team in race.teams])
+  lap_drivers = np.concatenate([team.lap_drivers for team in race.teams])
+  flags       = np.concatenate([team_lap_flags[team.name] for team in race.teams])
+
+  is_driver   = np.concatenate([race_model.named_driver_laps_mask(race, team) for team in race.teams])
+  is_clean    = lap_flags.is_clean(flags) & is_driver
+  lap_times   = lap_times[is_clean]
+  lap_drivers = lap_drivers[is_clean]
+
+  # Sort the clean laps on driver and on lap time, so the median of every
+  # driver is in the middle of its range
+  order       = np.lexsort((lap_times, lap_drivers))
+  lap_times   = lap_times[order]
+  lap_drivers = lap_drivers[order]
+
+  codes, first, counts = np.unique(lap_drivers, return_index = True, return_counts = True)
+  medians              = (lap_times[first + (counts - 1) // 2] + lap_times[first + counts // 2]) / 2
+
+  drivers = {race.drivers[code] : {"pace"       : float(median),
+                                   "clean_laps" : int(count)}
+             for code, median, count in zip(codes, medians, counts) if count >= MIN_CLEAN_LAPS}
+
+  reference = float(np.median([driver["pace"] for driver in drivers.values()])) if drivers else None
+
+  return {"race_name" : race.name,
+          "reference" : reference,
+          "drivers"   : drivers}
+
+###################
+# Rating database #
+###################
+def load_database(filename):
+  if not os.path.exists(filename):
+    return {"code_version" : None, "sessions" : {}}
+
+  with open(filename, 'r') as database_file:
+    loader = getattr(yaml, "CSafeLoader", yaml.SafeLoader)
+    return yaml.load(database_file, Loader = loader)
+
+def save_database(database, filename):
+  os.makedirs(os.path.dirname(os.path.abspath(filename)), exist_ok = True)
+  with open(filename, 'w') as database_file:
+    yaml.safe_dump(database, database_file, sort_keys = False)
+
+def update_database(database, results_folder):
+  # Only the race files that are new or changed since the last update are read.
+  # Returns the race files that were read
+  if database["code_version"] != rating_code_version():
+    database["code_version"] = rating_code_version()
+    database["sessions"]     = {}
+
+  race_files = find_race_files(results_folder)
+  sessions   = {race_file : database["sessions"][race_file]
+                for race_file in race_files if race_file in database["sessions"]}
+
+  updated_files = []
+  for race_file in race_files:
+    filename  = os.path.join(results_folder, race_file)
+    signature = file_signature(filename)
+    if race_file in sessions and sessions[race_file]["signature"] == signature:
+      continue
+
+    race    = race_model.parse_race(filename)
+    session = calculate_session(race)
+    session["signature"] = signature
+    session["circuit"]   = race_circuit(race, os.path.dirname(filename))
+
+    sessions[race_file] = session
+    updated_files.append(race_file)
+
+  database["sessions"] = sessions
+
+  return updated_files
+
+def calculate_ratings(database):
+  # The rating of a driver is the mean of their paces relative to the session
+  # references, weighted with their clean laps. The circuit references are the
+  # median session reference of every circuit, so a rating can be turned into
+  # a lap time on any circuit of the archive
+  relative_paces     = {}
+  circuit_references = {}
+  for session in database["sessions"].values():
+    if session["reference"] is None:
+      continue
+
+    circuit_references.setdefault(session["circuit"], []).append(session["reference"])
+    for driver_name, driver in session["drivers"].items():
+      relative_paces.setdefault(driver_name, []).append((driver["pace"] / session["reference"],
+                                                         driver["clean_laps"]))
+
+  ratings = {}
+  for driver_name, paces in relative_paces.items():
+    paces, weights = np.array(paces).T
+    ratings[driver_name] = {"rating"     : float(np.average(paces, weights = weights)),
+                            "sessions"   : len(paces),
+                            "clean_laps" : int(weights.sum())}
+
+  circuit_references = {circuit : float(np.median(references))
+                        for circuit, references in circuit_references.items()}
+
+  return ratings, circuit_references
+
+def latest_circuit(database):
+  # The race files sort on their date, so the last session is the latest race
+  return last_known_circuit(session["circuit"] for session in database["sessions"].values()
+                            if session["reference"] is not None)
+
+##################
+# Balancer input #
+##################
+def balancer_lines(ratings, circuit_reference):
+  # The karters of kart_info.hpp of the group balancer, sorted on their lap
+  # time on the circuit
+  average_laps = sorted((rating["rating"] * circuit_reference, f"\"{driver_name}\",")
+                        for driver_name, rating in ratings.items())
+  name_width   = max((len(quoted_name) for _, quoted_name in average_laps), default = 0)
+
+  return [f"  karters.emplace_back({quoted_name:<{name_width}} {average_lap:.3f}, 1.0, 0, "
+          "std::initializer_list<std::size_t>{});"
+          for average_lap, quoted_name in average_laps]
+
+################
+# Main program #
+################
+if __name__ == "__main__":
+  parser = argparse.ArgumentParser(description = "Rate the pace of every driver over all " +
+                                                 "the races of the results archive.")
+
+  parser.add_argument("-r", "--results_folder",
+                      default = DEFAULT_RESULTS_FOLDER,
+                      help    = "The results folder with a folder per year and per race")
+  parser.add_argument("-d", "--database",
+                      default = DEFAULT_DATABASE,
+                      help    = "The YAML file with the paces of every race. Only the " +
+                                "races that are new or changed are read again")
+  parser.add_argument("-c", "--circuit",
+                      help = "The circuit of the lap times of the balancer input. The " +
+                             "default is the circuit of the latest race")
+  parser.add_argument("-b", "--balancer_output",
+                      help = "The output file with the karters for kart_info.hpp of " +
+                             "the group balancer")
+
+  args = parser.parse_args()
+
+  database      = load_database(args.database)
+  updated_files = update_database(database, args.results_folder)
+  save_database(database, args.database)
+
+  for race_file in updated_files:
+    print(f"Read {race_file}")
+
+  ratings, circuit_references = calculate_ratings(database)
+
+  circuit = args.circuit or latest_circuit(database)
+  if circuit not in circuit_references:
+    parser.error(f"No races on circuit {circuit}, the circuits are " +
+                 ", ".join(sorted(circuit_references)))
+
+  for driver_name, rating in sorted(ratings.items(), key = lambda item: item[1]["rating"]):
+    print(f"{driver_name:<30} {rating['rating'] * circuit_references[circuit]:7.3f} sec "
+          f"({rating['rating']:.4f} of the field, {rating['sessions']} sessions, "
+          f"{rating['clean_laps']} clean laps)")
+
+  if args.balancer_output is not None:
+    with open(args.balancer_output, 'w') as balancer_file:
+      balancer_file.write("\n".join(balancer_lines(ratings, circuit_references[circuit])) + "\n")
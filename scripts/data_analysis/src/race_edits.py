@@ -0,0 +1,344 @@
+import numpy as np
+
+import copy
+import yaml
+import bisect
+import argparse
+
+import race_model
+import race_analysis
+import stage_cache
+import stage_profiler
+
+# The parts of the analysis that the update changes in place: the values of the
+# edited teams and the timeline after the earliest edit. The other parts are
+# calculated again
+TEAM_VALUES    = ["team_has_stopped", "lap_times", "lap_drivers", "cumulative_times", "running_averages",
+                  "cumulative_times_extended", "teams_max_cumulative_time_index"]
+TIMELINES      = ["all_cumulative_times", "total_running_average"]
+TEAM_TIMELINES = ["interpolated_laps", "total_running_average_diff", "team_drivers"]
+
+###############
+# Race editor #
+###############
+class RaceEditor:
+  __slots__ = ("race", "teams", "first_edited_laps", "first_edited_time", "has_edited_laps")
+
+  def __init__(self, race):
+    self.race  = race
+    self.teams = {team.name : team for team in race.teams}
+
+    # The first edited lap of every edited team and the earliest race time
+    # that the edits change. Everything before it stays valid
+    self.first_edited_laps = {}
+    self.first_edited_time = None
+    self.has_edited_laps   = False
+
+  def get_team(self, team_name):
+    if team_name not in self.teams:
+      raise ValueError(f"Unknown team: {team_name}")
+
+    return self.teams[team_name]
+
+  def get_lap_index(self, team, lap, end_lap = 0):
+    # The lap numbers start at 1 like on the timing sheets
+    lap_index = lap - 1
+    if lap_index < 0 or lap_index >= len(team.lap_times) + end_lap:
+      raise ValueError(f"Team {team.name} has no lap {lap}")
+
+    return lap_index
+
+  def get_driver_code(self, driver):
+    # New drivers get the next free driver code
+    if driver not in self.race.drivers:
+      self.race.drivers.append(driver)
+
+    return self.race.drivers.index(driver)
+
+  def cumulative_time(self, team_name, number_of_laps):
+    return float(np.sum(self.teams[team_name].lap_times[:number_of_laps]))
+
+  def mark_edited(self, team, lap_index, edited_time):
+    self.first_edited_laps[team.name] = min(self.first_edited_laps.get(team.name, lap_index), lap_index)
+
+    if self.first_edited_time is None or edited_time < self.first_edited_time:
+      self.first_edited_time = edited_time
+
+  def mark_edited_laps(self, team, lap_index):
+    # The timeline changes from the start of the edited lap on
+    team.stints          = race_model.find_stints(team.lap_drivers)
+    self.has_edited_laps = True
+    self.mark_edited(team, lap_index, self.cumulative_time(team.name, lap_index))
+
+  def change_lap(self, team_name, lap, lap_time = None, driver = None):
+    team      = self.get_team(team_name)
+    lap_index = self.get_lap_index(team, lap)
+
+    if lap_time is not None:
+      team.lap_times[lap_index] = lap_time
+
+    if driver is not None:
+      team.lap_drivers[lap_index] = self.get_driver_code(driver)
+
+    self.mark_edited_laps(team, lap_index)
+
+  def insert_lap(self, team_name, lap, lap_time, driver):
+    # The new lap gets the given lap number, so lap 1 inserts a lap at the
+    # start and one more than the number of laps adds a lap at the end
+    team      = self.get_team(team_name)
+    lap_index = self.get_lap_index(team, lap, end_lap = 1)
+
+    team.lap_times   = np.insert(team.lap_times, lap_index, lap_time)
+    team.lap_drivers = np.insert(team.lap_drivers, lap_index, self.get_driver_code(driver))
+
+    self.mark_edited_laps(team, lap_index)
+
+  def remove_lap(self, team_name, lap):
+    team      = self.get_team(team_name)
+    lap_index = self.get_lap_index(team, lap)
+
+    if len(team.lap_times) == 1:
+      raise ValueError(f"Team {team.name} needs at least one lap")
+
+    team.lap_times   = np.delete(team.lap_times, lap_index)
+    team.lap_drivers = np.delete(team.lap_drivers, lap_index)
+
+    self.mark_edited_laps(team, lap_index)
+
+  def stop_team(self, team_name, has_stopped = True):
+    # Stopping a team only changes the timeline after its last lap
+    team             = self.get_team(team_name)
+    team.has_stopped = has_stopped
+
+    number_of_laps = len(team.lap_times)
+    self.mark_edited(team, number_of_laps, self.cumulative_time(team.name, number_of_laps))
+
+  def apply(self, edit):
+    action = edit.get("action")
+    if action == "change_lap":
+      self.change_lap(edit["team"], edit["lap"], edit.get("time"), edit.get("driver"))
+    elif action == "insert_lap":
+      self.insert_lap(edit["team"], edit["lap"], edit["time"], edit["driver"])
+    elif action == "remove_lap":
+      self.remove_lap(edit["team"], edit["lap"])
+    elif action == "stop_team":
+      self.stop_team(edit["team"], edit.get("has_stopped", True))
+    else:
+      raise ValueError(f"Unknown edit action: {action}")
+
+def load_edits(filename):
+  with open(filename, 'r') as edits_file:
+    return yaml.safe_load(edits_file) or []
+
+#####################################
+# Update the analysis after an edit #
+#####################################
+def copy_analysis(analysis, race):
+  # A copy of the analysis that can be updated for the edited race. Only the
+  # parts that the update changes in place are copied, the update replaces the
+  # other parts
+  copied_analysis = dict(analysis, race = race)
+  for name in TEAM_VALUES:
+    copied_analysis[name] = dict(analysis[name])
+  for name in TIMELINES:
+    copied_analysis[name] = list(analysis[name])
+  for name in TEAM_TIMELINES:
+    copied_analysis[name] = {team_name : list(values) for team_name, values in analysis[name].items()}
+
+  return copied_analysis
+
+def update_team_data(race, analysis, editor):
+  # Only the laps from the first edited lap on get new cumulative times. The
+  # cumulative sum goes on from the last unchanged lap so the times are the
+  # same as a full cumulative sum
+  for team_name, first_lap_index in editor.first_edited_laps.items():
+    team = editor.teams[team_name]
+    analysis["team_has_stopped"][team_name] = team.has_stopped
+
+    if first_lap_index >= len(team.lap_times) and \
+       len(analysis["lap_times"][team_name]) == len(team.lap_times):
+      continue
+
+    previous_times = analysis["cumulative_times"][team_name][:first_lap_index]
+    start_time     = previous_times[-1:] if first_lap_index > 0 else [0.0]
+    edited_times   = np.cumsum(np.concatenate([start_time, team.lap_times[first_lap_index:]]))[1:]
+
+    cumulative_times = np.concatenate([previous_times, edited_times])
+    running_averages = np.concatenate([analysis["running_averages"][team_name][:first_lap_index],
+                                       edited_times / np.arange(first_lap_index + 1, len(team.lap_times) + 1)])
+
+    analysis["lap_times"][team_name]        = team.lap_times
+    analysis["lap_drivers"][team_name]      = race_model.lap_driver_names(race, team)
+    analysis["cumulative_times"][team_name] = cumulative_times
+    analysis["running_averages"][team_name] = running_averages
+
+def update_cumulative_times_extended(analysis, editor):
+  cumulative_times          = analysis["cumulative_times"]
+  lap_times                 = analysis["lap_times"]
+  lap_drivers               = analysis["lap_drivers"]
+  cumulative_times_extended = analysis["cumulative_times_extended"]
+
+  # The extended times of the other teams only change when the end of the
+  # race moved
+  old_max_cumulative_time = analysis["all_cumulative_times"][-1]
+  max_cumulative_time     = max(team_cumulative_times[-1] for team_cumulative_times in cumulative_times.values())
+
+  for team_name, team_cumulative_times in cumulative_times.items():
+    if team_name in editor.first_edited_laps or max_cumulative_time != old_max_cumulative_time:
+      cumulative_times_extended[team_name] = race_analysis.extend_cumulative_times(team_name,
+                                                                                   team_cumulative_times,
+                                                                                   lap_times[team_name],
+                                                                                   lap_drivers[team_name],
+                                                                                   max_cumulative_time)
+
+def update_timeline(analysis, editor):
+  cumulative_times                = analysis["cumulative_times"]
+  cumulative_times_extended       = analysis["cumulative_times_extended"]
+  team_has_stopped                = analysis["team_has_stopped"]
+  all_cumulative_times            = analysis["all_cumulative_times"]
+  interpolated_laps               = analysis["interpolated_laps"]
+  teams_max_cumulative_time_index = analysis["teams_max_cumulative_time_index"]
+  total_running_average           = analysis["total_running_average"]
+  total_running_average_diff      = analysis["total_running_average_diff"]
+  team_drivers                    = analysis["team_drivers"]
+  race_time_index                 = analysis["time_index"]
+
+  # Only the merged times from the earliest edited time on are recalculated.
+  # A small margin keeps the times that are equal within the tolerance
+  first_time  = editor.first_edited_time - 1e-6
+  first_index = bisect.bisect_left(all_cumulative_times, first_time)
+
+  edited_times = np.sort(np.concatenate([team_cumulative_times[np.searchsorted(team_cumulative_times, first_time):]
+                                         for team_cumulative_times in cumulative_times.values()]))
+  all_cumulative_times[first_index:] = edited_times.tolist()
+
+  drivers = race_time_index.drivers_at(edited_times)
+
+  sum_team_laps       = np.zeros(len(edited_times))
+  sum_cumulative_time = np.zeros(len(edited_times))
+  for team_index, team_name in enumerate(race_time_index.team_names):
+    interpolated_laps[team_name][first_index:] = \
+      race_analysis.interpolate_laps(cumulative_times_extended[team_name],
+                                     cumulative_times[team_name],
+                                     team_has_stopped[team_name],
+                                     edited_times).tolist()
+
+    # The teams that ended before the edited part keep their last index
+    if team_name in editor.first_edited_laps or \
+       teams_max_cumulative_time_index[team_name] >= first_index - 1:
+      teams_max_cumulative_time_index[team_name] = \
+        first_index + race_analysis.find_max_cumulative_time_index(edited_times,
+                                                                   cumulative_times[team_name][-1])
+
+    max_index = teams_max_cumulative_time_index[team_name]
+
+    # The same sums as the total running average of the full timeline, in the
+    # same team order
+    team_laps = np.asarray(interpolated_laps[team_name][first_index:])
+    times     = edited_times
+    if team_has_stopped[team_name]:
+      is_valid  = np.arange(first_index, len(all_cumulative_times)) <= max_index
+      team_laps = np.where(is_valid, team_laps, interpolated_laps[team_name][max_index])
+      times     = np.where(is_valid, times, all_cumulative_times[max_index])
+
+    sum_team_laps       = sum_team_laps + team_laps
+    sum_cumulative_time = sum_cumulative_time + times
+
+    team_drivers[team_name][first_index:] = drivers[:max(max_index + 1 - first_index, 0), team_index].tolist()
+
+  edited_average = sum_cumulative_time / sum_team_laps
+  total_running_average[first_index:] = edited_average.tolist()
+
+  for team_name in race_time_index.team_names:
+    team_laps = np.asarray(interpolated_laps[team_name][first_index:])
+    total_running_average_diff[team_name][first_index:] = (edited_times / team_laps - edited_average).tolist()
+
+def update_analysis(race,
+                    analysis,
+                    editor,
+                    profiler = stage_profiler.NO_PROFILER):
+  # Update the analysis of the race before the edits in place. The cumulative
+  # times of the edited teams and the timeline after the earliest edit are
+  # updated, the lap flags, the time index, the position sweep and the driver
+  # data are calculated again for the whole race
+  if editor.first_edited_time is None:
+    return analysis
+
+  with profiler.stage("Update the edited teams"):
+    update_team_data(race, analysis, editor)
+    update_cumulative_times_extended(analysis, editor)
+
+  # The lap flags only look at the laps around every lap, classifying all the
+  # laps again is cheap
+  if editor.has_edited_laps:
+    with profiler.stage("Classify the pit, in, out, outlier and caution laps"):
+      race_analysis.calculate_lap_flags(race, analysis)
+
+  with profiler.stage("Build the time-point index"):
+    race_analysis.calculate_time_index(race, analysis)
+
+  with profiler.stage("Update the timeline after the edits"):
+    update_timeline(analysis, editor)
+
+  # The running order and the driver data depend on all the laps, so they are
+  # calculated again. Stopping a team doesn't change the driver data
+  with profiler.stage("Sweep the position changes"):
+    race_analysis.calculate_positions(race, analysis)
+
+  if editor.has_edited_laps:
+    race_analysis.analyse_drivers(race, analysis, profiler)
+
+  return analysis
+
+def edit_race(analysis,
+              edits,
+              profiler = stage_profiler.NO_PROFILER,
+              cache    = stage_cache.NO_CACHE):
+  # Apply the edits to a copy of the race of the analysis and update a copy of
+  # the analysis, the analysis of the caller stays the one before the edits.
+  # The updated timeline is cached like a timeline of a full analysis
+  race   = copy.deepcopy(analysis["race"])
+  editor = RaceEditor(race)
+  for edit in edits:
+    editor.apply(edit)
+
+  edited_analysis = race_analysis.create_analysis(race)
+
+  def update():
+    updated_analysis = update_analysis(race, copy_analysis(analysis, race), editor, profiler)
+
+    return {name : value for name, value in updated_analysis.items()
+            if name not in edited_analysis}
+
+  edited_analysis.update(cache.cached(stage_name = "timeline",
+                                      key        = edited_analysis["timeline_digest"],
+                                      compute    = update))
+
+  return edited_analysis
+
+################
+# Main program #
+################
+if __name__ == "__main__":
+  parser = argparse.ArgumentParser(description = "Apply lap corrections and stopped " +
+                                                 "teams to the karting data.")
+
+  parser.add_argument("-i", "--input",
+                      required = True,
+                      help     = "The input YAML file containing all the karting data")
+  parser.add_argument("-e", "--edits",
+                      required = True,
+                      help     = "The YAML file with the list of edits")
+  parser.add_argument("-o", "--output",
+                      required = True,
+                      help     = "The output YAML file containing the edited karting data")
+
+  args = parser.parse_args()
+
+  race   = race_model.load_race(args.input)
+  editor = RaceEditor(race)
+  for edit in load_edits(args.edits):
+    editor.apply(edit)
+
+  with open(args.output, 'w') as output_file:
+    yaml.safe_dump(race_model.race_to_dict(race), output_file, sort_keys = False)
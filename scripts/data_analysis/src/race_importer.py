@@ -0,0 +1,574 @@
+import numpy as np
+
+import os
+import re
+import csv
+import sys
+import glob
+import datetime
+import argparse
+import yaml
+import openpyxl
+
+import race_model
+import race_archive
+import finish_projection
+
+# The exports of the timing system in a race folder, in order of preference.
+# The spreadsheets with the date and the circuit in their name are our own
+# analyses and are not imported
+SOURCE_FILENAMES = ["karting_results.xlsx",
+                    "karting_results.csv",
+                    "karting_results.txt"]
+
+# The column headers of the results table, in Dutch like the timing system of
+# the circuits and in English
+RESULT_HEADERS = {"pos."          : "finish_position",
+                  "pos"           : "finish_position",
+                  "position"      : "finish_position",
+                  "kart"          : "kart_number",
+                  "team"          : "team_name",
+                  "rondes"        : "laps",
+                  "laps"          : "laps",
+                  "afstand"       : "distance_to_winner",
+                  "distance"      : "distance_to_winner",
+                  "snelste ronde" : "best_lap",
+                  "best lap"      : "best_lap"}
+
+# The rows of a printout, like "05/12/2024 - 20:00", "### KART BLANCHE ###",
+# "Joost: 30 min", "1:00.468" or "36.402"
+DATE_PATTERN        = re.compile(r"^\d{2}/\d{2}/\d{4}(?: - \d{2}:\d{2})?$")
+DATE_IN_NAME        = re.compile(r"\d{2}/\d{2}/\d{4}")
+BANNER_PATTERN      = re.compile(r"^#+\s*([^#].*?)\s*#+$")
+ORDER_PATTERN       = re.compile(r"^(.+?)\s*:\s*(\d+(?:\.\d*)?)\s*min$")
+TIME_PATTERN        = re.compile(r"^(?:(\d+):)?(\d+(?:\.\d*)?)$")
+
+# The banner of the lap times of a team in a spreadsheet, like
+# "2 - FAST FORMATTING TEAM"
+KART_BANNER_PATTERN = re.compile(r"^(\d+) - (.+)$")
+
+# The kart of a team when the export doesn't have it
+UNKNOWN_KART = 0
+
+# The pit stop of a driver change is the slowest lap at most this many seconds
+# from the planned change
+PIT_WINDOW = 300.0
+
+####################
+# Helper functions #
+####################
+def clean_cell(value):
+  if isinstance(value, str):
+    value = value.strip()
+    return value if value != "" else None
+
+  return value
+
+def parse_time(value):
+  # The spreadsheets of the timing system have the times in milliseconds, like
+  # 33920, and the printouts in seconds, like "36.402" or "1:00.468"
+  if value is None or isinstance(value, bool):
+    return None
+
+  if isinstance(value, (int, float)):
+    return value / 1000.0
+
+  # Openpyxl gives a cell with a time format like mm:ss.000 as a time
+  if isinstance(value, datetime.timedelta):
+    return value.total_seconds()
+
+  if isinstance(value, datetime.time):
+    return 3600.0 * value.hour + 60.0 * value.minute + value.second + value.microsecond / 1e6
+
+  if not isinstance(value, str):
+    return None
+
+  match = TIME_PATTERN.match(value.replace(",", ""))
+  if match is None:
+    return None
+
+  minutes, seconds = match.groups()
+  if minutes is None and "." not in seconds:
+    return int(seconds) / 1000.0
+
+  return 60.0 * int(minutes or 0) + float(seconds)
+
+def parse_integer(value):
+  try:
+    return int(float(value))
+  except (TypeError, ValueError):
+    return None
+
+def format_distance(laps_behind, time_behind):
+  # The normalised distance to the winner, like "0 sec", "2 laps" or
+  # "1 lap 14.248 sec", which race_model.parse_distance_to_winner reads back
+  parts = []
+  if laps_behind > 0:
+    parts.append(f"{laps_behind} lap" if laps_behind == 1 else f"{laps_behind} laps")
+
+  if time_behind:
+    parts.append(f"{time_behind:.3f} sec")
+
+  return " ".join(parts) if parts else "0 sec"
+
+def normalise_distance(value, laps_behind = 0):
+  # The winner has no distance and a distance in seconds is a number of
+  # milliseconds in the spreadsheets. The laps behind of the results are used
+  # when the distance only has the seconds
+  if value is None:
+    return format_distance(laps_behind, None)
+
+  if isinstance(value, (int, float)) or value.isdigit():
+    return format_distance(laps_behind, parse_time(value))
+
+  distance_laps, time_behind = race_model.parse_distance_to_winner(value)
+  if distance_laps is None:
+    return value
+
+  return format_distance(distance_laps or laps_behind, time_behind)
+
+def is_separator(text):
+  # The lines of dashes and hashes around the tables and the team names
+  return set(text) <= set("-#=")
+
+def assign_drivers(lap_times, order):
+  # Without a driver order the driver of every lap is unknown. Otherwise the
+  # pit stop of every planned driver change is the slowest lap close to it
+  if not order:
+    return [race_model.UNKNOWN_DRIVER] * len(lap_times)
+
+  end_times    = np.cumsum(lap_times)
+  change_times = np.cumsum([60.0 * minutes for _, minutes in order])[:-1]
+
+  drivers   = np.empty(len(lap_times), dtype = object)
+  first_lap = 0
+  for (driver, _), change_time in zip(order, change_times):
+    window = np.flatnonzero((np.abs(end_times - change_time) <= PIT_WINDOW) &
+                            (np.arange(len(lap_times)) >= first_lap))
+    if len(window) == 0:
+      pit_lap = max(first_lap, int(np.searchsorted(end_times, change_time)))
+    else:
+      pit_lap = int(window[np.argmax(lap_times[window])])
+
+    pit_lap = min(pit_lap, len(lap_times))
+    drivers[first_lap:pit_lap] = driver
+    drivers[pit_lap:pit_lap + 1] = race_model.PIT_DRIVER
+    first_lap = pit_lap + 1
+
+  drivers[first_lap:] = order[-1][0]
+
+  return drivers.tolist()
+
+##########
+# Sheets #
+##########
+def read_sheets(filename):
+  # Every sheet is a session with a stream of rows, so only a single row of a
+  # big export is in memory at a time
+  extension = os.path.splitext(filename)[1].lower()
+
+  if extension == ".xlsx":
+    workbook = openpyxl.load_workbook(filename, read_only = True, data_only = True)
+    try:
+      for worksheet in workbook.worksheets:
+        yield worksheet.title, worksheet.iter_rows(values_only = True)
+    finally:
+      workbook.close()
+
+  elif extension == ".csv":
+    with open(filename, 'r', newline = "", encoding = "utf-8-sig") as csv_file:
+      # The timing system exports with semicolons in a Dutch locale, so the
+      # delimiter is the most common one at the start of the export
+      sample    = csv_file.read(4096)
+      delimiter = max(",;\t", key = sample.count)
+      csv_file.seek(0)
+      yield os.path.basename(filename), csv.reader(csv_file, delimiter = delimiter)
+
+  elif extension == ".txt":
+    with open(filename, 'r', encoding = "utf-8") as text_file:
+      yield os.path.basename(filename), (line.split("|") for line in text_file)
+
+  else:
+    raise ValueError(f"Unknown export format {extension} of {filename}")
+
+##################
+# Session parser #
+##################
+class SessionParser:
+  # Parses the rows of a sheet one at a time. A spreadsheet of the timing system
+  # has the results table and the lap times of the teams in a grid under
+  # "Overzicht rondetijden", or a grid for every team under its kart and name.
+  # A printout has the results table and a section for every team with its
+  # driver order and its lap times
+  def __init__(self):
+    self.title       = None
+    self.date        = None
+    self.tables      = []
+    self.lap_times   = {}
+    self.karts       = {}
+    self.orders      = {}
+    self.state       = "header"
+    self.lap_columns = None
+    self.team_column = None
+    self.team        = None
+
+  def add_row(self, row):
+    cells = [clean_cell(value) for value in row]
+    while cells and cells[-1] is None:
+      cells.pop()
+
+    if not cells:
+      return
+
+    text = cells[0] if len(cells) == 1 and isinstance(cells[0], str) else None
+    if text is not None and is_separator(text):
+      return
+
+    if self.add_header(cells):
+      return
+
+    if text is not None:
+      self.add_text(text)
+    elif self.state == "results":
+      self.add_result(cells)
+    elif self.state == "laps":
+      self.add_lap_row(cells)
+
+  def add_header(self, cells):
+    names = [cell.lower() if isinstance(cell, str) else None for cell in cells]
+
+    # The lap times grid of all the teams is the kart, the team and the lap
+    # numbers, followed by the average lap
+    if names[:2] == ["kart", "team"] and len(cells) > 2 and parse_integer(cells[2]) == 1:
+      self.start_lap_grid(cells, first_column = 2, team_column = 1)
+      return True
+
+    # The lap times grid of a single team under its kart and name is "Rondes"
+    # and the lap numbers. The first column is the laps before the row
+    if names[0] == "rondes" and len(cells) > 1 and parse_integer(cells[1]) == 1 and self.state == "kart":
+      self.start_lap_grid(cells, first_column = 1, team_column = None)
+      return True
+
+    # The header of the results table is the known columns. A results table
+    # can be split in two parts, where the header of the second part is on the
+    # last row of the first part
+    header_indices = [index for index, name in enumerate(names) if name in RESULT_HEADERS]
+    if len(header_indices) < 2 or \
+       any(cell is not None and names[index] not in RESULT_HEADERS
+           for index, cell in enumerate(cells) if index >= header_indices[0]) or \
+       any(name is not None for name in names[:header_indices[0]]):
+      return False
+
+    if header_indices[0] > 0 and self.state == "results":
+      self.add_result(cells[:header_indices[0]])
+
+    self.state = "results"
+    self.tables.append({"columns" : {RESULT_HEADERS[names[index]] : index for index in header_indices},
+                        "rows"    : []})
+    return True
+
+  def start_lap_grid(self, cells, first_column, team_column):
+    self.state       = "laps"
+    self.team_column = team_column
+    self.lap_columns = [index for index, cell in enumerate(cells)
+                        if index >= first_column and parse_integer(cell) is not None]
+
+  def add_text(self, text):
+    banner      = BANNER_PATTERN.match(text)
+    kart_banner = KART_BANNER_PATTERN.match(text)
+    order       = ORDER_PATTERN.match(text)
+
+    if banner is not None:
+      self.state = "team"
+      self.team  = banner.group(1)
+    elif kart_banner is not None:
+      self.state = "kart"
+      self.team  = kart_banner.group(2)
+      self.karts[self.team] = int(kart_banner.group(1))
+    elif self.state == "header":
+      # The last title above the results table is the race name
+      if DATE_PATTERN.match(text):
+        self.date = text
+      else:
+        self.title = text
+    elif text.lower() == "order:" and self.team is not None:
+      self.state = "order"
+    elif text.lower() == "lap times:" and self.team is not None:
+      self.state = "lap times"
+    elif self.state == "order" and order is not None:
+      self.orders.setdefault(self.team, []).append((order.group(1), float(order.group(2))))
+    elif self.state in ("team", "lap times"):
+      # Some printouts have the lap times right under the team name
+      lap_time = parse_time(text)
+      if lap_time is not None:
+        self.lap_times.setdefault(self.team, []).append(lap_time)
+
+  def add_result(self, cells):
+    table  = self.tables[-1]
+    values = {name : cells[index] if index < len(cells) else None
+              for name, index in table["columns"].items()}
+
+    if any(value is not None for value in values.values()):
+      table["rows"].append(values)
+
+  def add_lap_row(self, cells):
+    # A team of the grid of all the teams starts on a new row and continues
+    # on the rows with an empty team
+    if self.team_column is not None and len(cells) > self.team_column and cells[self.team_column] is not None:
+      self.team = str(cells[self.team_column])
+
+    if self.team is None:
+      return
+
+    lap_times = self.lap_times.setdefault(self.team, [])
+    for index in self.lap_columns:
+      if index < len(cells):
+        lap_time = parse_time(cells[index])
+        if lap_time is not None:
+          lap_times.append(lap_time)
+
+  def race_name(self):
+    if self.title is None:
+      return None
+
+    if self.date is None or DATE_IN_NAME.search(self.title):
+      return self.title
+
+    return f"{self.title} {self.date}"
+
+  def result_rows(self):
+    # The rows of a table without teams, like the positions and the karts,
+    # belong to the rows of the next table with the teams
+    rows          = []
+    partial_table = None
+    for table in self.tables:
+      table_rows = table["rows"]
+      if partial_table is not None:
+        if len(partial_table["rows"]) != len(table_rows):
+          raise ValueError(f"The results table with {len(partial_table['rows'])} rows is followed by " +
+                           f"a part with {len(table_rows)} rows")
+
+        table_rows    = [{**partial_row, **row} for partial_row, row in zip(partial_table["rows"], table_rows)]
+        partial_table = None
+      elif "team_name" not in table["columns"]:
+        partial_table = table
+        continue
+
+      rows.extend(row for row in table_rows if row.get("team_name") is not None)
+
+    if partial_table is not None:
+      raise ValueError("A results table has no teams")
+
+    return rows
+
+  def results(self):
+    # The results of the teams without their laps. A distance in seconds gets
+    # the laps behind from the laps of the team, because the spreadsheets only
+    # keep the seconds of a distance like "1 lap 19.648 sec"
+    rows        = self.result_rows()
+    laps        = [parse_integer(row.get("laps")) for row in rows]
+    winner_laps = max((team_laps for team_laps in laps if team_laps is not None), default = None)
+
+    results = []
+    for index, (row, team_laps) in enumerate(zip(rows, laps)):
+      team_name   = str(row["team_name"])
+      laps_behind = winner_laps - team_laps if team_laps is not None else 0
+
+      results.append({"team_name"          : team_name,
+                      "finish_position"    : parse_integer(row.get("finish_position")) or index + 1,
+                      "kart_number"        : parse_integer(row.get("kart_number")) or
+                                             self.karts.get(team_name, UNKNOWN_KART),
+                      "distance_to_winner" : normalise_distance(row.get("distance_to_winner"), laps_behind)})
+
+    return results
+
+  def lap_results(self):
+    # A printout with only the lap times is ranked on laps and on time like
+    # the timing system does
+    totals = sorted(((team_name, len(lap_times), sum(lap_times))
+                     for team_name, lap_times in self.lap_times.items() if lap_times),
+                    key = lambda total: (-total[1], total[2]))
+    if not totals:
+      return []
+
+    _, winner_laps, winner_time = totals[0]
+    return [{"team_name"          : team_name,
+             "finish_position"    : position + 1,
+             "kart_number"        : self.karts.get(team_name, UNKNOWN_KART),
+             "distance_to_winner" : format_distance(winner_laps - laps,
+                                                    total_time - winner_time if laps == winner_laps else None)}
+            for position, (team_name, laps, total_time) in enumerate(totals)]
+
+#############
+# Importing #
+#############
+def parse_sheets(filename):
+  sheets = []
+  for sheet_name, rows in read_sheets(filename):
+    parser = SessionParser()
+    for row in rows:
+      parser.add_row(row)
+
+    sheets.append((sheet_name, parser, parser.results()))
+
+  return sheets
+
+def join_sheets(sheets):
+  # A sheet with only the results and a sheet with only the lap times of the
+  # same teams are one session, like the race of a workbook with the results
+  # and the lap times on different sheets
+  lap_sheets = [(sheet_name, parser) for sheet_name, parser, results in sheets
+                if parser.lap_times and not results]
+
+  joined = []
+  for sheet_name, parser, results in sheets:
+    if parser.lap_times and not results:
+      continue
+
+    if results and not parser.lap_times:
+      team_names = {result["team_name"] for result in results}
+      matches    = [lap_sheet for lap_sheet in lap_sheets if set(lap_sheet[1].lap_times) == team_names]
+      if not matches:
+        raise ValueError(f"No lap times for the results of sheet {sheet_name}")
+
+      lap_sheets.remove(matches[0])
+      parser.lap_times = matches[0][1].lap_times
+      parser.karts     = {**matches[0][1].karts, **parser.karts}
+      sheet_name       = f"{sheet_name} + {matches[0][0]}"
+
+    joined.append((sheet_name, parser, results))
+
+  # The lap times without results in a sheet of their own are ranked on laps
+  # and on time, like a printout with only the lap times
+  for sheet_name, parser in lap_sheets:
+    joined.append((sheet_name, parser, parser.lap_results()))
+
+  return joined
+
+def import_sessions(filename, plans = None):
+  # All the sessions of an export, like the qualification and the race of a
+  # workbook. The race folder names a session without a title, like
+  # 2025_03_23. The planned stints of a plans file replace the driver order of
+  # a printout
+  default_name = os.path.basename(os.path.dirname(os.path.abspath(filename)))
+
+  sessions = []
+  for sheet_name, parser, results in join_sheets(parse_sheets(filename)):
+    if not results:
+      continue
+
+    team_names = {result["team_name"] for result in results}
+    if team_names != set(parser.lap_times):
+      missing = sorted(team_names ^ set(parser.lap_times))
+      raise ValueError(f"The results and the lap times of sheet {sheet_name} don't have the " +
+                       f"same teams: {', '.join(missing)}")
+
+    orders = {**parser.orders,
+              **{team_name : [(stint["driver"], stint["minutes"]) for stint in stints]
+                 for team_name, stints in (plans or {}).items()}}
+
+    teams = []
+    for result in sorted(results, key = lambda result: result["finish_position"]):
+      lap_times = parser.lap_times[result["team_name"]]
+      drivers   = assign_drivers(np.array(lap_times), orders.get(result["team_name"]))
+
+      teams.append({**result,
+                    "laps" : [{"time" : lap_time, "driver" : driver}
+                              for lap_time, driver in zip(lap_times, drivers)]})
+
+    sessions.append({"race_name" : parser.race_name() or default_name,
+                     "results"   : teams})
+
+  return sessions
+
+def import_race(filename, plans = None):
+  # The race of an export is its longest session, so the qualification of a
+  # workbook isn't imported instead of the race. A sheet that can't be parsed
+  # completely fails the import instead of leaving out its session
+  sessions = import_sessions(filename, plans)
+  if not sessions:
+    raise ValueError(f"No results with lap times in {filename}")
+
+  races = [race_model.race_from_dict(session) for session in sessions]
+  return max(races, key = race_model.total_race_time)
+
+def write_race(race, filename):
+  with open(filename, 'w') as data_file:
+    # Keep the laps on a single line each like the results written by hand
+    yaml.safe_dump(race_model.race_to_dict(race),
+                   data_file,
+                   default_flow_style = None,
+                   sort_keys          = False,
+                   allow_unicode      = True,
+                   width              = 1000)
+
+def find_sources(results_folder, overwrite = False):
+  # The export of every race folder of the archive, skipping the folders that
+  # already have karting data unless they are overwritten
+  sources = []
+  for race_folder in sorted(glob.glob(os.path.join(results_folder, "*", "*"))):
+    if not overwrite and os.path.exists(os.path.join(race_folder, race_archive.RACE_FILENAME)):
+      continue
+
+    for source_filename in SOURCE_FILENAMES:
+      filename = os.path.join(race_folder, source_filename)
+      if os.path.exists(filename):
+        sources.append(filename)
+        break
+
+  return sources
+
+################
+# Main program #
+################
+if __name__ == "__main__":
+  parser = argparse.ArgumentParser(description = "Import the exports and printouts of the " +
+                                                 "timing system into the karting data format.")
+
+  parser.add_argument("-i", "--input",
+                      action = "append",
+                      help   = "An xlsx, CSV or text export to import. The default is every " +
+                               "race folder of the results folder without karting data")
+  parser.add_argument("-o", "--output",
+                      help = "The output YAML file of a single input. The default is the " +
+                             "karting data file next to the input")
+  parser.add_argument("-r", "--results_folder",
+                      default = race_archive.DEFAULT_RESULTS_FOLDER,
+                      help    = "The results folder with a folder for every race")
+  parser.add_argument("-p", "--plans",
+                      help = "The YAML file with the driver order of the teams. The " +
+                             "printouts already contain it")
+  parser.add_argument("--overwrite",
+                      action = "store_true",
+                      help   = "Also import the race folders that already have karting data")
+
+  args = parser.parse_args()
+
+  if args.output is not None and (args.input is None or len(args.input) != 1):
+    parser.error("--output needs a single --input")
+
+  plans   = finish_projection.load_plans(args.plans) if args.plans is not None else None
+  sources = args.input or find_sources(args.results_folder, args.overwrite)
+
+  # An export that can't be imported completely is reported and fails the
+  # import after the other exports are imported
+  failures = []
+  for source in sources:
+    output = args.output or os.path.join(os.path.dirname(source), race_archive.RACE_FILENAME)
+    if args.input is not None and not args.overwrite and os.path.exists(output):
+      print(f"Skip {source}: {output} already exists")
+      continue
+
+    try:
+      race = import_race(source, plans)
+    except ValueError as error:
+      print(f"Failed to import {source}: {error}", file = sys.stderr)
+      failures.append(source)
+      continue
+
+    write_race(race, output)
+    print(f"Imported {race.name} ({len(race.teams)} teams, " +
+          f"{sum(len(team.lap_times) for team in race.teams)} laps) to {output}")
+
+  if failures:
+    sys.exit(1)
@@ -0,0 +1,250 @@
+import numpy as np
+
+import re
+import yaml
+
+import stage_cache
+
+# The name used in the karting data for the laps where the kart is in the pits.
+# It always gets driver code 0
+PIT_DRIVER = "Pit"
+PIT_CODE   = 0
+
+# The name used for the laps where the karting data doesn't tell who drove. The
+# tools that rate drivers skip these laps
+UNKNOWN_DRIVER = "Unknown driver"
+
+# The distance to the winner is a text like "0.217 sec", "2 laps", "1 lap
+# 14.248 sec" or "9 Rondes 25.528 sec" in the older results. The winner of the
+# older results has a distance of "0"
+DISTANCE_PATTERN = re.compile(r"^\s*(?:(\d+)\s*(?:laps?|rondes?))?\s*(?:(\d+(?:\.\d*)?)\s*(?:sec)?)?\s*$",
+                              re.IGNORECASE)
+
+##############
+# Data model #
+##############
+class Stint:
+  __slots__ = ("driver_code", "first_lap", "end_lap")
+
+  def __init__(self, driver_code, first_lap, end_lap):
+    self.driver_code = driver_code
+
+    # The stint contains the laps [first_lap, end_lap[ of the team
+    self.first_lap = first_lap
+    self.end_lap   = end_lap
+
+  def __repr__(self):
+    return f"Stint({self.driver_code}, {self.first_lap}, {self.end_lap})"
+
+class Team:
+  __slots__ = ("name", "finish_position", "kart_number", "distance_to_winner",
+               "has_stopped", "lap_times", "lap_drivers", "stints")
+
+  def __init__(self,
+               name,
+               finish_position,
+               kart_number,
+               distance_to_winner,
+               has_stopped,
+               lap_times,
+               lap_drivers):
+    self.name               = name
+    self.finish_position    = finish_position
+    self.kart_number        = kart_number
+    self.distance_to_winner = distance_to_winner
+    self.has_stopped        = has_stopped
+
+    # The lap times in seconds and the driver code of every lap
+    self.lap_times   = np.asarray(lap_times, dtype = np.float64)
+    self.lap_drivers = np.asarray(lap_drivers, dtype = np.uint16)
+
+    self.stints = find_stints(self.lap_drivers)
+
+  def __repr__(self):
+    return f"Team({self.name!r}, {len(self.lap_times)} laps)"
+
+class Race:
+  __slots__ = ("name", "teams", "drivers", "circuit")
+
+  def __init__(self, name, teams, drivers, circuit = None):
+    self.name = name
+
+    # The circuit of the race when the karting data names it, like extreme_kart
+    self.circuit = circuit
+
+    # The teams sorted on finish position. The first team is the winner
+    self.teams = teams
+
+    # The driver names indexed by the driver codes of the laps
+    self.drivers = drivers
+
+  def __repr__(self):
+    return f"Race({self.name!r}, {len(self.teams)} teams)"
+
+class Event:
+  __slots__ = ("name", "sessions")
+
+  def __init__(self, name, sessions):
+    self.name = name
+
+    # The races of the event in the order they were driven, like the heats
+    # before the finale
+    self.sessions = sessions
+
+  def __repr__(self):
+    return f"Event({self.name!r}, {len(self.sessions)} sessions)"
+
+##################
+# Model creation #
+##################
+def find_stints(lap_drivers):
+  if len(lap_drivers) == 0:
+    return []
+
+  # A new stint starts at every lap where the driver code changes
+  first_laps = np.flatnonzero(np.diff(lap_drivers)) + 1
+  first_laps = np.concatenate(([0], first_laps))
+  end_laps   = np.append(first_laps[1:], len(lap_drivers))
+
+  return [Stint(int(lap_drivers[first_lap]), int(first_lap), int(end_lap))
+          for first_lap, end_lap in zip(first_laps, end_laps)]
+
+def race_from_dict(karting_data):
+  drivers      = [PIT_DRIVER]
+  driver_codes = {PIT_DRIVER : PIT_CODE}
+
+  teams = []
+  for team_data in karting_data["results"]:
+    lap_drivers = []
+    for lap in team_data["laps"]:
+      driver = lap["driver"]
+      if driver not in driver_codes:
+        driver_codes[driver] = len(drivers)
+        drivers.append(driver)
+
+      lap_drivers.append(driver_codes[driver])
+
+    teams.append(Team(name               = team_data["team_name"],
+                      finish_position    = team_data["finish_position"],
+                      kart_number        = team_data["kart_number"],
+                      distance_to_winner = team_data["distance_to_winner"],
+                      has_stopped        = bool(team_data.get("has_stopped", False)),
+                      lap_times          = [lap["time"] for lap in team_data["laps"]],
+                      lap_drivers        = lap_drivers))
+
+  # Sort the teams on position for consistency
+  teams.sort(key = lambda team: team.finish_position)
+
+  return Race(name    = karting_data["race_name"],
+              teams   = teams,
+              drivers = drivers,
+              circuit = karting_data.get("circuit"))
+
+def race_to_dict(race):
+  results = []
+  for team in race.teams:
+    team_data = {"team_name"          : team.name,
+                 "finish_position"    : team.finish_position,
+                 "kart_number"        : team.kart_number,
+                 "distance_to_winner" : team.distance_to_winner}
+
+    if team.has_stopped:
+      team_data["has_stopped"] = True
+
+    team_data["laps"] = [{"time" : float(lap_time), "driver" : race.drivers[driver_code]}
+                         for lap_time, driver_code in zip(team.lap_times, team.lap_drivers)]
+
+    results.append(team_data)
+
+  race_data = {"race_name" : race.name}
+  if race.circuit is not None:
+    race_data["circuit"] = race.circuit
+
+  race_data["results"] = results
+
+  return race_data
+
+def parse_race(filename):
+  with open(filename, 'r') as data_file:
+    # The C loader is a lot faster for the big lap lists when it is available
+    loader = getattr(yaml, "CSafeLoader", yaml.SafeLoader)
+    karting_data = yaml.load(data_file, Loader = loader)
+
+  return race_from_dict(karting_data)
+
+def event_name(race_name):
+  # The race names start with the event, like "2 uren race - Finale - 20:00"
+  return race_name.split(" - ")[0].strip()
+
+def load_event(filenames, name = None, cache = stage_cache.NO_CACHE):
+  # Every session has its own file, so adding the finale only parses the
+  # finale when the heats are in the cache
+  sessions = [load_race(filename, cache) for filename in filenames]
+
+  return Event(name     = name or event_name(sessions[0].name),
+               sessions = sessions)
+
+def load_race(filename, cache = stage_cache.NO_CACHE):
+  # The parsed race only changes when the YAML file or the parser changes
+  key = [stage_cache.code_version(__file__),
+         stage_cache.hash_file(filename)]
+
+  return cache.cached(stage_name = "parse",
+                      key        = key,
+                      compute    = lambda: parse_race(filename))
+
+###################
+# Model functions #
+###################
+def cumulative_times(team):
+  return np.cumsum(team.lap_times)
+
+def running_averages(team):
+  return cumulative_times(team) / np.arange(1, len(team.lap_times) + 1)
+
+def lap_driver_names(race, team):
+  return np.array(race.drivers, dtype = object)[team.lap_drivers]
+
+def driver_laps_mask(team):
+  return team.lap_drivers != PIT_CODE
+
+def named_driver_laps_mask(race, team):
+  # The laps of a known driver. The older karting data gives the laps without a
+  # driver to the team itself, so these are unknown as well
+  driver_names = lap_driver_names(race, team)
+  return driver_laps_mask(team) & (driver_names != UNKNOWN_DRIVER) & (driver_names != team.name)
+
+def race_driver_names(race):
+  # All the drivers that drove at least one lap sorted on name
+  driven_codes = set()
+  for team in race.teams:
+    driven_codes.update(np.unique(team.lap_drivers[driver_laps_mask(team)]).tolist())
+
+  return sorted(race.drivers[code] for code in driven_codes)
+
+def driver_lap_times(race):
+  # We assume that the driver only rides for one team
+  lap_times_per_driver = {}
+  for team in race.teams:
+    for stint in team.stints:
+      if stint.driver_code == PIT_CODE:
+        continue
+
+      driver = race.drivers[stint.driver_code]
+      lap_times_per_driver.setdefault(driver, []).append(team.lap_times[stint.first_lap:stint.end_lap])
+
+  return {driver : np.concatenate(lap_times) for driver, lap_times in lap_times_per_driver.items()}
+
+def total_race_time(race):
+  return float(np.sum(race.teams[0].lap_times))
+
+def parse_distance_to_winner(distance):
+  # The laps and the seconds behind the winner. The seconds are None when the
+  # distance only gives laps and both are None for an unknown text
+  match = DISTANCE_PATTERN.match(str(distance))
+  if match is None or not any(match.groups()):
+    return None, None
+
+  laps_behind, time_behind = match.groups()
+  return (int(laps_behind) if laps_behind is not None else 0,
+          float(time_behind) if time_behind is not None else None)
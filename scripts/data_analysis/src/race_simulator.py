@@ -0,0 +1,338 @@
+import numpy as np
+
+import os
+import json
+import argparse
+import concurrent.futures
+import yaml
+
+import race_model
+import race_archive
+import kart_effects
+
+DEFAULT_RACES          = 10000
+DEFAULT_RACE_DURATION  = 120.0
+DEFAULT_STINT_DURATION = 20.0
+
+# The races of a group are simulated in chunks of this many races, so the lap
+# arrays of a chunk stay small enough for the memory of a laptop
+CHUNK_RACES = 500
+
+# A driver needs laps in at least this many sessions to use their own form
+# over the sessions instead of the form of all the drivers
+MIN_FORM_SESSIONS = 2
+
+####################
+# Helper functions #
+####################
+def load_balancer_output(filename):
+  with open(filename, 'r') as balancer_file:
+    if filename.endswith(".json"):
+      return json.load(balancer_file)
+
+    return yaml.safe_load(balancer_file)
+
+def group_values(values, groups, number_of_groups):
+  # The values of every group as one sorted pool with the offset and the count
+  # of every group, so sampling a value of a group is one index calculation
+  order   = np.argsort(groups, kind = "stable")
+  counts  = np.bincount(groups, minlength = number_of_groups)
+  offsets = np.cumsum(counts) - counts
+
+  return values[order], offsets, counts
+
+###################
+# Archive history #
+###################
+def session_history(race):
+  # The clean laps of every driver relative to their pace in the session, the
+  # pace of every driver relative to the reference of the session and the time
+  # lost in every pit lap. The pace and the reference are the medians like in
+  # the driver ratings
+  lap_times, lap_drivers, _ = kart_effects.session_laps(race)
+
+  driver_names, driver_indices, counts = np.unique(lap_drivers, return_inverse = True, return_counts = True)
+  paces = np.array([np.median(lap_times[driver_indices == index]) for index in range(len(driver_names))])
+
+  is_rated = counts >= race_archive.MIN_CLEAN_LAPS
+  if not np.any(is_rated):
+    return None
+
+  reference = np.median(paces[is_rated])
+  is_lap    = is_rated[driver_indices]
+
+  pit_laps = np.concatenate([team.lap_times[team.lap_drivers == race_model.PIT_CODE] for team in race.teams])
+
+  return {"residuals"      : lap_times[is_lap] / paces[driver_indices[is_lap]],
+          "lap_drivers"    : lap_drivers[is_lap],
+          "driver_names"   : driver_names[is_rated],
+          "relative_paces" : paces[is_rated] / reference,
+          "clean_laps"     : counts[is_rated],
+          "pit_losses"     : pit_laps - reference}
+
+def collect_history(results_folder, circuit):
+  # The lap and form history of every driver of the archive. The residuals and
+  # the forms are relative so they come from all the circuits, the pit losses
+  # depend on the pit lane and only come from the circuit when it has races
+  residuals      = {}
+  relative_paces = {}
+  pit_losses     = {}
+  for race_file in race_archive.find_race_files(results_folder):
+    filename = os.path.join(results_folder, race_file)
+    race     = race_model.parse_race(filename)
+    history  = session_history(race)
+    if history is None:
+      continue
+
+    for driver_name in history["driver_names"]:
+      residuals.setdefault(driver_name, []).append(history["residuals"][history["lap_drivers"] == driver_name])
+
+    for driver_name, relative_pace, clean_laps in zip(history["driver_names"],
+                                                      history["relative_paces"],
+                                                      history["clean_laps"]):
+      relative_paces.setdefault(driver_name, []).append((relative_pace, clean_laps))
+
+    race_circuit = race_archive.race_circuit(race, os.path.dirname(filename))
+    pit_losses.setdefault(race_circuit, []).append(history["pit_losses"])
+
+  if not residuals:
+    raise ValueError(f"No races with clean laps in {results_folder}")
+
+  # The form of a driver in a session is their relative pace divided by their
+  # rating, so it is the same as the rating over all the sessions
+  forms = {}
+  for driver_name, paces in relative_paces.items():
+    paces, weights     = np.array(paces).T
+    forms[driver_name] = paces / np.average(paces, weights = weights)
+
+  pit_losses = np.concatenate(pit_losses.get(circuit) or sum(pit_losses.values(), []))
+  pit_losses = pit_losses[pit_losses > 0]
+  if len(pit_losses) == 0:
+    pit_losses = np.zeros(1)
+
+  return {"residuals"  : {driver_name : np.concatenate(values) for driver_name, values in residuals.items()},
+          "forms"      : forms,
+          "pit_losses" : pit_losses}
+
+def karter_distributions(karter_names, history):
+  # The residual and the form pools of the karters. The karters without races
+  # in the archive get the laps of all the drivers and the karters with too few
+  # sessions get the forms of all the drivers
+  all_residuals = np.concatenate(list(history["residuals"].values()))
+  all_forms     = np.concatenate([forms for forms in history["forms"].values()
+                                  if len(forms) >= MIN_FORM_SESSIONS] or list(history["forms"].values()))
+
+  residuals = [history["residuals"].get(name, all_residuals) for name in karter_names]
+  forms     = [history["forms"][name] if len(history["forms"].get(name, [])) >= MIN_FORM_SESSIONS else all_forms
+               for name in karter_names]
+
+  def pool(values):
+    return group_values(np.concatenate(values),
+                        np.repeat(np.arange(len(values)), [len(value) for value in values]),
+                        len(values))
+
+  return pool(residuals), pool(forms)
+
+def team_schedules(teams, average_laps, race_efforts, stint_duration, number_of_laps):
+  # The karter of every lap of every team and the pit laps. The karters of a
+  # team rotate in their order in the team and the race effort sets the share
+  # of the stint time of every karter. A pit lap ends every stint
+  lap_karters = np.empty((len(teams), number_of_laps), dtype = np.int64)
+  is_pit      = np.zeros((len(teams), number_of_laps), dtype = bool)
+  for team_index, karters in enumerate(teams):
+    efforts    = race_efforts[karters]
+    stint_laps = np.maximum(np.rint(stint_duration * efforts / efforts.mean() / average_laps[karters]), 1).astype(np.int64)
+
+    rotation  = np.repeat(karters, stint_laps)
+    rotations = -(-number_of_laps // len(rotation))
+    lap_karters[team_index] = np.tile(rotation, rotations)[:number_of_laps]
+
+    stint_ends = np.cumsum(np.tile(stint_laps, rotations)) - 1
+    is_pit[team_index, stint_ends[stint_ends < number_of_laps]] = True
+
+  return lap_karters, is_pit
+
+##################
+# Race simulator #
+##################
+def simulate_races(average_laps,
+                   lap_karters,
+                   is_pit,
+                   residual_pool,
+                   form_pool,
+                   pit_losses,
+                   race_duration,
+                   races,
+                   seed):
+  # Simulate all the races of a chunk as arrays of races x teams x laps. Every
+  # karter gets a form per race and every lap a residual of the karter, both
+  # sampled from the history. The race ends at the race duration and the
+  # distance of a team is its laps plus the part of the lap it is in. Returns
+  # the wins, the sum of the positions and the sums of the gaps to the winner
+  rng = np.random.default_rng(seed)
+  residuals, residual_offsets, residual_counts = residual_pool
+  forms, form_offsets, form_counts             = form_pool
+
+  number_of_teams, number_of_laps = lap_karters.shape
+  number_of_karters               = len(average_laps)
+
+  form_indices = form_offsets + (rng.random((races, number_of_karters)) * form_counts).astype(np.int64)
+  karter_paces = average_laps * forms[form_indices]
+  lap_indices  = residual_offsets[lap_karters] + \
+                 (rng.random((races, number_of_teams, number_of_laps)) * residual_counts[lap_karters]).astype(np.int64)
+  lap_times    = karter_paces[:, lap_karters] * residuals[lap_indices]
+  lap_times[:, is_pit] += pit_losses[rng.integers(len(pit_losses), size = (races, int(is_pit.sum())))]
+
+  cumulative = np.cumsum(lap_times, axis = 2)
+  laps_done  = np.sum(cumulative <= race_duration, axis = 2)
+
+  # The time at the line of the last completed lap and the lap after it
+  last_times = np.take_along_axis(np.concatenate([np.zeros((races, number_of_teams, 1)), cumulative], axis = 2),
+                                  laps_done[:, :, np.newaxis], axis = 2)[:, :, 0]
+  next_laps  = np.take_along_axis(lap_times, np.minimum(laps_done, number_of_laps - 1)[:, :, np.newaxis], axis = 2)[:, :, 0]
+  distances  = laps_done + (race_duration - last_times) / next_laps
+
+  # The gap is the distance to the winner at the average lap of the team
+  positions = np.argsort(np.argsort(-distances, axis = 1), axis = 1)
+  gaps      = (distances.max(axis = 1, keepdims = True) - distances) * race_duration / distances
+
+  return {"wins"         : np.bincount(np.argmax(distances, axis = 1), minlength = number_of_teams),
+          "positions"    : (positions + 1).sum(axis = 0),
+          "gaps"         : gaps.sum(axis = 0),
+          "squared_gaps" : (gaps ** 2).sum(axis = 0)}
+
+def simulate_groups(balancer_output,
+                    history,
+                    races          = DEFAULT_RACES,
+                    race_duration  = DEFAULT_RACE_DURATION,
+                    stint_duration = DEFAULT_STINT_DURATION,
+                    workers        = None,
+                    seed           = None):
+  # Simulate the races of every group of the balancer output. The races are
+  # split in chunks over the worker processes and the chunk results are added
+  karter_index = {karter["name"] : index for index, karter in enumerate(balancer_output["karters"])}
+  average_laps = np.array([karter["average_lap"] for karter in balancer_output["karters"]])
+  race_efforts = np.array([karter.get("race_effort", 1.0) for karter in balancer_output["karters"]])
+
+  residual_pool, form_pool = karter_distributions(list(karter_index), history)
+
+  # The number of laps of the fastest possible team is an upper bound on the
+  # laps of every simulated team
+  race_duration  = race_duration * 60
+  stint_duration = stint_duration * 60
+  number_of_laps = int(np.ceil(race_duration / (average_laps.min() * residual_pool[0].min() * form_pool[0].min()))) + 1
+
+  chunks  = [len(chunk) for chunk in np.array_split(np.arange(races), max(1, -(-races // CHUNK_RACES)))]
+  seeds   = np.random.SeedSequence(seed).spawn(len(balancer_output["groups"]) * len(chunks))
+  results = []
+
+  with concurrent.futures.ProcessPoolExecutor(max_workers = workers or os.cpu_count()) as executor:
+    futures = []
+    for group_number, group in enumerate(balancer_output["groups"]):
+      teams = [np.array([karter_index[name] for name in team["karters"]]) for team in group["teams"]]
+
+      lap_karters, is_pit = team_schedules(teams, average_laps, race_efforts, stint_duration, number_of_laps)
+
+      futures.append((group, [executor.submit(simulate_races,
+                                              average_laps,
+                                              lap_karters,
+                                              is_pit,
+                                              residual_pool,
+                                              form_pool,
+                                              history["pit_losses"],
+                                              race_duration,
+                                              chunk_races,
+                                              seeds[group_number * len(chunks) + chunk_index])
+                              for chunk_index, chunk_races in enumerate(chunks)]))
+
+    for group, group_futures in futures:
+      totals = {}
+      for future in group_futures:
+        for name, values in future.result().items():
+          totals[name] = totals.get(name, 0) + values
+
+      results.append(group_simulation(group, totals, races))
+
+  return results
+
+def group_simulation(group, totals, races):
+  win_probabilities = totals["wins"] / races
+  average_gaps      = totals["gaps"] / races
+  gap_deviations    = np.sqrt(np.maximum(totals["squared_gaps"] / races - average_gaps ** 2, 0.0))
+
+  return {"group"                  : group["group"],
+          "win_probability_spread" : float(win_probabilities.max() - win_probabilities.min()),
+          "teams"                  : [{"karters"                : team["karters"],
+                                       "win_probability"        : float(win_probability),
+                                       "average_position"       : float(average_position),
+                                       "average_gap"            : float(average_gap),
+                                       "gap_standard_deviation" : float(gap_deviation)}
+                                      for team, win_probability, average_position, average_gap, gap_deviation
+                                      in zip(group["teams"],
+                                             win_probabilities,
+                                             totals["positions"] / races,
+                                             average_gaps,
+                                             gap_deviations)]}
+
+################
+# Main program #
+################
+if __name__ == "__main__":
+  parser = argparse.ArgumentParser(description = "Simulate races of the teams of the group " +
+                                                 "balancer with the lap times of the results " +
+                                                 "archive.")
+
+  parser.add_argument("-i", "--input",
+                      required = True,
+                      help     = "The YAML or JSON output file of the group balancer")
+  parser.add_argument("-o", "--output",
+                      help = "The output YAML or JSON file with the simulation of every " +
+                             "group, the default is to print YAML")
+  parser.add_argument("-r", "--results_folder",
+                      default = race_archive.DEFAULT_RESULTS_FOLDER,
+                      help    = "The results folder with a folder per year and per race")
+  parser.add_argument("-n", "--races",
+                      type    = int,
+                      default = DEFAULT_RACES,
+                      help    = "The number of simulated races of every group")
+  parser.add_argument("-t", "--race_duration",
+                      type    = float,
+                      default = DEFAULT_RACE_DURATION,
+                      help    = "The duration of the race in minutes")
+  parser.add_argument("--stint_duration",
+                      type    = float,
+                      default = DEFAULT_STINT_DURATION,
+                      help    = "The duration of a stint in minutes for a karter with the " +
+                                "average race effort of the team")
+  parser.add_argument("-j", "--workers",
+                      type = int,
+                      help = "The number of worker processes. The default is the number of CPUs")
+  parser.add_argument("-s", "--seed",
+                      type = int,
+                      help = "The seed of the simulated races")
+
+  args = parser.parse_args()
+
+  balancer_output = load_balancer_output(args.input)
+  history         = collect_history(args.results_folder, balancer_output.get("circuit"))
+
+  groups = simulate_groups(balancer_output = balancer_output,
+                           history         = history,
+                           races           = args.races,
+                           race_duration   = args.race_duration,
+                           stint_duration  = args.stint_duration,
+                           workers         = args.workers,
+                           seed            = args.seed)
+
+  result = {"circuit" : balancer_output.get("circuit"),
+            "races"   : args.races,
+            "groups"  : groups}
+
+  if args.output is None:
+    print(yaml.safe_dump(result, sort_keys = False, allow_unicode = True), end = "")
+  elif args.output.endswith(".json"):
+    with open(args.output, 'w') as output_file:
+      json.dump(result, output_file, indent = 2, ensure_ascii = False)
+  else:
+    with open(args.output, 'w') as output_file:
+      yaml.safe_dump(result, output_file, sort_keys = False, allow_unicode = True)
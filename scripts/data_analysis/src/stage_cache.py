@@ -0,0 +1,214 @@
+import numpy as np
+
+import os
+import pickle
+import shutil
+import hashlib
+import functools
+import tempfile
+
+DEFAULT_CACHE_FOLDER = os.path.join(os.environ.get("XDG_CACHE_HOME",
+                                                   os.path.join(os.path.expanduser("~"), ".cache")),
+                                    "karting")
+DEFAULT_CACHE_SIZE   = 1024
+
+###########
+# Hashing #
+###########
+def is_uniform_list(value):
+  if not isinstance(value, list) or len(value) == 0:
+    return False
+
+  item_type = type(value[0])
+  if not issubclass(item_type, (float, int, str, np.number)) or item_type is bool:
+    return False
+
+  return all(type(item) is item_type for item in value)
+
+def update_hash(hasher, value):
+  # Every value gets a type tag so different types never give the same bytes
+  if isinstance(value, np.ndarray):
+    # The bytes of an object array are pointers, so hash the names instead
+    if value.dtype == object:
+      value = value.astype(str)
+
+    hasher.update(b"array" + str(value.dtype).encode() + str(value.shape).encode())
+    hasher.update(np.ascontiguousarray(value).tobytes())
+  elif is_uniform_list(value):
+    # Long lists of numbers or names like the interpolated laps are hashed as
+    # one array instead of item by item
+    update_hash(hasher, b"uniform")
+    update_hash(hasher, np.asarray(value))
+  elif isinstance(value, (bytes, bytearray)):
+    hasher.update(b"bytes" + len(value).to_bytes(8, "little"))
+    hasher.update(value)
+  elif isinstance(value, str):
+    update_hash(hasher, value.encode())
+  elif isinstance(value, (list, tuple)):
+    hasher.update(b"list" + len(value).to_bytes(8, "little"))
+    for item in value:
+      update_hash(hasher, item)
+  elif isinstance(value, dict):
+    hasher.update(b"dict" + len(value).to_bytes(8, "little"))
+    for key in sorted(value):
+      update_hash(hasher, key)
+      update_hash(hasher, value[key])
+  else:
+    hasher.update(b"value" + repr(value).encode())
+
+def hash_values(*values):
+  hasher = hashlib.sha256()
+  for value in values:
+    update_hash(hasher, value)
+
+  return hasher.hexdigest()
+
+def hash_file(filename):
+  hasher = hashlib.sha256()
+  with open(filename, 'rb') as data_file:
+    for chunk in iter(lambda: data_file.read(1 << 20), b""):
+      hasher.update(chunk)
+
+  return hasher.hexdigest()
+
+@functools.lru_cache(maxsize = None)
+def code_version(*source_filenames):
+  # The source of the modules that produce a stage is part of its key so
+  # changing the code invalidates the cached results
+  return hash_values(*[hash_file(filename) for filename in source_filenames])
+
+def race_digest(race):
+  # Everything of the race except its name, so fixing a typo in the race name
+  # doesn't invalidate the timeline
+  teams = [(team.name,
+            team.finish_position,
+            team.kart_number,
+            team.has_stopped,
+            team.lap_times,
+            team.lap_drivers) for team in race.teams]
+
+  return hash_values(race.drivers, teams)
+
+###############
+# Stage cache #
+###############
+class StageCache:
+  __slots__ = ("folder", "max_size", "hits", "misses")
+
+  def __init__(self, folder, max_size):
+    self.folder   = folder
+    self.max_size = max_size
+    self.hits     = 0
+    self.misses   = 0
+
+    os.makedirs(folder, exist_ok = True)
+
+  def entry_filename(self, stage_name, key):
+    return os.path.join(self.folder, hash_values(stage_name, key))
+
+  def lookup(self, stage_name, key):
+    filename = self.entry_filename(stage_name, key)
+    if not os.path.exists(filename):
+      self.misses += 1
+      return None
+
+    # Touch the entry so it is the most recently used one
+    os.utime(filename)
+    self.hits += 1
+
+    return filename
+
+  def store(self, stage_name, key, write):
+    filename = self.entry_filename(stage_name, key)
+
+    # Write to a temporary file first so an interrupted run never leaves a
+    # half written entry behind
+    file_descriptor, temporary_filename = tempfile.mkstemp(dir = self.folder, suffix = ".tmp")
+    try:
+      with os.fdopen(file_descriptor, 'wb') as entry_file:
+        write(entry_file)
+      os.replace(temporary_filename, filename)
+    except BaseException:
+      os.remove(temporary_filename)
+      raise
+
+    self.evict()
+
+  def evict(self):
+    entries = []
+    for entry in os.scandir(self.folder):
+      if entry.is_file() and not entry.name.endswith(".tmp"):
+        entry_stat = entry.stat()
+        entries.append((entry_stat.st_mtime, entry_stat.st_size, entry.path))
+
+    total_size = sum(entry[1] for entry in entries)
+
+    # Remove the least recently used entries until the cache fits again
+    entries.sort()
+    for _, size, path in entries:
+      if total_size <= self.max_size:
+        break
+
+      os.remove(path)
+      total_size -= size
+
+  def cached(self, stage_name, key, compute):
+    filename = self.lookup(stage_name, key)
+    if filename is not None:
+      with open(filename, 'rb') as entry_file:
+        return pickle.load(entry_file)
+
+    value = compute()
+    self.store(stage_name, key, lambda entry_file: pickle.dump(value, entry_file, protocol = pickle.HIGHEST_PROTOCOL))
+
+    return value
+
+  def cached_file(self, stage_name, key, output_filename, compute):
+    filename = self.lookup(stage_name, key)
+    if filename is not None:
+      shutil.copyfile(filename, output_filename)
+      return
+
+    compute()
+
+    def write(entry_file):
+      with open(output_filename, 'rb') as output_file:
+        shutil.copyfileobj(output_file, entry_file)
+
+    self.store(stage_name, key, write)
+
+class NoCache:
+  __slots__ = ()
+
+  def cached(self, stage_name, key, compute):
+    return compute()
+
+  def cached_file(self, stage_name, key, output_filename, compute):
+    compute()
+
+# Used when no caching is requested so every stage simply runs
+NO_CACHE = NoCache()
+
+###################
+# Input arguments #
+###################
+def add_cache_arguments(parser):
+  parser.add_argument("--cache_folder",
+                      default = DEFAULT_CACHE_FOLDER,
+                      help    = "The directory of the stage cache. Stages whose " +
+                                "inputs did not change are taken from this cache")
+  parser.add_argument("--cache_size",
+                      type    = float,
+                      default = DEFAULT_CACHE_SIZE,
+                      help    = "The maximum size of the stage cache in MB. The " +
+                                "least recently used entries are removed first")
+  parser.add_argument("--no_cache",
+                      action = "store_true",
+                      help   = "Run every stage without using the stage cache")
+
+def create_cache(args):
+  if args.no_cache:
+    return NO_CACHE
+
+  return StageCache(folder   = args.cache_folder,
+                    max_size = int(args.cache_size * 1024 * 1024))
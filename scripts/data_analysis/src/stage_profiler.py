@@ -0,0 +1,190 @@
+import os
+import re
+import json
+import time
+import pstats
+import cProfile
+import resource
+import contextlib
+import tracemalloc
+
+##################
+# Stage profiler #
+##################
+class StageProfiler:
+  __slots__ = ("enabled", "use_cprofile", "trace_memory", "started_tracing",
+               "stages", "current_stage", "hottest_profile", "start_time")
+
+  def __init__(self, enabled = True, use_cprofile = False, trace_memory = False):
+    self.enabled      = enabled
+    self.use_cprofile = use_cprofile
+
+    # Tracing the allocations makes the stages many times slower, so the peak
+    # memory is only measured when asked for and the wall time is then only
+    # indicative
+    self.trace_memory    = trace_memory
+    self.started_tracing = False
+
+    # The finished stages in the order they ran
+    self.stages = []
+
+    # The measurements of the stage that is running at the moment
+    self.current_stage = None
+
+    # The cProfile statistics of the slowest stage so far
+    self.hottest_profile = None
+
+    self.start_time = time.perf_counter()
+
+  def start(self, name):
+    if not self.enabled:
+      return
+
+    # Starting a stage ends the previous one, just like the section banners in
+    # the code
+    self.stop()
+
+    start_memory = None
+    if self.trace_memory:
+      if not tracemalloc.is_tracing():
+        tracemalloc.start()
+        self.started_tracing = True
+      tracemalloc.reset_peak()
+      start_memory = tracemalloc.get_traced_memory()[0]
+
+    profile = None
+    if self.use_cprofile:
+      profile = cProfile.Profile()
+      profile.enable()
+
+    self.current_stage = {"name"             : name,
+                          "profile"          : profile,
+                          "start_wall_time"  : time.perf_counter(),
+                          "start_cpu_time"   : time.process_time(),
+                          "start_child_time" : get_children_cpu_time(),
+                          "start_memory"     : start_memory}
+
+  def stop(self):
+    if not self.enabled or self.current_stage is None:
+      return
+
+    stage = self.current_stage
+    self.current_stage = None
+
+    wall_time   = time.perf_counter() - stage["start_wall_time"]
+    cpu_time    = time.process_time() - stage["start_cpu_time"]
+    child_time  = get_children_cpu_time() - stage["start_child_time"]
+    peak_memory = None
+    if stage["start_memory"] is not None:
+      peak_memory = max(tracemalloc.get_traced_memory()[1] - stage["start_memory"], 0)
+
+    if stage["profile"] is not None:
+      stage["profile"].disable()
+
+      slowest_wall_time = max([finished["wall_time"] for finished in self.stages], default = -1)
+      if wall_time > slowest_wall_time:
+        self.hottest_profile = (stage["name"], stage["profile"])
+
+    self.stages.append({"name"           : stage["name"],
+                        "wall_time"      : wall_time,
+                        "cpu_time"       : cpu_time,
+                        "child_cpu_time" : child_time,
+                        "peak_memory"    : peak_memory})
+
+  @contextlib.contextmanager
+  def stage(self, name):
+    self.start(name)
+    try:
+      yield
+    finally:
+      self.stop()
+
+  def report(self):
+    self.stop()
+
+    # Stop the tracing we started, so the code that runs after the report
+    # isn't slowed down by it
+    if self.started_tracing:
+      tracemalloc.stop()
+      self.started_tracing = False
+
+    hottest_stage = None
+    if self.stages:
+      hottest_stage = max(self.stages, key = lambda stage: stage["wall_time"])["name"]
+
+    return {"total_wall_time" : time.perf_counter() - self.start_time,
+            "max_rss"         : get_max_rss(),
+            "hottest_stage"   : hottest_stage,
+            "stages"          : self.stages}
+
+  def write_report(self, filename):
+    if not self.enabled:
+      return
+
+    report = self.report()
+
+    if self.hottest_profile is not None:
+      stage_name, profile = self.hottest_profile
+      profile_filename = os.path.join(os.path.dirname(os.path.abspath(filename)),
+                                      f"profile_{stage_filename(stage_name)}.prof")
+      pstats.Stats(profile).dump_stats(profile_filename)
+      report["hottest_stage_profile"] = profile_filename
+
+    with open(filename, 'w') as report_file:
+      json.dump(report, report_file, indent = 2)
+      report_file.write("\n")
+
+    print_report(report)
+
+# Used when no profiling is requested so the stages cost nothing
+NO_PROFILER = StageProfiler(enabled = False)
+
+####################
+# Helper functions #
+####################
+def get_children_cpu_time():
+  usage = resource.getrusage(resource.RUSAGE_CHILDREN)
+  return usage.ru_utime + usage.ru_stime
+
+def get_max_rss():
+  # The maximum resident set size is in kilobytes on Linux
+  return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+def stage_filename(stage_name):
+  return re.sub(r"[^a-z0-9]+", "_", stage_name.lower()).strip("_")
+
+def print_report(report):
+  print(f"{'Stage':<60} {'Wall [sec]':>11} {'CPU [sec]':>10} {'Child CPU [sec]':>16} {'Peak memory [MB]':>17}")
+  for stage in report["stages"]:
+    peak_memory = f"{stage['peak_memory'] / 1e6:.1f}" if stage["peak_memory"] is not None else "-"
+    print(f"{stage['name']:<60} "
+          f"{stage['wall_time']:>11.3f} "
+          f"{stage['cpu_time']:>10.3f} "
+          f"{stage['child_cpu_time']:>16.3f} "
+          f"{peak_memory:>17}")
+  print(f"Hottest stage: {report['hottest_stage']}")
+
+###################
+# Input arguments #
+###################
+def add_profile_arguments(parser):
+  parser.add_argument("--profile",
+                      action = "store_true",
+                      help   = "Record the wall time and CPU time of every stage " +
+                               "and write them as a JSON report next to the outputs")
+  parser.add_argument("--profile_memory",
+                      action = "store_true",
+                      help   = "Also record the peak memory of every stage with " +
+                               "tracemalloc, which makes the stages a lot slower. " +
+                               "Implies --profile")
+  parser.add_argument("--profile_cprofile",
+                      action = "store_true",
+                      help   = "Also dump the cProfile statistics of the slowest " +
+                               "stage next to the report. Implies --profile")
+
+def create_profiler(args):
+  if not args.profile and not args.profile_memory and not args.profile_cprofile:
+    return NO_PROFILER
+
+  return StageProfiler(use_cprofile = args.profile_cprofile,
+                       trace_memory = args.profile_memory)
@@ -0,0 +1,121 @@
+import numpy as np
+
+import argparse
+
+import race_model
+import lap_flags
+import caution_windows
+
+# The number of laps of the rolling window. At the start of a stint the window
+# only contains the laps of the stint so far
+ROLLING_WINDOW = 10
+
+####################
+# Helper functions #
+####################
+def segment_sums(values, segment_starts):
+  # The sum of every segment of the values
+  return np.add.reduceat(values, segment_starts) if len(values) > 0 else values
+
+#################
+# Stint metrics #
+#################
+def calculate_stint_metrics(race, team_lap_flags):
+  # The rolling mean and standard deviation of the clean laps of every stint
+  # and the pace drift of every stint, for all the stints of the race at once.
+  # Returns the rolling means and standard deviations of every team and the
+  # metrics of every driver stint
+  lap_times = np.concatenate([team.lap_times for team in race.teams])
+  flags     = np.concatenate([team_lap_flags[team.name] for team in race.teams])
+  team_ends = np.cumsum([len(team.lap_times) for team in race.teams])
+
+  # The start of every stint in the arrays of all the laps
+  stints      = [(team_index, stint) for team_index, team in enumerate(race.teams) for stint in team.stints]
+  team_starts = np.concatenate([[0], team_ends[:-1]])
+  stint_first = np.array([team_starts[team_index] + stint.first_lap for team_index, stint in stints])
+  stint_ends  = np.array([team_starts[team_index] + stint.end_lap for team_index, stint in stints])
+
+  # Only the clean laps are part of the statistics
+  is_clean = lap_flags.is_clean(flags)
+  values   = np.where(is_clean, lap_times, 0.0)
+  counts   = is_clean.astype(np.float64)
+
+  # The rolling sums are differences of the cumulative sums. The window starts
+  # at the latest of the window size and the start of the stint
+  stint_of_lap = np.repeat(np.arange(len(stints)), stint_ends - stint_first)
+  lap_indices  = np.arange(len(lap_times))
+  window_first = np.maximum(lap_indices - ROLLING_WINDOW + 1, stint_first[stint_of_lap])
+
+  def rolling_sum(array):
+    cumulative = np.concatenate([[0.0], np.cumsum(array)])
+    return cumulative[lap_indices + 1] - cumulative[window_first]
+
+  window_counts = rolling_sum(counts)
+  window_sums   = rolling_sum(values)
+  window_square = rolling_sum(values * values)
+
+  with np.errstate(invalid = "ignore", divide = "ignore"):
+    rolling_means = np.where(window_counts > 0, window_sums / window_counts, np.nan)
+    variances     = (window_square - window_counts * rolling_means ** 2) / (window_counts - 1)
+    rolling_stds  = np.where(window_counts > 1, np.sqrt(np.maximum(variances, 0.0)), np.nan)
+
+  # The pace drift is the slope of the least squares line through the clean
+  # laps of the stint, with the lap in the stint as x
+  x = np.where(is_clean, lap_indices - stint_first[stint_of_lap], 0).astype(np.float64)
+
+  n      = segment_sums(counts, stint_first)
+  sum_x  = segment_sums(x, stint_first)
+  sum_y  = segment_sums(values, stint_first)
+  sum_xx = segment_sums(x * x, stint_first)
+  sum_xy = segment_sums(x * values, stint_first)
+  sum_yy = segment_sums(values * values, stint_first)
+
+  with np.errstate(invalid = "ignore", divide = "ignore"):
+    slopes    = (n * sum_xy - sum_x * sum_y) / (n * sum_xx - sum_x ** 2)
+    means     = sum_y / n
+    stds      = np.sqrt(np.maximum(sum_yy - n * means ** 2, 0.0) / (n - 1))
+    best_mean = np.fmin.reduceat(np.where(window_counts >= ROLLING_WINDOW, rolling_means, np.inf), stint_first)
+
+  stint_data = []
+  for stint_index, (team_index, stint) in enumerate(stints):
+    if stint.driver_code == race_model.PIT_CODE:
+      continue
+
+    team = race.teams[team_index]
+    stint_data.append({"team"               : team.name,
+                       "driver"             : race.drivers[stint.driver_code],
+                       "first_lap"          : stint.first_lap + 1,
+                       "laps"               : stint.end_lap - stint.first_lap,
+                       "clean_laps"         : int(n[stint_index]),
+                       "average"            : float(means[stint_index]),
+                       "standard_deviation" : float(stds[stint_index]),
+                       "best_rolling"       : float(best_mean[stint_index]) if np.isfinite(best_mean[stint_index]) else np.nan,
+                       "drift"              : float(slopes[stint_index])})
+
+  rolling_means = dict(zip([team.name for team in race.teams], np.split(rolling_means, team_ends[:-1])))
+  rolling_stds  = dict(zip([team.name for team in race.teams], np.split(rolling_stds, team_ends[:-1])))
+
+  return rolling_means, rolling_stds, stint_data
+
+################
+# Main program #
+################
+if __name__ == "__main__":
+  parser = argparse.ArgumentParser(description = "Show the consistency and the pace " +
+                                                 "drift of every stint.")
+
+  parser.add_argument("-i", "--input",
+                      required = True,
+                      help     = "The input YAML file containing all the karting data")
+
+  args = parser.parse_args()
+
+  race = race_model.load_race(args.input)
+  _, _, stint_data = calculate_stint_metrics(race, caution_windows.classify_laps(race)[0])
+
+  for stint in stint_data:
+    print(f"{stint['team']:<30} {stint['driver']:<30} laps {stint['first_lap']:>5} - "
+          f"{stint['first_lap'] + stint['laps'] - 1:<5} "
+          f"average {stint['average']:7.3f} sec "
+          f"std {stint['standard_deviation']:6.3f} sec "
+          f"drift {stint['drift']:+7.4f} sec/lap")
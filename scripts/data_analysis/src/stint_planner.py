@@ -0,0 +1,290 @@
+import numpy as np
+
+import os
+import argparse
+
+import race_model
+import race_archive
+import lap_flags
+import caution_windows
+
+DEFAULT_RACE_DURATION = 120.0
+DEFAULT_SLOT_DURATION = 5.0
+DEFAULT_MIN_STINT     = 10.0
+DEFAULT_MAX_STINT     = 40.0
+
+# A driver needs this many clean laps in the archive for their own fatigue,
+# else they get the fatigue of all the drivers with their own pace
+MIN_FATIGUE_LAPS = 50
+
+####################
+# Helper functions #
+####################
+def stint_minutes(team):
+  # The minutes since the start of the stint at the start of every lap
+  lap_starts  = race_model.cumulative_times(team) - team.lap_times
+  stint_first = np.repeat([stint.first_lap for stint in team.stints],
+                          [stint.end_lap - stint.first_lap for stint in team.stints])
+
+  return (lap_starts - lap_starts[stint_first]) / 60
+
+def session_stint_laps(race):
+  # The clean laps of the session relative to its reference with the driver
+  # and the minutes into the stint of every lap, and the time lost in every
+  # pit lap
+  session = race_archive.calculate_session(race)
+  if session["reference"] is None:
+    return None
+
+  team_lap_flags = caution_windows.classify_laps(race)[0]
+
+  lap_times   = np.concatenate([team.lap_times for team in race.teams])
+  lap_drivers = np.concatenate([team.lap_drivers for team in race.teams])
+  minutes     = np.concatenate([stint_minutes(team) for team in race.teams])
+  flags       = np.concatenate([team_lap_flags[team.name] for team in race.teams])
+
+  is_driver = np.concatenate([race_model.named_driver_laps_mask(race, team) for team in race.teams])
+  is_clean  = lap_flags.is_clean(flags) & is_driver
+  is_pit    = (flags & lap_flags.LAP_PIT) != 0
+
+  return {"relative_laps" : lap_times[is_clean] / session["reference"],
+          "drivers"       : np.array(race.drivers, dtype = object)[lap_drivers[is_clean]],
+          "minutes"       : minutes[is_clean],
+          "reference"     : session["reference"],
+          "pit_losses"    : lap_times[is_pit] - session["reference"]}
+
+######################
+# Fatigue pace model #
+######################
+def collect_stint_laps(results_folder):
+  # The clean laps of every session of the archive with the circuit of every
+  # session
+  sessions = []
+  for race_file in race_archive.find_race_files(results_folder):
+    filename = os.path.join(results_folder, race_file)
+    race     = race_model.parse_race(filename)
+    session  = session_stint_laps(race)
+    if session is not None:
+      session["circuit"] = race_archive.race_circuit(race, os.path.dirname(filename))
+      sessions.append(session)
+
+  if not sessions:
+    raise ValueError(f"No races with clean laps in {results_folder}")
+
+  return sessions
+
+def fit_pace_models(sessions):
+  # The pace of every driver relative to the session reference as a line over
+  # the minutes into the stint. The slope is the fatigue of the driver, it is
+  # negative when a driver still gets faster during a stint
+  relative_laps = np.concatenate([session["relative_laps"] for session in sessions])
+  drivers       = np.concatenate([session["drivers"] for session in sessions])
+  minutes       = np.concatenate([session["minutes"] for session in sessions])
+
+  driver_names, driver_indices = np.unique(drivers, return_inverse = True)
+  number_of_drivers            = len(driver_names)
+
+  def driver_sums(weights):
+    return np.bincount(driver_indices, weights = weights, minlength = number_of_drivers)
+
+  counts     = driver_sums(None)
+  mean_x     = driver_sums(minutes) / counts
+  mean_y     = driver_sums(relative_laps) / counts
+  centered_x = minutes - mean_x[driver_indices]
+  centered_y = relative_laps - mean_y[driver_indices]
+  sum_xx     = driver_sums(centered_x * centered_x)
+  sum_xy     = driver_sums(centered_x * centered_y)
+
+  # The slope of all the drivers fits every driver around their own mean, so
+  # the difference in pace between the drivers isn't part of the fatigue
+  pooled_fatigue = sum_xy.sum() / sum_xx.sum() if sum_xx.sum() > 0 else 0.0
+  with np.errstate(invalid = "ignore", divide = "ignore"):
+    fatigues = np.where((counts >= MIN_FATIGUE_LAPS) & (sum_xx > 0), sum_xy / sum_xx, pooled_fatigue)
+
+  return {driver_name : {"pace"       : float(mean_y[index] - fatigues[index] * mean_x[index]),
+                         "fatigue"    : float(fatigues[index]),
+                         "clean_laps" : int(counts[index])}
+          for index, driver_name in enumerate(driver_names)}
+
+def circuit_parameters(sessions, circuit):
+  # The reference lap and the median pit loss of the sessions on the circuit
+  circuit_sessions = [session for session in sessions if session["circuit"] == circuit]
+  if not circuit_sessions:
+    raise ValueError(f"No races on circuit {circuit}, the circuits are " +
+                     ", ".join(sorted(set(session["circuit"] for session in sessions))))
+
+  pit_losses = np.concatenate([session["pit_losses"] for session in circuit_sessions])
+
+  return (float(np.median([session["reference"] for session in circuit_sessions])),
+          float(np.median(pit_losses)) if len(pit_losses) > 0 else 0.0)
+
+#################
+# Stint planner #
+#################
+def stint_distances(pace_models, drivers, reference, slot_duration, stint_slots):
+  # The expected laps of every driver in a stint of every number of slots. The
+  # lap time in the middle of every slot gives the laps of the slot. A negative
+  # fatigue mostly comes from the warm up of short stints, so it isn't
+  # extended to the longer stints and nobody gets faster by driving longer
+  slot_minutes = (np.arange(stint_slots.max()) + 0.5) * slot_duration
+  paces        = np.array([pace_models[driver]["pace"] for driver in drivers])
+  fatigues     = np.array([max(pace_models[driver]["fatigue"], 0.0) for driver in drivers])
+  lap_times    = reference * (paces[:, np.newaxis] + fatigues[:, np.newaxis] * slot_minutes)
+  slot_laps    = np.cumsum(slot_duration * 60 / lap_times, axis = 1)
+
+  return slot_laps[:, stint_slots - 1]
+
+def plan_stints(pace_models,
+                drivers,
+                reference,
+                pit_loss,
+                race_duration = DEFAULT_RACE_DURATION,
+                slot_duration = DEFAULT_SLOT_DURATION,
+                min_stint     = DEFAULT_MIN_STINT,
+                max_stint     = DEFAULT_MAX_STINT):
+  # The rotation with the most expected laps in the race duration, which is the
+  # rotation with the lowest expected time for the same distance. The race is
+  # split in time slots and the dynamic program goes over the end slot of the
+  # stints. The state is the set of drivers that already drove and the driver
+  # of the last stint, so every driver drives and nobody drives two stints in a
+  # row. Every pit stop costs the pit loss at the reference lap
+  for driver in drivers:
+    if driver not in pace_models:
+      raise ValueError(f"Driver {driver} has no races in the archive")
+
+  number_of_slots   = int(round(race_duration / slot_duration))
+  stint_slots       = np.arange(max(int(np.ceil(min_stint / slot_duration)), 1),
+                                int(np.floor(max_stint / slot_duration)) + 1)
+  number_of_drivers = len(drivers)
+  number_of_sets    = 1 << number_of_drivers
+  if len(stint_slots) == 0:
+    raise ValueError("No stint lengths between the minimum and the maximum stint")
+
+  distances = stint_distances(pace_models, drivers, reference, slot_duration, stint_slots)
+  pit_laps  = pit_loss / reference
+
+  # The driver sets that contain every driver, with the set without that
+  # driver as the other possible previous set
+  sets           = np.arange(number_of_sets)[:, np.newaxis]
+  driver_bits    = 1 << np.arange(number_of_drivers)
+  has_driver     = (sets & driver_bits) != 0
+  sets_without   = sets & ~driver_bits
+  driver_columns = np.broadcast_to(np.arange(number_of_drivers), has_driver.shape)
+
+  # The most laps at the end of every slot for every driver set and last
+  # driver. Excluded is the most laps with a last driver that isn't the column
+  # driver, which is the previous state of a stint of the column driver. The
+  # first stint starts from the empty set without a pit stop before it
+  best           = np.full((number_of_slots + 1, number_of_sets, number_of_drivers), -np.inf)
+  excluded       = np.full((number_of_slots + 1, number_of_sets, number_of_drivers), -np.inf)
+  excluded[0, 0] = pit_laps
+  choice_length  = np.zeros((number_of_slots + 1, number_of_sets, number_of_drivers), dtype = np.int64)
+  choice_set     = np.zeros((number_of_slots + 1, number_of_sets, number_of_drivers), dtype = np.int64)
+
+  for end in range(1, number_of_slots + 1):
+    for length_index, length in enumerate(stint_slots):
+      start = end - length
+      if start < 0:
+        break
+
+      # A stint of the column driver comes after a set with or without them
+      with_driver    = excluded[start][sets, driver_columns]
+      without_driver = excluded[start][sets_without, driver_columns]
+      previous_sets  = np.where(with_driver >= without_driver, sets, sets_without)
+      candidates     = np.where(has_driver, np.maximum(with_driver, without_driver), -np.inf) + \
+                       distances[:, length_index] - pit_laps
+
+      is_better                     = candidates > best[end]
+      best[end][is_better]          = candidates[is_better]
+      choice_length[end][is_better] = length
+      choice_set[end][is_better]    = np.broadcast_to(previous_sets, is_better.shape)[is_better]
+
+    # The best and the second best last driver of every set give the best
+    # previous state without the column driver
+    order         = np.argsort(-best[end], axis = 1)
+    first         = np.take_along_axis(best[end], order[:, :1], axis = 1)
+    second        = np.take_along_axis(best[end], order[:, 1:2], axis = 1) if number_of_drivers > 1 \
+                    else np.full_like(first, -np.inf)
+    excluded[end] = np.where(driver_columns == order[:, :1], second, first)
+
+  full_set = number_of_sets - 1
+  if not np.isfinite(best[number_of_slots, full_set].max()):
+    raise ValueError("No rotation fits the race duration with these stint rules and drivers")
+
+  # Follow the choices back from the end of the race
+  stints = []
+  end    = number_of_slots
+  driver = int(np.argmax(best[number_of_slots, full_set]))
+  state  = full_set
+  laps   = float(best[number_of_slots, full_set, driver])
+  while end > 0:
+    length = int(choice_length[end, state, driver])
+    stints.append({"driver" : drivers[driver], "minutes" : length * slot_duration})
+
+    previous_set = int(choice_set[end, state, driver])
+    end         -= length
+    if end > 0:
+      driver = int(np.argmax(np.where(np.arange(number_of_drivers) == driver, -np.inf, best[end, previous_set])))
+    state = previous_set
+
+  return {"stints"      : stints[::-1],
+          "laps"        : laps,
+          "average_lap" : race_duration * 60 / laps}
+
+################
+# Main program #
+################
+if __name__ == "__main__":
+  parser = argparse.ArgumentParser(description = "Plan the order and the length of the stints " +
+                                                 "of a team with the fatigue of every driver.")
+
+  parser.add_argument("drivers",
+                      nargs = "+",
+                      help  = "The drivers of the team")
+  parser.add_argument("-r", "--results_folder",
+                      default = race_archive.DEFAULT_RESULTS_FOLDER,
+                      help    = "The results folder with a folder per year and per race")
+  parser.add_argument("-c", "--circuit",
+                      help = "The circuit of the race. The default is the circuit of the latest race")
+  parser.add_argument("-t", "--race_duration",
+                      type    = float,
+                      default = DEFAULT_RACE_DURATION,
+                      help    = "The duration of the race in minutes")
+  parser.add_argument("-p", "--pit_loss",
+                      type = float,
+                      help = "The seconds lost in a pit stop. The default is the median " +
+                             "pit loss of the circuit in the archive")
+  parser.add_argument("--slot_duration",
+                      type    = float,
+                      default = DEFAULT_SLOT_DURATION,
+                      help    = "The stints start and end on slots of this many minutes")
+  parser.add_argument("--min_stint",
+                      type    = float,
+                      default = DEFAULT_MIN_STINT,
+                      help    = "The minimum duration of a stint in minutes")
+  parser.add_argument("--max_stint",
+                      type    = float,
+                      default = DEFAULT_MAX_STINT,
+                      help    = "The maximum duration of a stint in minutes")
+
+  args = parser.parse_args()
+
+  sessions            = collect_stint_laps(args.results_folder)
+  circuit             = args.circuit or race_archive.last_known_circuit(session["circuit"] for session in sessions)
+  reference, pit_loss = circuit_parameters(sessions, circuit)
+
+  plan = plan_stints(pace_models   = fit_pace_models(sessions),
+                     drivers       = args.drivers,
+                     reference     = reference,
+                     pit_loss      = pit_loss if args.pit_loss is None else args.pit_loss,
+                     race_duration = args.race_duration,
+                     slot_duration = args.slot_duration,
+                     min_stint     = args.min_stint,
+                     max_stint     = args.max_stint)
+
+  # The same order format as the planned rotations of the older results
+  print("Order:")
+  for stint in plan["stints"]:
+    print(f"{stint['driver']}: {stint['minutes']:g} min")
+
+  print(f"Expected laps: {plan['laps']:.1f} (average lap {plan['average_lap']:.3f} sec)")
@@ -0,0 +1,209 @@
+import numpy as np
+
+import argparse
+import yaml
+
+import race_model
+
+#################
+# Race settings #
+#################
+# Typical values of the real races in the results folder
+BASE_LAP_TIME         = 36.0
+DRIVER_PACE_SPREAD    = 0.8
+LAP_TIME_NOISE        = 0.35
+FIRST_LAP_PENALTY     = 3.0
+PIT_LAP_TIME          = 49.0
+PIT_LAP_TIME_SPREAD   = 2.0
+OUT_LAP_PENALTY       = 2.0
+INCIDENT_PROBABILITY  = 0.01
+INCIDENT_PENALTY      = 6.0
+
+####################
+# Helper functions #
+####################
+def format_distance_to_winner(laps_behind, time_behind):
+  if laps_behind == 0 and time_behind == 0:
+    return "0 sec"
+
+  if laps_behind == 0:
+    return f"{time_behind:.3f} sec"
+
+  if laps_behind == 1:
+    return "1 lap"
+
+  return f"{laps_behind} laps"
+
+def generate_team_laps(generator,
+                       race_duration,
+                       driver_codes,
+                       pit_stops):
+  number_of_drivers = len(driver_codes)
+
+  # Every driver gets their own pace
+  driver_pace = BASE_LAP_TIME + generator.normal(scale = DRIVER_PACE_SPREAD,
+                                                 size  = number_of_drivers)
+
+  # Generate enough laps so the race duration is always covered
+  max_laps = int(race_duration / (BASE_LAP_TIME - 4 * DRIVER_PACE_SPREAD)) + pit_stops + 2
+
+  # The pit stops are spread evenly over the race with some jitter
+  stint_length = race_duration / (pit_stops + 1)
+  pit_times    = stint_length * np.arange(1, pit_stops + 1)
+  pit_times   += generator.uniform(low  = -0.2 * stint_length,
+                                   high = 0.2 * stint_length,
+                                   size = pit_stops)
+
+  # Estimate the lap of every pit stop with the average pace
+  pit_laps = np.unique((pit_times / np.mean(driver_pace)).astype(np.int64))
+  pit_laps = pit_laps[(pit_laps > 1) & (pit_laps < max_laps - 1)]
+
+  # The driver rotates after every pit stop
+  stint_index = np.searchsorted(pit_laps, np.arange(max_laps), side = "right")
+  lap_drivers = np.asarray(driver_codes)[stint_index % number_of_drivers]
+  lap_times   = driver_pace[stint_index % number_of_drivers] + \
+                generator.normal(scale = LAP_TIME_NOISE,
+                                 size  = max_laps)
+
+  # Add some spins and other incidents
+  incidents = generator.random(max_laps) < INCIDENT_PROBABILITY
+  lap_times[incidents] += generator.exponential(scale = INCIDENT_PENALTY,
+                                                size  = np.count_nonzero(incidents))
+
+  lap_times[0] += FIRST_LAP_PENALTY
+
+  # The out laps after a pit stop are slower
+  out_laps = pit_laps + 1
+  lap_times[out_laps[out_laps < max_laps]] += OUT_LAP_PENALTY
+
+  lap_times[pit_laps]   = PIT_LAP_TIME + generator.normal(scale = PIT_LAP_TIME_SPREAD,
+                                                          size  = len(pit_laps))
+  lap_drivers[pit_laps] = race_model.PIT_CODE
+
+  # Only keep the laps up to and including the lap crossing the finish
+  cumulative_times = np.cumsum(lap_times)
+  number_of_laps   = int(np.searchsorted(cumulative_times, race_duration)) + 1
+
+  return np.round(lap_times[:number_of_laps], 3), lap_drivers[:number_of_laps]
+
+###################
+# Race generation #
+###################
+def generate_race(number_of_teams,
+                  race_duration,
+                  drivers_per_team = 3,
+                  pit_stops        = 4,
+                  stopped_teams    = 0,
+                  seed             = 0,
+                  race_name        = None):
+  generator = np.random.default_rng(seed)
+
+  if race_name is None:
+    race_name = f"Synthetic race - {number_of_teams} teams - {race_duration / 3600:g} hours"
+
+  drivers = [race_model.PIT_DRIVER]
+  teams   = []
+  for team_index in range(number_of_teams):
+    driver_codes = []
+    for driver_index in range(drivers_per_team):
+      driver_codes.append(len(drivers))
+      drivers.append(f"Team{team_index + 1}Driver{driver_index + 1}")
+
+    lap_times, lap_drivers = generate_team_laps(generator     = generator,
+                                                race_duration = race_duration,
+                                                driver_codes  = driver_codes,
+                                                pit_stops     = pit_stops)
+
+    teams.append(race_model.Team(name               = f"TEAM {team_index + 1}",
+                                 finish_position    = 0,
+                                 kart_number        = team_index + 1,
+                                 distance_to_winner = "",
+                                 has_stopped        = False,
+                                 lap_times          = lap_times,
+                                 lap_drivers        = lap_drivers))
+
+  # Some teams stop somewhere during the second half of the race
+  stopped_indices = generator.choice(number_of_teams,
+                                     size    = min(stopped_teams, number_of_teams),
+                                     replace = False)
+  for team_index in stopped_indices:
+    team           = teams[team_index]
+    number_of_laps = int(len(team.lap_times) * generator.uniform(0.5, 0.95))
+    teams[team_index] = race_model.Team(name               = team.name,
+                                        finish_position    = 0,
+                                        kart_number        = team.kart_number,
+                                        distance_to_winner = "",
+                                        has_stopped        = True,
+                                        lap_times          = team.lap_times[:number_of_laps],
+                                        lap_drivers        = team.lap_drivers[:number_of_laps])
+
+  # The teams with the most laps win and equal laps are decided on time
+  teams.sort(key = lambda team: (-len(team.lap_times), np.sum(team.lap_times)))
+
+  winner_laps = len(teams[0].lap_times)
+  winner_time = np.sum(teams[0].lap_times)
+  for position, team in enumerate(teams):
+    team.finish_position    = position + 1
+    team.distance_to_winner = format_distance_to_winner(laps_behind = winner_laps - len(team.lap_times),
+                                                        time_behind = np.sum(team.lap_times) - winner_time)
+
+  return race_model.Race(name    = race_name,
+                         teams   = teams,
+                         drivers = drivers)
+
+def write_race(race, filename):
+  with open(filename, 'w') as data_file:
+    # Keep the laps on a single line each like the real results
+    yaml.safe_dump(race_model.race_to_dict(race),
+                   data_file,
+                   default_flow_style = None,
+                   sort_keys          = False,
+                   allow_unicode      = True,
+                   width              = 1000)
+
+################
+# Main program #
+################
+if __name__ == "__main__":
+  parser = argparse.ArgumentParser(description = "Generate a synthetic race in the " +
+                                                 "karting results YAML format.")
+
+  parser.add_argument("-o", "--output",
+                      required = True,
+                      help     = "The output YAML file")
+  parser.add_argument("-t", "--teams",
+                      type    = int,
+                      default = 10,
+                      help    = "The number of teams")
+  parser.add_argument("-d", "--duration",
+                      type    = float,
+                      default = 2,
+                      help    = "The race duration in hours")
+  parser.add_argument("--drivers_per_team",
+                      type    = int,
+                      default = 3,
+                      help    = "The number of drivers in every team")
+  parser.add_argument("--pit_stops",
+                      type    = int,
+                      default = 4,
+                      help    = "The number of pit stops of every team")
+  parser.add_argument("--stopped_teams",
+                      type    = int,
+                      default = 0,
+                      help    = "The number of teams that stop before the end")
+  parser.add_argument("-s", "--seed",
+                      type    = int,
+                      default = 0,
+                      help    = "The seed of the random generator")
+
+  args = parser.parse_args()
+
+  race = generate_race(number_of_teams  = args.teams,
+                       race_duration    = args.duration * 3600,
+                       drivers_per_team = args.drivers_per_team,
+                       pit_stops        = args.pit_stops,
+                       stopped_teams    = args.stopped_teams,
+                       seed             = args.seed)
+
+  write_race(race     = race,
+             filename = args.output)
@@ -0,0 +1,185 @@
+import numpy as np
+
+import argparse
+
+import race_model
+
+####################
+# Time-point index #
+####################
+class TimeIndex:
+  __slots__ = ("team_names", "has_stopped", "number_of_laps", "row_lengths",
+               "cumulative_times", "row_starts", "search_keys", "max_time",
+               "row_spacing", "lap_drivers", "driver_starts")
+
+  def __init__(self, race, cumulative_times_extended):
+    self.team_names     = [team.name for team in race.teams]
+    self.has_stopped    = np.array([team.has_stopped for team in race.teams])
+    self.number_of_laps = np.array([len(team.lap_times) for team in race.teams])
+
+    # The extended cumulative times of the analysis start with a 0 and go on
+    # after the last lap with the projected laps of the team, so the teams that
+    # didn't stop are extrapolated exactly like the plots do
+    team_cumulative_times = [np.asarray(cumulative_times_extended[team.name], dtype = np.float64)
+                             for team in race.teams]
+    self.row_lengths      = np.array([len(cumulative_times) for cumulative_times in team_cumulative_times])
+    self.max_time         = max(cumulative_times[number_of_laps] for cumulative_times, number_of_laps
+                                in zip(team_cumulative_times, self.number_of_laps))
+    self.row_spacing      = 2 * max(cumulative_times[-1] for cumulative_times in team_cumulative_times) + 1
+
+    # The cumulative times of all the teams in one array. Every team gets a
+    # different offset so one binary search over the whole array finds the lap
+    # of every team at once
+    self.row_starts       = np.concatenate([[0], np.cumsum(self.row_lengths)[:-1]])
+    self.cumulative_times = np.concatenate(team_cumulative_times)
+    self.search_keys      = self.cumulative_times + np.repeat(self.row_offsets(), self.row_lengths)
+
+    # The driver of every lap, starting at the driver start of every team
+    self.lap_drivers   = np.concatenate([race_model.lap_driver_names(race, team) for team in race.teams])
+    self.driver_starts = np.concatenate([[0], np.cumsum(self.number_of_laps)[:-1]])
+
+  def row_offsets(self):
+    return np.arange(len(self.team_names)) * self.row_spacing
+
+  def lap_indices(self, times, side = "right"):
+    # The number of completed laps of every team at every time, so it is the
+    # index of the lap in progress. With side "left" a lap that ends exactly
+    # at the time is still in progress
+    keys      = np.clip(times, 0, self.max_time)[:, np.newaxis] + self.row_offsets()[np.newaxis, :]
+    positions = np.searchsorted(self.search_keys, keys, side = side)
+
+    return positions - self.row_starts - 1
+
+  def laps_at(self, times):
+    # The interpolated laps of every team at every time, like
+    # race_analysis.interpolate_laps. A single time gives one value per team and
+    # a vector of times gives a row per time
+    times     = np.asarray(times, dtype = np.float64)
+    is_scalar = times.ndim == 0
+    times     = np.atleast_1d(times)
+    lap_index = np.clip(self.lap_indices(times, side = "left"), 0, self.row_lengths - 2)
+
+    # Interpolate between the completed and the projected laps
+    current_time = self.cumulative_times[self.row_starts + lap_index]
+    next_time    = self.cumulative_times[self.row_starts + lap_index + 1]
+    laps         = lap_index + (times[:, np.newaxis] - current_time) / (next_time - current_time)
+
+    # After the last lap the stopped teams stay put
+    end_time  = self.cumulative_times[self.row_starts + self.number_of_laps]
+    has_ended = self.has_stopped & (current_time >= end_time - 1e-6)
+    laps      = np.where(has_ended, self.number_of_laps, laps)
+
+    return laps[0] if is_scalar else laps
+
+  def positions_at(self, times):
+    # The position of every team, the team with the most laps is first. Equal
+    # laps keep the order of the final results
+    laps  = np.atleast_2d(self.laps_at(times))
+    order = np.argsort(-laps, axis = 1, kind = "stable")
+
+    positions = np.empty_like(order)
+    np.put_along_axis(positions, order, np.arange(1, laps.shape[1] + 1)[np.newaxis, :], axis = 1)
+
+    return positions[0] if np.ndim(times) == 0 else positions
+
+  def time_at_laps(self, team_indices, laps):
+    # The race time the teams reached the given interpolated laps, on the same
+    # completed and projected laps as laps_at
+    row_start = self.row_starts[team_indices]
+    lap_index = np.clip(np.floor(laps).astype(np.int64), 0, self.row_lengths[team_indices] - 2)
+
+    current_time = self.cumulative_times[row_start + lap_index]
+    next_time    = self.cumulative_times[row_start + lap_index + 1]
+
+    return current_time + (laps - lap_index) * (next_time - current_time)
+
+  def gaps_to_leader_at(self, times):
+    # The gap in laps to the leader and the time since the leader was at the
+    # same distance as the team
+    times = np.asarray(times, dtype = np.float64)
+    laps  = np.atleast_2d(self.laps_at(times))
+
+    leader_indices = np.argmax(laps, axis = 1)
+    lap_gaps       = laps.max(axis = 1)[:, np.newaxis] - laps
+
+    leader_indices = np.broadcast_to(leader_indices[:, np.newaxis], laps.shape)
+    time_gaps      = np.atleast_1d(times)[:, np.newaxis] - self.time_at_laps(leader_indices, laps)
+
+    if times.ndim == 0:
+      return lap_gaps[0], time_gaps[0]
+
+    return lap_gaps, time_gaps
+
+  def drivers_at(self, times):
+    # The driver in the kart of every team, which is the driver of the lap in
+    # progress or of the last lap when the team finished. At the end of a lap
+    # it is still the driver of that lap, like the hover texts of the plots
+    times     = np.asarray(times, dtype = np.float64)
+    lap_index = self.lap_indices(np.atleast_1d(times), side = "left")
+    lap_index = np.clip(lap_index, 0, self.number_of_laps - 1)
+
+    drivers = self.lap_drivers[self.driver_starts + lap_index]
+
+    return drivers[0] if times.ndim == 0 else drivers
+
+  def standings_at(self, times):
+    # The standings at every time, sorted on position. A single time gives one
+    # list of standings
+    times               = np.asarray(times, dtype = np.float64)
+    laps                = np.atleast_2d(self.laps_at(times))
+    positions           = np.atleast_2d(self.positions_at(times))
+    lap_gaps, time_gaps = [np.atleast_2d(gaps) for gaps in self.gaps_to_leader_at(times)]
+    drivers             = np.atleast_2d(self.drivers_at(times))
+
+    all_standings = []
+    for time_index in range(laps.shape[0]):
+      standings = []
+      for team_index in np.argsort(positions[time_index]):
+        standings.append({"position" : int(positions[time_index, team_index]),
+                          "team"     : self.team_names[team_index],
+                          "laps"     : float(laps[time_index, team_index]),
+                          "lap_gap"  : float(lap_gaps[time_index, team_index]),
+                          "time_gap" : float(time_gaps[time_index, team_index]),
+                          "driver"   : drivers[time_index, team_index]})
+
+      all_standings.append(standings)
+
+    return all_standings[0] if times.ndim == 0 else all_standings
+
+################
+# Main program #
+################
+if __name__ == "__main__":
+  parser = argparse.ArgumentParser(description = "Show the standings at any time of " +
+                                                 "the race.")
+
+  parser.add_argument("-i", "--input",
+                      required = True,
+                      help     = "The input YAML file containing all the karting data")
+  parser.add_argument("-t", "--times",
+                      type     = float,
+                      nargs    = "+",
+                      required = True,
+                      help     = "The race times in seconds")
+
+  args = parser.parse_args()
+
+  # The analysis imports this module, so only import it for the command line.
+  # The index needs the extended cumulative times of the analysis
+  import race_analysis
+
+  race     = race_model.load_race(args.input)
+  analysis = race_analysis.create_analysis(race)
+  race_analysis.calculate_team_data(race, analysis)
+  race_analysis.calculate_cumulative_times_extended(analysis)
+
+  time_index = TimeIndex(race, analysis["cumulative_times_extended"])
+
+  for time, standings in zip(args.times, time_index.standings_at(args.times)):
+    print(f"Standings at {time:.0f} sec:")
+    for standing in standings:
+      print(f"  P{standing['position']:<3} {standing['team']:<30} "
+            f"{standing['laps']:9.3f} laps "
+            f"+{standing['lap_gap']:6.3f} laps "
+            f"+{standing['time_gap']:8.3f} sec "
+            f"{standing['driver']}")
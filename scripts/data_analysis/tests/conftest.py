@@ -0,0 +1,31 @@
+import os
+import sys
+
+import pytest
+
+# The scripts import each other by name from the src folder
+SOURCE_FOLDER  = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src")
+RESULTS_FOLDER = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "..", "..", "results")
+
+sys.path.insert(0, SOURCE_FOLDER)
+
+import race_model
+import synthetic_race
+
+@pytest.fixture(scope = "session")
+def results_folder():
+  # The tracked results archive with the karting data and the exports
+  return RESULTS_FOLDER
+
+@pytest.fixture(scope = "session")
+def synthetic():
+  # A short race with a stopped team, generated the same way every time
+  return synthetic_race.generate_race(number_of_teams = 6,
+                                      race_duration   = 1800,
+                                      stopped_teams   = 1,
+                                      seed            = 3)
+
+@pytest.fixture(scope = "session")
+def results_race(results_folder):
+  # A real race of the results folder with pit laps and several drivers per team
+  return race_model.load_race(os.path.join(results_folder, "2025", "2025_11_27", "karting_results.yaml"))
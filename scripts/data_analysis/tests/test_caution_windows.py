@@ -0,0 +1,46 @@
+import copy
+
+import numpy as np
+
+import race_model
+import lap_flags
+import caution_windows
+
+CAUTION_START = 900.0
+CAUTION_END   = 1000.0
+
+def slow_down_the_field(race):
+  # Every lap that starts in the caution period is 40% slower, like behind a
+  # safety kart
+  race = copy.deepcopy(race)
+  for team in race.teams:
+    lap_starts = race_model.cumulative_times(team) - team.lap_times
+    is_slowed  = (lap_starts >= CAUTION_START) & (lap_starts < CAUTION_END) & \
+                 (team.lap_drivers != race_model.PIT_CODE)
+    team.lap_times[is_slowed] *= 1.4
+
+  return race
+
+def test_slowed_down_field_gives_a_caution_window(synthetic):
+  race                    = slow_down_the_field(synthetic)
+  team_lap_flags, windows = caution_windows.classify_laps(race)
+
+  overlaps = (windows[:, 0] < CAUTION_END + 100.0) & (windows[:, 1] > CAUTION_START)
+  assert np.any(overlaps)
+
+  # The laps in the window are caution laps and aren't clean
+  start, end = windows[np.flatnonzero(overlaps)[0]]
+  for team in race.teams:
+    lap_ends   = race_model.cumulative_times(team)
+    lap_starts = lap_ends - team.lap_times
+    in_window  = (lap_starts < end) & (lap_ends > start)
+    flags      = team_lap_flags[team.name]
+
+    assert np.all(flags[in_window] & lap_flags.LAP_CAUTION)
+    assert not np.any(lap_flags.is_clean(flags[in_window]))
+
+def test_windows_are_sorted_and_apart(results_race):
+  _, windows = caution_windows.classify_laps(results_race)
+
+  assert np.all(windows[:, 1] > windows[:, 0])
+  assert np.all(windows[1:, 0] > windows[:-1, 1])
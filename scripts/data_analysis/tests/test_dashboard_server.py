@@ -0,0 +1,56 @@
+import asyncio
+import json
+
+import numpy as np
+import pytest
+
+plotly_go = pytest.importorskip("plotly.graph_objects")
+
+import dashboard_server
+
+def test_scatter_is_sliced_and_downsampled():
+  x      = np.arange(10000, dtype = np.float64)
+  figure = dashboard_server.DashboardFigure(plotly_go.Figure(plotly_go.Scatter(x = x, y = np.sin(x))))
+
+  trace = json.loads(figure.to_json((1000.0, 2000.0), 100))["data"][0]
+  assert len(trace["x"]) <= 102
+  assert 990 <= min(trace["x"]) and max(trace["x"]) <= 2010
+
+def test_heatmap_with_names_is_sent_as_it_is():
+  names  = ["Ann", "Bob", "Cis"]
+  z      = np.arange(9.0).reshape(3, 3)
+  figure = dashboard_server.DashboardFigure(plotly_go.Figure(plotly_go.Heatmap(x = names, y = names, z = z)))
+
+  trace = json.loads(figure.to_json((0.0, 1.0), 100))["data"][0]
+  assert trace["x"] == names and trace["y"] == names
+
+class FailingDashboard:
+  def get_response(self, path, query):
+    raise RuntimeError("broken figure")
+
+def test_failing_request_is_answered_with_an_error():
+  async def request():
+    server = await asyncio.start_server(lambda reader, writer:
+                                          dashboard_server.handle_connection(FailingDashboard(), reader, writer),
+                                        "127.0.0.1",
+                                        0)
+    port = server.sockets[0].getsockname()[1]
+
+    async with server:
+      reader, writer = await asyncio.open_connection("127.0.0.1", port)
+      writer.write(b"GET /figures/0 HTTP/1.1\r\nConnection: close\r\n\r\n")
+      await writer.drain()
+      status_line = await reader.readline()
+      writer.close()
+
+    return status_line
+
+  assert asyncio.run(request()).startswith(b"HTTP/1.1 500")
+
+def test_names_of_the_karting_data_are_never_html():
+  dashboard           = object.__new__(dashboard_server.Dashboard)
+  dashboard.race_name = "<img src=x onerror=alert(1)>"
+
+  index_page = dashboard.index_page()
+  assert "<img" not in index_page
+  assert "innerHTML" not in index_page
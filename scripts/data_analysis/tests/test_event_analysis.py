@@ -0,0 +1,49 @@
+import os
+
+import numpy as np
+import pytest
+
+import race_model
+import stage_cache
+import synthetic_race
+import event_analysis
+
+@pytest.fixture(scope = "module")
+def event():
+  # A heat and a finale of the same drivers
+  sessions = [synthetic_race.generate_race(number_of_teams = 4, race_duration = 900, seed = seed,
+                                           race_name = f"Event - {name}")
+              for seed, name in [(1, "Heat"), (2, "Finale")]]
+
+  return race_model.Event("Event", sessions)
+
+def test_drivers_are_combined_over_the_sessions(event):
+  analysis = event_analysis.analyse_event(event)
+  heat     = event.sessions[0]
+  driver   = analysis["drivers"]["Team1Driver1"]
+
+  assert analysis["session_starts"] == [0.0, race_model.total_race_time(heat)]
+  assert driver["sessions"] == [0, 1]
+  assert driver["laps"] == sum(np.count_nonzero(race_model.lap_driver_names(session, team) == "Team1Driver1")
+                               for session in event.sessions for team in session.teams)
+  assert driver["relative_pace"] == pytest.approx(1.0, abs = 0.1)
+
+  timeline = driver["timeline"]
+  assert np.all(np.diff(timeline["event_times"]) > 0)
+  assert timeline["sessions"] == sorted(timeline["sessions"])
+
+def test_sessions_come_from_the_cache(event, tmp_path):
+  cache = stage_cache.StageCache(str(tmp_path), max_size = 1 << 30)
+
+  first  = event_analysis.analyse_event(event, cache = cache)
+  second = event_analysis.analyse_event(event, cache = cache)
+
+  assert (cache.hits, cache.misses) == (2, 2)
+  assert second["drivers"].keys() == first["drivers"].keys()
+
+def test_laps_of_the_team_itself_have_no_driver(results_folder):
+  race       = race_model.parse_race(os.path.join(results_folder, "2026", "2026_05_17", "karting_results.yaml"))
+  statistics = event_analysis.calculate_session_statistics(race)
+
+  assert statistics["drivers"]
+  assert not {team.name for team in race.teams} & set(statistics["drivers"])
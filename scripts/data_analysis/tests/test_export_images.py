@@ -0,0 +1,41 @@
+import os
+
+import export_images
+import generate_plots
+import stage_cache
+import synthetic_race
+
+class CountingRenderer:
+  # Writes a placeholder instead of starting kaleido and counts the renders
+  def __init__(self):
+    self.filenames = []
+
+  def write(self, figure_json, filename):
+    self.filenames.append(filename)
+    with open(filename, 'w') as image_file:
+      image_file.write(figure_json)
+
+def image_files(output_folder):
+  return sorted(os.path.join(folder, name) for folder, _, names in os.walk(output_folder) for name in names)
+
+def test_unchanged_images_are_not_rendered_again(synthetic, tmp_path):
+  filename = str(tmp_path / "karting_results.yaml")
+  synthetic_race.write_race(synthetic, filename)
+
+  cache             = stage_cache.StageCache(str(tmp_path / "cache"), max_size = 1 << 30)
+  output_folder     = str(tmp_path / "plots")
+  number_of_figures = len(generate_plots.TOTAL_FIGURES) + len(generate_plots.DRIVER_FIGURES)
+
+  renderer = CountingRenderer()
+  export_images.export_race_images(filename, output_folder, renderer, formats = ["png"], cache = cache)
+  assert len(renderer.filenames) == number_of_figures
+
+  # The images come from the cache, even when the output folder was removed
+  for image_filename in image_files(output_folder):
+    os.remove(image_filename)
+
+  renderer = CountingRenderer()
+  export_images.export_race_images(filename, output_folder, renderer, formats = ["png", "svg"], cache = cache)
+  assert len(renderer.filenames) == number_of_figures
+  assert all(image_filename.endswith(".svg") for image_filename in renderer.filenames)
+  assert len(image_files(output_folder)) == 2 * number_of_figures
@@ -0,0 +1,81 @@
+import itertools
+
+import numpy as np
+import scipy.optimize
+import pytest
+
+import group_balancer
+
+def random_karters(number_of_karters, seed):
+  rng = np.random.default_rng(seed)
+  return [{"name"                : f"Karter{index}",
+           "average_lap"         : float(40.0 + 5.0 * rng.random()),
+           "race_effort"         : float(0.8 + 0.4 * rng.random()),
+           "group"               : 0,
+           "unwanted_team_sizes" : []}
+          for index in range(number_of_karters)]
+
+def brute_force_cost(karters, team_sizes):
+  # The lowest standard deviation of the team averages over every assignment
+  average_laps = np.array([karter["average_lap"] for karter in karters])
+  race_efforts = np.array([karter["race_effort"] for karter in karters])
+  positions    = np.repeat(np.arange(len(team_sizes)), team_sizes)
+
+  teams = np.array(sorted(set(itertools.permutations(positions))))
+  team_weights, team_rates = group_balancer.team_average_laps(average_laps, race_efforts, teams, len(team_sizes))
+
+  return float(group_balancer.group_costs(team_weights / team_rates).min())
+
+def test_exact_solver_matches_brute_force():
+  team_sizes = [3, 3, 2]
+  karters    = random_karters(sum(team_sizes), seed = 4)
+
+  result = group_balancer.balance_groups([team_sizes], karters, restarts = 1, workers = 1, seed = 0, solver = "exact")[0]
+
+  assert result["is_optimal"]
+  assert result["standard_deviation"] == pytest.approx(brute_force_cost(karters, team_sizes), abs = group_balancer.EXACT_TOLERANCE)
+
+def test_exact_solver_keeps_a_valid_bound_at_the_time_limit():
+  team_sizes = [3] * 8
+  karters    = random_karters(sum(team_sizes), seed = 1)
+
+  result = group_balancer.balance_groups([team_sizes], karters, restarts = 20, workers = 1, seed = 0,
+                                         solver = "exact", time_limit = 0.05)[0]
+
+  assert result["lower_bound"] <= result["standard_deviation"]
+
+def test_interval_stopped_by_the_time_limit_stays_open():
+  # Two of the three teams with a mean in the interval
+  averages  = np.array([40.0, 41.0, 42.0])
+  partition = scipy.optimize.LinearConstraint(np.ones((1, len(averages))), 2, 2)
+
+  bound, _ = group_balancer.solve_mean_interval(averages, partition, 2, 40.0, 42.0, True, time_limit = 0.0)
+  assert bound == 0.0
+
+  bound, chosen = group_balancer.solve_mean_interval(averages, partition, 2, 50.0, 60.0, True, time_limit = 10.0)
+  assert bound == np.inf
+  assert chosen is None
+
+def test_swap_search_respects_the_unwanted_team_sizes():
+  group_sizes = [[3, 3, 2], [2, 2]]
+  karters     = random_karters(12, seed = 2)
+  for karter in karters[8:]:
+    karter["group"] = 1
+
+  karters[0]["unwanted_team_sizes"] = [3]
+
+  results = group_balancer.balance_groups(group_sizes, karters, restarts = 20, workers = 2, seed = 5, solver = "heuristic")
+
+  assert [len(result["teams"]) for result in results] == [3, 2]
+  assert [[len(team["karters"]) for team in result["teams"]] for result in results] == group_sizes
+  assert all(result["lower_bound"] is None for result in results)
+  assert "Karter0" in results[0]["teams"][2]["karters"]
+  assert results == group_balancer.balance_groups(group_sizes, karters, restarts = 20, workers = 2, seed = 5, solver = "heuristic")
+
+def test_swap_search_fails_without_a_valid_assignment():
+  karters = random_karters(4, seed = 3)
+  for karter in karters:
+    karter["unwanted_team_sizes"] = [2]
+
+  with pytest.raises(ValueError):
+    group_balancer.balance_groups([[2, 2]], karters, restarts = 1, workers = 1, solver = "heuristic")
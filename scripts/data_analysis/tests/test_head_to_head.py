@@ -0,0 +1,26 @@
+import numpy as np
+import pytest
+
+import caution_windows
+import head_to_head
+
+def test_all_pairs_match_the_pair_comparison(results_race):
+  team_lap_flags = caution_windows.classify_laps(results_race)[0]
+  comparisons    = head_to_head.compare_all_drivers(results_race, team_lap_flags)
+
+  overlap_durations = comparisons["overlap_durations"]
+  pace_deltas       = comparisons["pace_deltas"]
+  np.testing.assert_allclose(overlap_durations, overlap_durations.T)
+  np.testing.assert_allclose(pace_deltas, -pace_deltas.T)
+
+  pairs = np.argwhere(overlap_durations >= head_to_head.MIN_OVERLAP)
+  assert len(pairs) > 0
+
+  for index_a, index_b in pairs[::5]:
+    comparison = head_to_head.compare_drivers(results_race,
+                                              team_lap_flags,
+                                              comparisons["driver_names"][index_a],
+                                              comparisons["driver_names"][index_b])
+
+    assert comparison["overlap_duration"] == pytest.approx(overlap_durations[index_a, index_b], rel = 1e-6)
+    assert comparison["pace_delta"] == pytest.approx(pace_deltas[index_a, index_b], rel = 1e-6, abs = 1e-9)
@@ -0,0 +1,32 @@
+import copy
+
+import numpy as np
+
+import race_model
+import lap_flags
+
+def test_pit_laps_and_the_laps_around_them(synthetic):
+  team_lap_flags = lap_flags.classify_laps(synthetic)
+
+  for team in synthetic.teams:
+    flags     = team_lap_flags[team.name]
+    is_pit    = team.lap_drivers == race_model.PIT_CODE
+    pit_index = np.flatnonzero(is_pit)
+
+    assert np.all(flags[is_pit] & lap_flags.LAP_PIT)
+    assert np.all(flags[pit_index[pit_index > 0] - 1] & lap_flags.LAP_IN)
+    assert np.all(flags[pit_index[pit_index < len(flags) - 1] + 1] & lap_flags.LAP_OUT)
+
+def test_slow_lap_is_an_outlier(synthetic):
+  race = copy.deepcopy(synthetic)
+  team = race.teams[0]
+
+  lap_index = len(team.lap_times) // 2
+  while team.lap_drivers[lap_index - 1:lap_index + 2].tolist().count(race_model.PIT_CODE) > 0:
+    lap_index += 1
+  team.lap_times[lap_index] += 20.0
+
+  flags = lap_flags.classify_laps(race)[team.name]
+  assert flags[lap_index] & lap_flags.LAP_OUTLIER
+  assert not lap_flags.is_clean(flags)[lap_index]
+  assert lap_flags.lap_type_names(flags)[lap_index] == "Outlier"
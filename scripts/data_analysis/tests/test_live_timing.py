@@ -0,0 +1,58 @@
+import json
+import socket
+import asyncio
+
+import live_timing
+
+def feed_race(timing, race):
+  for _, team_name, lap_time, driver_name in zip(*live_timing.race_lap_events(race)):
+    timing.handle_line(json.dumps({"team"     : team_name,
+                                   "lap_time" : float(lap_time),
+                                   "driver"   : driver_name}))
+
+def test_snapshots_dont_bootstrap_the_projection(synthetic, tmp_path):
+  timing = live_timing.LiveTiming(output = str(tmp_path / "standings.json"), quiet = True, race_duration = 1800)
+  feed_race(timing, synthetic)
+
+  timing.write_snapshot()
+  assert "projection" not in json.loads((tmp_path / "standings.json").read_text())
+
+  timing.project()
+  timing.write_snapshot()
+  projection = json.loads((tmp_path / "standings.json").read_text())["projection"]
+  assert len(projection) == len(synthetic.teams)
+
+def test_invalid_utf8_on_the_socket_is_skipped():
+  timing = live_timing.LiveTiming(quiet = True)
+
+  with socket.socket() as free_socket:
+    free_socket.bind(("127.0.0.1", 0))
+    port = free_socket.getsockname()[1]
+
+  async def send_laps():
+    server_task = asyncio.ensure_future(live_timing.serve_socket("127.0.0.1", port, timing.handle_line))
+    await asyncio.sleep(0.2)
+
+    reader, writer = await asyncio.open_connection("127.0.0.1", port)
+    writer.write(b"\xff\xfe not a lap\n")
+    writer.write(json.dumps({"team" : "TEAM 1", "lap_time" : 40.0, "driver" : "Ann"}).encode() + b"\n")
+    await writer.drain()
+    writer.close()
+    await asyncio.sleep(0.2)
+
+    server_task.cancel()
+
+  asyncio.run(send_laps())
+  assert timing.live_race.teams["TEAM 1"].laps == 1
+
+def test_lap_times_that_arent_positive_are_skipped(capsys):
+  timing = live_timing.LiveTiming(quiet = True)
+
+  # JSON has no NaN or infinity, but Python's json module reads them
+  for lap_time in ["NaN", "Infinity", "0", "-40.0", "\"fast\""]:
+    timing.handle_line(f'{{"team" : "TEAM 1", "lap_time" : {lap_time}, "driver" : "Ann"}}')
+
+  timing.handle_line(json.dumps({"team" : "TEAM 1", "lap_time" : 40.0, "driver" : "Ann"}))
+
+  assert timing.live_race.teams["TEAM 1"].laps == 1
+  assert capsys.readouterr().out.count("Skipping the invalid lap") == 5
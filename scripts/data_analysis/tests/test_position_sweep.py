@@ -0,0 +1,39 @@
+import numpy as np
+import pytest
+
+import race_model
+import position_sweep
+
+def brute_force_positions(race, time):
+  # The running order at the time from a full sort of the teams: the most laps
+  # first and then who completed them first. Before the first lap the teams
+  # are ordered on the time they complete their first lap
+  keys = []
+  for team_index, team in enumerate(race.teams):
+    cumulative_times = race_model.cumulative_times(team)
+    laps             = int(np.searchsorted(cumulative_times, time, side = "right"))
+    lap_time         = cumulative_times[laps - 1] if laps > 0 else cumulative_times[0]
+    keys.append((-laps, lap_time, team_index))
+
+  positions = np.empty(len(race.teams), dtype = np.int64)
+  for position, (_, _, team_index) in enumerate(sorted(keys)):
+    positions[team_index] = position + 1
+
+  return positions
+
+@pytest.mark.parametrize("race_fixture", ["synthetic", "results_race"])
+def test_sweep_matches_a_full_sort(race_fixture, request):
+  race                                 = request.getfixturevalue(race_fixture)
+  position_times, positions, overtakes = position_sweep.sweep_positions(race)
+
+  # Compare between the lap completions, where the running order is unique
+  event_times = np.unique(np.concatenate([race_model.cumulative_times(team) for team in race.teams]))
+  times       = ((event_times[1:] + event_times[:-1]) / 2)[::7]
+
+  for time in times:
+    expected = brute_force_positions(race, time)
+    for team_index, team in enumerate(race.teams):
+      change_index = int(np.searchsorted(position_times[team.name], time, side = "right")) - 1
+      assert positions[team.name][change_index] == expected[team_index], f"{team.name} at {time}"
+
+  assert len(overtakes) > 0
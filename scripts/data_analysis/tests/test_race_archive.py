@@ -0,0 +1,37 @@
+import os
+
+import race_model
+import race_archive
+import stage_cache
+
+def test_circuit_of_the_karting_data_comes_first(results_folder):
+  race_folder = os.path.join(results_folder, "2026", "2026_05_17")
+  race        = race_model.parse_race(os.path.join(race_folder, race_archive.RACE_FILENAME))
+
+  assert race_archive.find_circuit(race_folder) == race_archive.UNKNOWN_CIRCUIT
+  assert race_archive.race_circuit(race, race_folder) == "extreme_kart"
+
+def test_unknown_circuit_is_never_the_latest():
+  circuits = ["extreme_kart", "first_kart_inn", race_archive.UNKNOWN_CIRCUIT]
+
+  assert race_archive.last_known_circuit(circuits) == "first_kart_inn"
+  assert race_archive.last_known_circuit([race_archive.UNKNOWN_CIRCUIT]) is None
+
+def test_laps_of_the_team_itself_are_not_rated(results_folder):
+  # The older karting data gives the laps without a driver to the team
+  race       = race_model.parse_race(os.path.join(results_folder, "2026", "2026_05_17", race_archive.RACE_FILENAME))
+  session    = race_archive.calculate_session(race)
+  team_names = {team.name for team in race.teams}
+
+  assert session["drivers"]
+  assert not team_names & set(session["drivers"])
+
+def test_database_is_never_evicted_from_the_cache(tmp_path):
+  database = tmp_path / os.path.relpath(race_archive.DEFAULT_DATABASE, stage_cache.DEFAULT_CACHE_FOLDER)
+  race_archive.save_database({"code_version" : None, "sessions" : {}}, str(database))
+
+  cache = stage_cache.StageCache(str(tmp_path), max_size = 0)
+  cache.cached("parse", ["race"], lambda: list(range(100)))
+
+  assert database.exists()
+  assert not any(entry.is_file() for entry in tmp_path.iterdir())
@@ -0,0 +1,45 @@
+import numpy as np
+import pytest
+
+import race_analysis
+import race_edits
+
+# The parts of the analysis that are compared with a full analysis of the
+# edited race
+TEAM_ARRAYS = ["cumulative_times", "running_averages", "cumulative_times_extended",
+               "interpolated_laps", "total_running_average_diff", "positions"]
+
+@pytest.fixture
+def edits(synthetic):
+  teams = synthetic.teams
+  return [{"action" : "change_lap", "team" : teams[0].name, "lap" : 40, "time" : 95.5},
+          {"action" : "insert_lap", "team" : teams[2].name, "lap" : 25, "time" : 61.2,
+           "driver" : synthetic.drivers[teams[2].lap_drivers[24]]},
+          {"action" : "remove_lap", "team" : teams[3].name, "lap" : 10},
+          {"action" : "stop_team",  "team" : teams[1].name}]
+
+def test_update_matches_a_full_analysis(synthetic, edits):
+  edited_analysis = race_edits.edit_race(race_analysis.analyse_race(synthetic), edits)
+  full_analysis   = race_analysis.analyse_race(edited_analysis["race"])
+
+  np.testing.assert_allclose(edited_analysis["all_cumulative_times"], full_analysis["all_cumulative_times"])
+  np.testing.assert_allclose(edited_analysis["total_running_average"], full_analysis["total_running_average"])
+  assert edited_analysis["teams_max_cumulative_time_index"] == full_analysis["teams_max_cumulative_time_index"]
+  assert edited_analysis["team_drivers"] == full_analysis["team_drivers"]
+
+  for name in TEAM_ARRAYS:
+    for team_name, values in full_analysis[name].items():
+      np.testing.assert_allclose(edited_analysis[name][team_name], values, err_msg = f"{name} of {team_name}")
+
+def test_edits_leave_the_analysis_before_the_edits(synthetic, edits):
+  analysis             = race_analysis.analyse_race(synthetic)
+  all_cumulative_times = list(analysis["all_cumulative_times"])
+  lap_times            = [team.lap_times.copy() for team in synthetic.teams]
+
+  race_edits.edit_race(analysis, edits)
+
+  assert analysis["race"] is synthetic
+  assert analysis["all_cumulative_times"] == all_cumulative_times
+  assert not synthetic.teams[1].has_stopped
+  for team, team_lap_times in zip(synthetic.teams, lap_times):
+    np.testing.assert_array_equal(team.lap_times, team_lap_times)
@@ -0,0 +1,78 @@
+import os
+import datetime
+
+import numpy as np
+import pytest
+
+pytest.importorskip("openpyxl")
+
+import race_model
+import race_importer
+
+def export_filename(results_folder, race_folder, extension):
+  year = race_folder[:4]
+  return os.path.join(results_folder, year, race_folder, f"karting_results.{extension}")
+
+def number_of_laps(race):
+  return sum(len(team.lap_times) for team in race.teams)
+
+def test_workbook_with_the_race_on_two_sheets_matches_the_karting_data(results_folder, results_race):
+  # The lap times are on the RACE sheet under a banner per team and the
+  # results on the RACE SHORT sheet, split over two tables
+  race = race_importer.import_race(export_filename(results_folder, "2025_11_27", "xlsx"))
+
+  assert race.name == "2 uren race - Finale - 22:47 - Sodi 270cc"
+  assert number_of_laps(race) == 1794
+  assert len(race.teams) == len(results_race.teams)
+
+  for team, expected in zip(race.teams, results_race.teams):
+    assert team.finish_position    == expected.finish_position
+    assert team.kart_number        == expected.kart_number
+    assert team.distance_to_winner == expected.distance_to_winner
+    np.testing.assert_allclose(team.lap_times, expected.lap_times)
+
+def test_workbook_also_imports_the_qualification(results_folder):
+  sessions = race_importer.import_sessions(export_filename(results_folder, "2025_11_27", "xlsx"))
+
+  assert sorted(sum(len(team["laps"]) for team in session["results"]) for session in sessions) == [206, 1794]
+
+def test_workbook_with_a_lap_times_grid(results_folder):
+  race = race_importer.import_race(export_filename(results_folder, "2024_12_05", "xlsx"))
+
+  assert len(race.teams) == 10
+  assert number_of_laps(race) == 1942
+  assert race.teams[4].distance_to_winner == "5 laps 3.106 sec"
+
+def test_printout_with_driver_orders(results_folder):
+  race = race_importer.import_race(export_filename(results_folder, "2023_11_23", "txt"))
+
+  assert len(race.teams) == 10
+  assert number_of_laps(race) == 1839
+  assert race.teams[1].distance_to_winner == "1.780 sec"
+  assert race_model.PIT_DRIVER in race_model.lap_driver_names(race, race.teams[0])
+
+def test_printout_with_only_lap_times_is_ranked_on_laps(results_folder):
+  race = race_importer.import_race(export_filename(results_folder, "2025_03_23", "txt"))
+
+  assert race.name == "2025_03_23"
+  assert race_model.race_driver_names(race) == [race_model.UNKNOWN_DRIVER]
+  assert not race_model.named_driver_laps_mask(race, race.teams[0]).any()
+  assert number_of_laps(race) == 2059
+  assert [len(team.lap_times) for team in race.teams] == sorted((len(team.lap_times) for team in race.teams),
+                                                                reverse = True)
+
+def test_results_without_lap_times_fail(tmp_path):
+  filename = tmp_path / "karting_results.csv"
+  filename.write_text("Pos.;Kart;Team;Rondes;Afstand\n" +
+                      "1;2;FAST;10;\n" +
+                      "2;3;SLOW;9;1 Ronde\n")
+
+  with pytest.raises(ValueError):
+    race_importer.import_race(str(filename))
+
+@pytest.mark.parametrize("value, expected", [(datetime.time(0, 1, 2, 345000),    62.345),
+                                             (datetime.timedelta(seconds = 36.4), 36.4),
+                                             ("1:00.468",                         60.468),
+                                             (36402,                              36.402)])
+def test_parse_time(value, expected):
+  assert race_importer.parse_time(value) == pytest.approx(expected)
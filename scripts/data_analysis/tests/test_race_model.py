@@ -0,0 +1,39 @@
+import numpy as np
+import pytest
+
+import race_model
+
+@pytest.mark.parametrize("race_fixture", ["synthetic", "results_race"])
+def test_race_survives_a_round_trip(race_fixture, request):
+  race       = request.getfixturevalue(race_fixture)
+  round_trip = race_model.race_from_dict(race_model.race_to_dict(race))
+
+  assert round_trip.name == race.name
+  assert round_trip.circuit == race.circuit
+  assert [team.name for team in round_trip.teams] == [team.name for team in race.teams]
+
+  for team, expected in zip(round_trip.teams, race.teams):
+    assert team.finish_position    == expected.finish_position
+    assert team.kart_number        == expected.kart_number
+    assert team.distance_to_winner == expected.distance_to_winner
+    assert team.has_stopped        == expected.has_stopped
+    np.testing.assert_array_equal(team.lap_times, expected.lap_times)
+    np.testing.assert_array_equal(race_model.lap_driver_names(round_trip, team),
+                                  race_model.lap_driver_names(race, expected))
+
+def test_circuit_is_kept(synthetic):
+  race_data            = race_model.race_to_dict(synthetic)
+  race_data["circuit"] = "extreme_kart"
+
+  assert race_model.race_to_dict(race_model.race_from_dict(race_data))["circuit"] == "extreme_kart"
+  assert "circuit" not in race_model.race_to_dict(synthetic)
+
+@pytest.mark.parametrize("distance, expected", [("0.217 sec",           (0, 0.217)),
+                                                ("2 laps",              (2, None)),
+                                                ("1 lap 14.248 sec",    (1, 14.248)),
+                                                ("9 Rondes 25.528 sec", (9, 25.528)),
+                                                ("1 Ronde",             (1, None)),
+                                                ("0",                   (0, 0.0)),
+                                                ("DNF",                 (None, None))])
+def test_parse_distance_to_winner(distance, expected):
+  assert race_model.parse_distance_to_winner(distance) == expected
@@ -0,0 +1,49 @@
+import numpy as np
+import pytest
+
+import race_simulator
+
+def balancer_output(average_laps):
+  karters = [{"name" : f"Karter{index}", "average_lap" : average_lap} for index, average_lap in enumerate(average_laps)]
+  teams   = [{"karters" : [karter["name"] for karter in karters[first:first + 2]]} for first in range(0, len(karters), 2)]
+
+  return {"karters" : karters,
+          "groups"  : [{"group" : 0, "teams" : teams}]}
+
+def small_history(karter_names, seed):
+  rng = np.random.default_rng(seed)
+  return {"residuals"  : {name : 1.0 + 0.01 * rng.standard_normal(200) for name in karter_names},
+          "forms"      : {name : 1.0 + 0.005 * rng.standard_normal(3) for name in karter_names},
+          "pit_losses" : np.array([20.0, 25.0, 30.0])}
+
+def test_session_history_is_relative_to_the_session(synthetic):
+  history = race_simulator.session_history(synthetic)
+
+  assert np.median(history["residuals"]) == pytest.approx(1.0, abs = 0.01)
+  assert np.median(history["relative_paces"]) == pytest.approx(1.0)
+  assert np.all(history["clean_laps"] >= race_simulator.race_archive.MIN_CLEAN_LAPS)
+  assert np.all(history["pit_losses"] > 0)
+
+def test_faster_team_wins_more_often():
+  output  = balancer_output([40.0, 40.0, 41.0, 41.0, 42.0, 42.0])
+  history = small_history([karter["name"] for karter in output["karters"]], seed = 1)
+
+  result = race_simulator.simulate_groups(output, history, races = 400, race_duration = 30, stint_duration = 10,
+                                          workers = 1, seed = 2)[0]
+
+  win_probabilities = [team["win_probability"] for team in result["teams"]]
+  average_positions = [team["average_position"] for team in result["teams"]]
+
+  assert sum(win_probabilities) == pytest.approx(1.0)
+  assert win_probabilities[0] > 0.9
+  assert average_positions == sorted(average_positions)
+  assert result["teams"][0]["average_gap"] == pytest.approx(0.0, abs = 1.0)
+
+def test_simulation_is_reproducible_with_a_seed():
+  output  = balancer_output([40.0, 40.5, 40.2, 40.3])
+  history = small_history([karter["name"] for karter in output["karters"]], seed = 3)
+
+  first  = race_simulator.simulate_groups(output, history, races = 600, race_duration = 20, workers = 2, seed = 4)
+  second = race_simulator.simulate_groups(output, history, races = 600, race_duration = 20, workers = 2, seed = 4)
+
+  assert first == second
@@ -0,0 +1,61 @@
+import os
+import copy
+
+import numpy as np
+
+import stage_cache
+
+def set_entry_time(cache, stage_name, key, seconds):
+  filename = cache.entry_filename(stage_name, key)
+  os.utime(filename, (seconds, seconds))
+
+def test_same_key_is_a_hit_and_a_new_key_a_miss(tmp_path):
+  cache = stage_cache.StageCache(str(tmp_path), max_size = 1 << 20)
+  calls = []
+
+  def compute():
+    calls.append(None)
+    return np.arange(5)
+
+  np.testing.assert_array_equal(cache.cached("timeline", ["race", 1], compute), np.arange(5))
+  np.testing.assert_array_equal(cache.cached("timeline", ["race", 1], compute), np.arange(5))
+  cache.cached("timeline", ["race", 2], compute)
+  cache.cached("driver stats", ["race", 1], compute)
+
+  assert len(calls) == 3
+  assert (cache.hits, cache.misses) == (1, 3)
+
+def test_least_recently_used_entries_are_evicted(tmp_path):
+  # Every entry is a bit over a third of the cache, so only two fit
+  entry = bytes(400)
+  cache = stage_cache.StageCache(str(tmp_path), max_size = 1000)
+
+  cache.cached("stage", ["first"], lambda: entry)
+  cache.cached("stage", ["second"], lambda: entry)
+  set_entry_time(cache, "stage", ["first"], 1000)
+  set_entry_time(cache, "stage", ["second"], 2000)
+
+  # Reading the first entry makes the second one the least recently used
+  assert cache.lookup("stage", ["first"]) is not None
+  cache.cached("stage", ["third"], lambda: entry)
+
+  assert cache.lookup("stage", ["first"]) is not None
+  assert cache.lookup("stage", ["second"]) is None
+  assert cache.lookup("stage", ["third"]) is not None
+  assert not any(name.endswith(".tmp") for name in os.listdir(tmp_path))
+
+def test_race_digest_ignores_the_race_name_only(synthetic):
+  renamed      = copy.deepcopy(synthetic)
+  renamed.name = "Another name"
+
+  slower                        = copy.deepcopy(synthetic)
+  slower.teams[0].lap_times     = slower.teams[0].lap_times.copy()
+  slower.teams[0].lap_times[3] += 0.001
+
+  assert stage_cache.race_digest(renamed) == stage_cache.race_digest(synthetic)
+  assert stage_cache.race_digest(slower) != stage_cache.race_digest(synthetic)
+
+def test_hash_tells_types_apart():
+  assert stage_cache.hash_values([1, 2]) != stage_cache.hash_values([1.0, 2.0])
+  assert stage_cache.hash_values("1") != stage_cache.hash_values(1)
+  assert stage_cache.hash_values(np.arange(3)) != stage_cache.hash_values(np.arange(3).astype(np.int32))
@@ -0,0 +1,19 @@
+import tracemalloc
+
+import stage_profiler
+
+def test_timings_dont_trace_memory():
+  profiler = stage_profiler.StageProfiler()
+  with profiler.stage("stage"):
+    assert not tracemalloc.is_tracing()
+
+  assert profiler.report()["stages"][0]["peak_memory"] is None
+
+def test_report_stops_the_memory_tracing():
+  profiler = stage_profiler.StageProfiler(trace_memory = True)
+  with profiler.stage("stage"):
+    data = list(range(10000))
+
+  report = profiler.report()
+  assert report["stages"][0]["peak_memory"] > 0
+  assert not tracemalloc.is_tracing()
@@ -0,0 +1,64 @@
+import itertools
+
+import numpy as np
+import pytest
+
+import stint_planner
+
+PACE_MODELS = {"Fast"   : {"pace" : 0.98, "fatigue" : 0.002},
+               "Steady" : {"pace" : 1.00, "fatigue" : 0.0},
+               "Tiring" : {"pace" : 0.99, "fatigue" : 0.004}}
+
+def rotation_laps(stints, reference, pit_loss, slot_duration):
+  # The expected laps of a rotation with a pit stop between every two stints
+  laps = -(len(stints) - 1) * pit_loss / reference
+  for driver, minutes in stints:
+    stint_slots = np.array([int(round(minutes / slot_duration))])
+    laps       += stint_planner.stint_distances(PACE_MODELS, [driver], reference, slot_duration, stint_slots)[0, 0]
+
+  return laps
+
+def brute_force_laps(drivers, reference, pit_loss, race_duration, slot_duration, stint_lengths):
+  best = -np.inf
+  for number_of_stints in range(len(drivers), int(race_duration // min(stint_lengths)) + 1):
+    for lengths in itertools.product(stint_lengths, repeat = number_of_stints):
+      if sum(lengths) != race_duration:
+        continue
+
+      for order in itertools.product(drivers, repeat = number_of_stints):
+        if set(order) != set(drivers) or any(first == second for first, second in zip(order, order[1:])):
+          continue
+
+        best = max(best, rotation_laps(list(zip(order, lengths)), reference, pit_loss, slot_duration))
+
+  return best
+
+def test_plan_has_the_most_laps_of_every_rotation():
+  drivers = list(PACE_MODELS)
+  plan    = stint_planner.plan_stints(PACE_MODELS, drivers, reference = 40.0, pit_loss = 30.0,
+                                      race_duration = 60, slot_duration = 5, min_stint = 10, max_stint = 25)
+
+  stints = [(stint["driver"], stint["minutes"]) for stint in plan["stints"]]
+
+  assert sum(minutes for _, minutes in stints) == 60
+  assert set(driver for driver, _ in stints) == set(drivers)
+  assert all(first != second for (first, _), (second, _) in zip(stints, stints[1:]))
+  assert plan["laps"] == pytest.approx(rotation_laps(stints, 40.0, 30.0, 5))
+  assert plan["laps"] == pytest.approx(brute_force_laps(drivers, 40.0, 30.0, 60, 5, [10, 15, 20, 25]))
+
+def test_driver_without_races_fails():
+  with pytest.raises(ValueError):
+    stint_planner.plan_stints(PACE_MODELS, ["Fast", "Unknown"], reference = 40.0, pit_loss = 30.0)
+
+def test_fatigue_is_the_slope_over_the_stint():
+  minutes  = np.tile(np.arange(60.0), 2)
+  drivers  = np.repeat(["Tiring", "Steady"], 60)
+  paces    = np.where(drivers == "Tiring", 1.0 + 0.001 * minutes, 1.01)
+  sessions = [{"relative_laps" : paces, "drivers" : drivers, "minutes" : minutes}]
+
+  pace_models = stint_planner.fit_pace_models(sessions)
+
+  assert pace_models["Tiring"]["fatigue"] == pytest.approx(0.001)
+  assert pace_models["Tiring"]["pace"] == pytest.approx(1.0)
+  assert pace_models["Steady"]["fatigue"] == pytest.approx(0.0)
+  assert pace_models["Steady"]["pace"] == pytest.approx(1.01)
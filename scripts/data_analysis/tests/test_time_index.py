@@ -0,0 +1,35 @@
+import numpy as np
+import pytest
+
+import race_analysis
+
+@pytest.fixture(params = ["synthetic", "results_race"])
+def analysis(request):
+  return race_analysis.analyse_race(request.getfixturevalue(request.param))
+
+def test_laps_match_the_interpolated_laps_of_the_plots(analysis):
+  time_index = analysis["time_index"]
+  laps       = time_index.laps_at(analysis["all_cumulative_times"])
+
+  for team_index, team_name in enumerate(time_index.team_names):
+    np.testing.assert_allclose(laps[:, team_index], analysis["interpolated_laps"][team_name], atol = 1e-9)
+
+def test_time_at_laps_inverts_the_laps(analysis):
+  time_index = analysis["time_index"]
+  times      = np.linspace(1.0, analysis["all_cumulative_times"][-1], 50)
+  laps       = time_index.laps_at(times)
+
+  team_indices = np.broadcast_to(np.arange(len(time_index.team_names)), laps.shape)
+  is_driving   = ~time_index.has_stopped[team_indices]
+  np.testing.assert_allclose(time_index.time_at_laps(team_indices, laps)[is_driving],
+                             np.broadcast_to(times[:, np.newaxis], laps.shape)[is_driving])
+
+def test_stopped_teams_stay_put(synthetic):
+  analysis   = race_analysis.analyse_race(synthetic)
+  time_index = analysis["time_index"]
+
+  for team_index, team in enumerate(synthetic.teams):
+    if team.has_stopped:
+      end_time = np.sum(team.lap_times)
+      laps     = time_index.laps_at([end_time, end_time + 100.0])[:, team_index]
+      np.testing.assert_allclose(laps, len(team.lap_times))